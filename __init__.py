@@ -8,8 +8,12 @@ from CTFd.plugins.challenges import CHALLENGE_CLASSES
 from CTFd.plugins.migrations import upgrade as ctfd_migrations
 
 # LLM Verification Plugin module imports.
+from .config_manager import settings_manager
+from .llmv_cli import llmv_cli
+from .llmv_health import load_errors
 from .llmv_logger import initialize_llmvctfd_loggers
 from .llmv_models import LlmSubmissionChallenge, fill_models_table
+from .llmv_replica import remove_read_sessions
 from .llmv_routes import add_routes
 
 log = getLogger(__name__)
@@ -18,6 +22,8 @@ log = getLogger(__name__)
 def load(app):
     """Load plugin config from TOML file and register plugin assets."""
     print("Loading LLM Verification Plugin")
+    # Validate the plugin's settings before anything uses them; invalid settings stop CTFd.
+    settings_manager.load()
     # Get the logger for the LLM Verification plugin.
     log = initialize_llmvctfd_loggers(module_name=__name__)
 
@@ -36,10 +42,20 @@ def load(app):
     register_plugin_assets_directory(app, base_path="/plugins/llm_verification/assets/")
     log.debug("Registered LLMV plugin assets directory with CTFd")
     llmv_verifications = add_routes()
-    fill_models_table()
-    
 
     # Register LLMV blueprints with CTFd.
     app.register_blueprint(llmv_verifications)
     log.debug("Registered LLMV blueprints with CTFd")
+    try:
+        fill_models_table()
+    except Exception as error:
+        # Keep loading; `/llmv/readyz` reports the worker as not ready until the table is
+        # filled with `flask llmv models`.
+        log.error(f"Could not fill the models table from the LLM Router: {error}")
+        load_errors.append(f"fill_models_table: {error}")
+    # Close read replica sessions after every request, like CTFd's own session.
+    app.teardown_appcontext(remove_read_sessions)
+
+    # Register LLMV maintenance commands (`flask llmv ...`).
+    app.cli.add_command(llmv_cli)
     log.info('Loaded LLM Verification Plugin "LLMV"')
@@ -65,22 +65,21 @@ $(document).ready(function() {
       .find(".name")
       .text()
       .trim();
-    var description = elem
-      .find(".desc")
-      .text()
-      .trim();
-    var preprompt = elem
-      .find(".preprompt")
-      .text()
-      .trim();
 
-    ezgrade({
-      title: "Challenge" + " " + chal_name,
-      body: "<strong> <br> Description: <br> </strong> {0} <strong> <br> PrePrompt: <br> </strong> {1} <strong>".format(
-        "<pre>" + htmlentities(description) + "</pre>",
-        "<pre>" + htmlentities(preprompt) + "</pre>"
-      ),
-      id: chal_id,
-    });
+    // Load the (possibly long) description and pre-prompt only when they're shown.
+    CTFd.fetch("/admin/llm_submissions/challenges/" + chal_id, {
+      method: "GET"
+    })
+      .then((response) => response.json())
+      .then(function(challenge) {
+        ezgrade({
+          title: "Challenge" + " " + chal_name,
+          body: "<strong> <br> Description: <br> </strong> {0} <strong> <br> PrePrompt: <br> </strong> {1} <strong>".format(
+            "<pre>" + htmlentities(challenge.data.description) + "</pre>",
+            "<pre>" + htmlentities(challenge.data.preprompt) + "</pre>"
+          ),
+          id: chal_id,
+        });
+      });
   });
 });
@@ -52,10 +52,6 @@ $(document).ready(function() {
       .find(".chal")
       .text()
       .trim();
-    var description = elem
-      .find(".desc")
-      .text()
-      .trim();
     var team = elem.find(".team").attr("id");
     var team_name = elem
       .find(".team")
@@ -72,15 +68,24 @@ $(document).ready(function() {
       .trim();
     var key_id = elem.find(".flag").attr("id");
 
-    ezgrade({
-      title: "Submission",
-      body: " {0}'s submission for {1}: <strong> <br> Description: <br> </strong> {2} <strong> <br> Prompt: <br> </strong> {3} <strong> <br> Text: </strong> <br> {4}".format(
-        "<strong>" + htmlentities(team_name) + "</strong>",
-        "<strong>" + htmlentities(chal_name) + "</strong>",
-        "<pre>" + htmlentities(description) + "</pre>",
-        "<pre>" + htmlentities(prompt_content) + "</pre>",
-        "<pre>" + htmlentities(text_content) + "</pre>"
-      )
+    // The list only has previews; load the conversation and description when viewing.
+    Promise.all([
+      CTFd.fetch("/llm_submissions/conversation/" + key_id, {
+        method: "GET"
+      }).then((response) => response.text()),
+      CTFd.fetch("/admin/llm_submissions/challenges/" + chal, {
+        method: "GET"
+      }).then((response) => response.json())
+    ]).then(function([fragment, challenge]) {
+      ezgrade({
+        title: "Submission",
+        body: " {0}'s submission for {1}: <strong> <br> Description: <br> </strong> {2} <strong> <br> Conversation: <br> </strong> {3}".format(
+          "<strong>" + htmlentities(team_name) + "</strong>",
+          "<strong>" + htmlentities(chal_name) + "</strong>",
+          "<pre>" + htmlentities(challenge.data.description) + "</pre>",
+          fragment
+        )
+      });
     });
   });
 });
@@ -73,10 +73,6 @@ $(document).ready(function() {
       .find(".team")
       .text()
       .trim();
-    var description = elem
-      .find(".desc")
-      .text()
-      .trim();
     var submission = elem.find(".submission").attr("id");
     var prompt_content = elem
       .find(".prompt")
@@ -91,11 +87,24 @@ $(document).ready(function() {
     var td_row = $(this)
       .parent()
       .parent();
+    // Rows that stand for a cluster of near-duplicates grade the whole cluster.
+    var grade_route = td_row.hasClass("cluster")
+      ? "/admin/verify_cluster/"
+      : "/admin/verify_submissions/";
+    var cluster_note = td_row.hasClass("cluster")
+      ? "<br><strong>Grades all " + td_row.data("cluster-size") + " near-duplicate submissions.</strong>"
+      : "";
     
-    CTFd.fetch("/llm_submissions/conversation/" + key_id, {
-      method: "GET"
-    }).then((response) => response.text()).then(function(fragment) {
-      console.log(fragment);
+    // The list only has previews; load the conversation and description when grading.
+    Promise.all([
+      CTFd.fetch("/llm_submissions/conversation/" + key_id, {
+        method: "GET"
+      }).then((response) => response.text()),
+      CTFd.fetch("/admin/llm_submissions/challenges/" + chal, {
+        method: "GET"
+      }).then((response) => response.json())
+    ]).then(function([fragment, challenge]) {
+      var description = challenge.data.description;
       ezgrade({
         title: "Submission",
         body: " {0}'s submission for {1}:<strong> <br> Challenge Description: <br> </strong> {2} <br> Conversation: <br> </strong> {3}".format(
@@ -103,9 +112,9 @@ $(document).ready(function() {
           "<strong>" + htmlentities(chal_name) + "</strong>",
           "<pre>" + htmlentities(description) + "</pre>",
           fragment
-        ),
+        ) + cluster_note,
         success: function() {
-          CTFd.fetch("/admin/verify_submissions/" + key_id + "/solve", {
+          CTFd.fetch(grade_route + key_id + "/solve", {
             method: "POST"
           })
             .then(function(response) {
@@ -118,7 +127,7 @@ $(document).ready(function() {
             });
         },
         error: function() {
-          CTFd.fetch("/admin/verify_submissions/" + key_id + "/fail", {
+          CTFd.fetch(grade_route + key_id + "/fail", {
             method: "POST"
           })
             .then(function(response) {
@@ -48,8 +48,81 @@ function Moment(d) {
   return date;
 }
 
+function uuid4() {
+  if (window.crypto && window.crypto.randomUUID) {
+    return window.crypto.randomUUID();
+  }
+  return "10000000-1000-4000-8000-100000000000".replace(/[018]/g, c =>
+    (c ^ (Math.random() * 16) >> (c / 4)).toString(16)
+  );
+}
+
+// Reuse the idempotency key while the same prompt is being (re)sent so the server
+// coalesces double-clicks and retries into one generation.
+function idempotencyKey(component) {
+  if (!component.idempotency_key || component.idempotency_prompt != component.prompt) {
+    component.idempotency_key = uuid4();
+    component.idempotency_prompt = component.prompt;
+  }
+  return component.idempotency_key;
+}
+
+// Open WebSocket chat sessions, by challenge ID. They're kept out of the Alpine components
+// because Alpine's reactive proxies break native WebSocket methods.
+var chatSockets = {};
+
+// Open (or reuse) the chat session for a multi-turn challenge. Resolves to null when the
+// server doesn't support WebSockets, so the caller can fall back to /generate.
+function openChatSocket(component) {
+  if (!component.websocket || !window.WebSocket) {
+    return Promise.resolve(null);
+  }
+  var socket = chatSockets[component.id];
+  if (socket && socket.readyState == WebSocket.OPEN) {
+    return Promise.resolve(socket);
+  }
+  var scheme = window.location.protocol == "https:" ? "wss://" : "ws://";
+  var url = scheme + window.location.host + CTFd.config.urlRoot + `/chat/` + component.id +
+    `?generation_id=` + component.gen_id + `&format=turns`;
+  return new Promise(resolve => {
+    socket = new WebSocket(url);
+    socket.onopen = () => {
+      chatSockets[component.id] = socket;
+      resolve(socket);
+    };
+    socket.onerror = () => {
+      // Don't try again until the challenge is reopened.
+      component.websocket = false;
+      resolve(null);
+    };
+    socket.onclose = () => {
+      delete chatSockets[component.id];
+    };
+  });
+}
+
+// Send a prompt over a chat session and wait for the stored turn.
+function sendOverSocket(socket, body) {
+  return new Promise((resolve, reject) => {
+    var closed = () => reject(new Error("The chat session was closed"));
+    socket.addEventListener("close", closed);
+    socket.onmessage = event => {
+      var message = JSON.parse(event.data);
+      if (message.type == "generating") {
+        return;
+      }
+      socket.removeEventListener("close", closed);
+      resolve(message);
+    };
+    socket.send(JSON.stringify(body));
+  });
+}
+
 Alpine.data("llm_verification", () => ({
   chat_limit: 0,
+  websocket: false,
+  fan_out: false,
+  fan_out_results: [],
   is_single_turn: true,
 
   prompt: "",
@@ -66,18 +139,31 @@ Alpine.data("llm_verification", () => ({
   show_done: false,
 
   async init() {
-    url = CTFd.config.urlRoot + `/chat_limit/` + this.id;
+    // Ask for conversations as turns, which are rendered here, instead of HTML fragments.
+    url = CTFd.config.urlRoot + `/bootstrap/` + this.id + `?format=turns`;
 
     const response = await CTFd.fetch(url, {
       method: "get",
     });
     const result = await response.json();
     this.chat_limit = result.data.chat_limit;
+    this.websocket = result.data.websocket;
+    this.fan_out = result.data.fan_out;
     if (this.chat_limit > 1) {
       this.is_single_turn = false;
       this.is_multi_turn = true;
+      // Resume the unsubmitted conversation, if there is one.
+      this.gen_id = result.data.generation_id;
+      this.history = result.data.history;
+      if (this.gen_id != -1) {
+        this.submission = this.gen_id.toString();
+      }
+    }
+    this.models_left = result.data.models_left;
+    if (this.models_left.length == 0) {
+      this.show_submit = false;
+      this.show_done = true;
     }
-    await this.getModelsLeft();
   },
 
 
@@ -94,7 +180,7 @@ Alpine.data("llm_verification", () => ({
   },
 
   async getSubmissions() {
-    url = CTFd.config.urlRoot + `/submissions/` + this.id;
+    url = CTFd.config.urlRoot + `/submissions/` + this.id + `?format=turns`;
 
     const response = await CTFd.fetch(url, {
       method: "get",
@@ -141,7 +227,7 @@ Alpine.data("llm_verification", () => ({
   },
 
   async getSubmissions() {
-    url = CTFd.config.urlRoot + `/submissions/` + this.id;
+    url = CTFd.config.urlRoot + `/submissions/` + this.id + `?format=turns`;
 
     const response = await CTFd.fetch(url, {
       method: "get",
@@ -185,6 +271,8 @@ Alpine.data("llm_verification", () => ({
 Alpine.data("single_turn_interface", () => ({
   prompt: "",
   generated_text: "",
+  idempotency_key: null,
+  idempotency_prompt: "",
 
   async init() {},
 
@@ -193,27 +281,79 @@ Alpine.data("single_turn_interface", () => ({
       alert("Please enter a prompt!");
       return;
     }
+    if (this.fan_out) {
+      await this.generateFanOut();
+      return;
+    }
     this.generated_text = "Generating...";
-    url = CTFd.config.urlRoot + `/generate`;
+    url = CTFd.config.urlRoot + `/generate?format=turns`;
 
     const response = await CTFd.fetch(url, {
       method: "POST",
       body: JSON.stringify({
         challenge_id: this.id,
-        prompt: this.prompt
+        prompt: this.prompt,
+        idempotency_key: idempotencyKey(this)
       }),
     });
     const result = await response.json();
+    if (result.success) {
+      this.idempotency_key = null;
+    }
     this.generated_text = result.data.text;
     // This affects the container x-data object - llm_verification
     this.gen_id = result.data.gen_id;
     this.submission = result.data.id.toString();
   },
+
+  // Send the prompt to every remaining model at once, showing each result as it arrives.
+  async generateFanOut() {
+    this.fan_out_results = [];
+    url = CTFd.config.urlRoot + `/generate/fan_out`;
+
+    const response = await CTFd.fetch(url, {
+      method: "POST",
+      body: JSON.stringify({
+        challenge_id: this.id,
+        prompt: this.prompt
+      }),
+    });
+    if (response.headers.get("Content-Type").startsWith("application/json")) {
+      const result = await response.json();
+      this.fan_out_results.push(result);
+      return;
+    }
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    var buffered = "";
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) {
+        break;
+      }
+      buffered += decoder.decode(value, { stream: true });
+      var lines = buffered.split("\n");
+      buffered = lines.pop();
+      for (const line of lines) {
+        if (line) {
+          this.fan_out_results.push(JSON.parse(line));
+        }
+      }
+    }
+  },
+
+  async submitFanOut(result) {
+    // This affects the container x-data object - llm_verification
+    this.submission = result.data.id.toString();
+    await this.submitGenerated();
+    result.submitted = true;
+  },
 }));
 
 Alpine.data("multi_turn_interface", () => ({
-  fragment: "",
   prompt: "",
+  idempotency_key: null,
+  idempotency_prompt: "",
 
   async init() {},
 
@@ -223,21 +363,44 @@ Alpine.data("multi_turn_interface", () => ({
       return;
     }
     this.generated_text = "Generating...";
-    url = CTFd.config.urlRoot + `/generate`;
+    url = CTFd.config.urlRoot + `/generate?format=turns`;
     var body = {
       challenge_id: this.id,
-      prompt: this.prompt
+      prompt: this.prompt,
+      idempotency_key: idempotencyKey(this)
     };
     if (this.gen_id != -1) {
       body["generation_id"] = this.gen_id;
     };
-    const response = await CTFd.fetch(url, {
-      method: "POST",
-      body: JSON.stringify(body),
-    });
-    const result = await response.json();
+    var result = null;
+    const socket = await openChatSocket(this);
+    if (socket) {
+      try {
+        result = await sendOverSocket(socket, body);
+      } catch (error) {
+        // Retry over HTTP with the same idempotency key.
+        console.log(error);
+      }
+    }
+    if (result == null) {
+      const response = await CTFd.fetch(url, {
+        method: "POST",
+        body: JSON.stringify(body),
+      });
+      result = await response.json();
+    }
     console.log(result);
-    this.fragment = result.data.fragment;
+    if (result.success) {
+      this.idempotency_key = null;
+    }
+    if (result.success) {
+      // A new conversation (after a submission) starts with an empty history.
+      if (result.data.id != this.gen_id) {
+        this.history = [];
+      }
+      // Only the new turn is sent; append it to the history that's already shown.
+      this.history.push(result.data.turn);
+    }
     this.gen_id = result.data.id;
 
     // This affects the container x-data object - llm_verification
@@ -1,35 +1,262 @@
-"""Handle configuration for the LLM Verification Plugin."""
+"""Handle configuration for the LLM Verification Plugin.
+
+Settings are read from `llmv_config.json` (or the file named by the `LLMV_CONFIG` environment
+variable), and any setting can be overridden with an `LLMV_<SETTING NAME>` environment variable,
+e.g. `LLMV_ROUTER_URL`. They're validated when the plugin loads, and the file is reloaded when
+it changes so performance settings can be tuned without restarting workers.
+"""
+# Standard library imports.
+from dataclasses import dataclass, fields
 from json import loads as json_loads
-from logging import getLogger
+from logging import getLevelName, getLogger
+import os
 from pathlib import Path
+import threading
+import time
+from typing import Optional
 
+# LLM Verification Plugin module imports.
+from .llmv_scheduler import ASSIGNMENT_STRATEGIES, DEFAULT_STRATEGY
+from .llmv_scorers import DEFAULT_SCORERS, SCORERS, scorer_names
 
 log = getLogger(__name__)
 
+# Assume that the LLM Verification ("LLMV") Plugin config file is in the same directory as this file.
+DEFAULT_CONFIG_FILE = Path(__file__).parent / "llmv_config.json"
+# How often (in seconds) the config file's modification time is checked.
+RELOAD_CHECK_INTERVAL = 5.0
+# What happens when a request goes over its route's query budget (see `llmv_query_budget`).
+QUERY_BUDGET_MODES = ("off", "warn", "raise")
+
+
+@dataclass(frozen=True)
+class LlmvSettings:
+    """Validated settings for the LLM Verification Plugin."""
+
+    # LLM Router.
+    router_url: Optional[str] = None
+    router_token: Optional[str] = None
+    router_connect_timeout: float = 5.0
+    router_timeout: float = 120.0
+    router_pool_size: int = 10
+    assignment_strategy: str = DEFAULT_STRATEGY
+    # How often (in seconds) the readiness check probes the router, and its read timeout.
+    health_probe_interval: float = 10.0
+    health_probe_timeout: float = 2.0
+    # Read replica for admin pages, and how long after grading they read from the primary.
+    replica_url: Optional[str] = None
+    replica_lag_window: float = 30.0
+    # Caches.
+    challenge_cache_size: int = 1024
+    usage_cache_timeout: int = 300
+    # Storage.
+    compress_text: bool = False
+    compress_threshold: int = 1024
+    # Buffer in-progress turns in Redis, flushing them within this many seconds.
+    write_behind: bool = False
+    write_behind_flush_interval: int = 30
+    write_behind_batch_size: int = 100
+    # Score submissions in the background to sort the grading queue (see `llmv_scorers`).
+    pre_scoring: bool = False
+    scorers: str = DEFAULT_SCORERS
+    scoring_classifier: Optional[str] = None
+    scoring_workers: int = 2
+    # Compress JSON responses of at least this many bytes; 0 turns compression off.
+    response_compression_threshold: int = 1024
+    # Limits; 0 means unlimited.
+    team_token_budget: int = 0
+    generate_rate_limit: int = 0
+    generate_rate_interval: int = 60
+    # Logging.
+    log_level: str = "DEBUG"
+    query_budget_mode: str = "off"
+
+    def validate(self):
+        """Check that every setting is usable.
+
+        Raises:
+            ValueError: Listing every invalid setting.
+        """
+        errors = []
+        for name in (
+            "router_connect_timeout",
+            "router_timeout",
+            "health_probe_interval",
+            "health_probe_timeout",
+        ):
+            if getattr(self, name) <= 0:
+                errors.append(f"{name} must be greater than 0")
+        for name in (
+            "router_pool_size",
+            "challenge_cache_size",
+            "write_behind_flush_interval",
+            "write_behind_batch_size",
+            "scoring_workers",
+            "generate_rate_interval",
+        ):
+            if getattr(self, name) < 1:
+                errors.append(f"{name} must be at least 1")
+        for name in (
+            "replica_lag_window",
+            "usage_cache_timeout",
+            "compress_threshold",
+            "response_compression_threshold",
+            "team_token_budget",
+            "generate_rate_limit",
+        ):
+            if getattr(self, name) < 0:
+                errors.append(f"{name} must not be negative")
+        if self.router_url is not None and not self.router_url.startswith(
+            ("http://", "https://")
+        ):
+            errors.append(f'router_url "{self.router_url}" is not an http(s) URL')
+        if self.replica_url is not None and "://" not in self.replica_url:
+            errors.append(f'replica_url "{self.replica_url}" is not a database URL')
+        if self.assignment_strategy not in ASSIGNMENT_STRATEGIES:
+            errors.append(
+                f'assignment_strategy "{self.assignment_strategy}" is not one of '
+                f"{sorted(ASSIGNMENT_STRATEGIES)}"
+            )
+        unknown_scorers = set(scorer_names(self.scorers)) - set(SCORERS)
+        if unknown_scorers:
+            errors.append(
+                f"scorers {sorted(unknown_scorers)} are not among {sorted(SCORERS)}"
+            )
+        if self.scoring_classifier is not None and ":" not in self.scoring_classifier:
+            errors.append(
+                f'scoring_classifier "{self.scoring_classifier}" is not a module:function path'
+            )
+        if self.query_budget_mode not in QUERY_BUDGET_MODES:
+            errors.append(
+                f'query_budget_mode "{self.query_budget_mode}" is not one of '
+                f"{list(QUERY_BUDGET_MODES)}"
+            )
+        if not isinstance(getLevelName(self.log_level), int):
+            errors.append(f'log_level "{self.log_level}" is not a logging level')
+        if errors:
+            raise ValueError(f"Invalid LLMV settings: {'; '.join(errors)}")
+
 
-def load_llmv_config(filename="llmv_config.json") -> dict:
-    """Load configuration from LLMV's config file.
+def _coerce(field, value):
+    """Convert a config file or environment value to a setting's type."""
+    if value is None:
+        return None
+    if field.type in (bool, "bool"):
+        if isinstance(value, str):
+            return value.strip().lower() in ("1", "true", "yes", "on")
+        return bool(value)
+    if field.type in (int, "int"):
+        return int(value)
+    if field.type in (float, "float"):
+        return float(value)
+    if field.name == "log_level":
+        return str(value).upper()
+    return str(value)
+
+
+def load_settings(config_file=None, environ=None) -> LlmvSettings:
+    """Load and validate LLMV's settings.
 
     Arguments:
-        filename (str, optional): Name of the LLMV config file in `CTFd/plugins/llm_verification/`.
-            Defaults to 'llmv_config.json'.
+        config_file (Path, optional): JSON config file. Defaults to `$LLMV_CONFIG`, or
+            `llmv_config.json` in `CTFd/plugins/llm_verification/`. A missing file is allowed.
+        environ (dict, optional): Environment variable overrides. Defaults to `os.environ`.
+
+    Raises:
+        ValueError: If a setting is unknown, has the wrong type or is out of range.
 
     Returns:
-        dict: Configuration for the LLMV Plugin.
+        LlmvSettings: Configuration for the LLMV Plugin.
     """
-    # Assume that this file (`__init__.py`) is in the `llm_verification` directory.
-    module_dir = Path(__file__).parent
-    # Assume that the LLM Verification ("LLMV") Plugin config file is in the same directory as this file.
-    config_file = module_dir / filename
-    try:
-        # Load LLMV's settings from its configuration file.
-        llmv_config = json_loads(config_file.read_text())
+    environ = os.environ if environ is None else environ
+    config_file = Path(config_file or environ.get("LLMV_CONFIG") or DEFAULT_CONFIG_FILE)
+    values = {}
+    if config_file.exists():
+        values = json_loads(config_file.read_text())
         log.info(f'LLMV config loaded from "{config_file}"')
-    except FileNotFoundError as file_not_found_error:
-        log.warning(
-            f'LLM Verification Plugin config file not found at "{config_file}" '
-            f'Use the config file template at "{config_file.with_suffix(".template.json")}"'
+    else:
+        log.info(f'No LLMV config file at "{config_file}", using defaults and environment')
+
+    settings_fields = {field.name: field for field in fields(LlmvSettings)}
+    unknown = set(values) - set(settings_fields)
+    if unknown:
+        raise ValueError(f"Unknown LLMV settings in {config_file}: {sorted(unknown)}")
+    for name in settings_fields:
+        env_value = environ.get(f"LLMV_{name.upper()}")
+        if env_value is not None:
+            values[name] = env_value
+    try:
+        settings = LlmvSettings(
+            **{name: _coerce(settings_fields[name], value) for name, value in values.items()}
         )
-        # Re-raise the missing config error so that the user knows that the config file is missing.
-        raise file_not_found_error
-    return llmv_config
+    except (TypeError, ValueError) as error:
+        raise ValueError(f"Invalid LLMV settings: {error}") from error
+    settings.validate()
+    return settings
+
+
+class SettingsManager:
+    """Holds the current settings and reloads them when the config file changes."""
+
+    def __init__(self, config_file=None):
+        self._config_file = config_file
+        self._lock = threading.Lock()
+        self._settings = None
+        self._mtime = None
+        self._checked = 0.0
+        self._listeners = []
+
+    def _path(self):
+        return Path(self._config_file or os.environ.get("LLMV_CONFIG") or DEFAULT_CONFIG_FILE)
+
+    def _file_mtime(self):
+        try:
+            return self._path().stat().st_mtime
+        except FileNotFoundError:
+            return None
+
+    def load(self):
+        """(Re)load the settings, raising if they're invalid."""
+        with self._lock:
+            self._mtime = self._file_mtime()
+            self._checked = time.monotonic()
+            self._settings = load_settings(self._config_file)
+            settings = self._settings
+        for listener in self._listeners:
+            listener(settings)
+        return settings
+
+    def get(self):
+        """Get the current settings, reloading them if the config file has changed.
+
+        An invalid config file is logged and the previous settings are kept, so a typo mid-event
+        doesn't take the plugin down.
+        """
+        if self._settings is None:
+            return self.load()
+        now = time.monotonic()
+        if now - self._checked < RELOAD_CHECK_INTERVAL:
+            return self._settings
+        self._checked = now
+        if self._file_mtime() == self._mtime:
+            return self._settings
+        try:
+            settings = self.load()
+        except ValueError as error:
+            log.error(f"Keeping the previous LLMV settings: {error}")
+            self._mtime = self._file_mtime()
+            return self._settings
+        log.info(f'Reloaded LLMV settings from "{self._path()}"')
+        return settings
+
+    def add_listener(self, listener):
+        """Call `listener(settings)` whenever the settings are (re)loaded."""
+        self._listeners.append(listener)
+
+
+settings_manager = SettingsManager()
+
+
+def get_settings() -> LlmvSettings:
+    """Get LLMV's current settings."""
+    return settings_manager.get()
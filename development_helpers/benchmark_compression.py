@@ -0,0 +1,98 @@
+"""Benchmark storage savings and read overhead of `CompressedText` columns.
+
+Usage (from the plugin directory):
+
+    $ python development_helpers/benchmark_compression.py --conversations 2000 --turns 5
+
+Conversations are built from the mock router's responses in `mock.json` plus pasted-prompt
+sized text. Reads are timed per conversation (what `get_conversation` decodes) and over the
+whole set (what an export decodes).
+"""
+# Standard library imports.
+import argparse
+import importlib
+from json import loads as json_loads
+from pathlib import Path
+import random
+import sys
+import time
+import types
+
+# Make the plugin's modules importable as a package without running its CTFd `__init__`.
+plugin_dir = Path(__file__).resolve().parent.parent
+plugin_package = types.ModuleType("llmv")
+plugin_package.__path__ = [str(plugin_dir)]
+sys.modules["llmv"] = plugin_package
+
+LlmvSettings = importlib.import_module("llmv.config_manager").LlmvSettings
+llmv_compression = importlib.import_module("llmv.llmv_compression")
+compress_text = llmv_compression.compress_text
+decompress_text = llmv_compression.decompress_text
+
+
+def build_conversations(count, turns, seed=0):
+    """Build `count` conversations of `turns` (prompt, generation) pairs."""
+    rng = random.Random(seed)
+    mock_models = json_loads((plugin_dir / "mock.json").read_text()).values()
+    responses = [text for model in mock_models for text in (model["short"], model["long"])]
+    words = " ".join(responses).split()
+    conversations = []
+    for _ in range(count):
+        conversation = []
+        for _ in range(turns):
+            prompt = " ".join(rng.choices(words, k=rng.choice((12, 60, 400))))
+            generation = rng.choice(responses) * rng.choice((1, 2, 6))
+            conversation.append((prompt, generation))
+        conversations.append(conversation)
+    return conversations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--conversations", type=int, default=2000)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--threshold", type=int, default=LlmvSettings.compress_threshold)
+    arguments = parser.parse_args()
+
+    conversations = build_conversations(arguments.conversations, arguments.turns)
+    stored = [
+        [
+            (compress_text(prompt, arguments.threshold), compress_text(generation, arguments.threshold))
+            for prompt, generation in conversation
+        ]
+        for conversation in conversations
+    ]
+
+    raw_bytes = sum(
+        len(text.encode()) for conversation in conversations for pair in conversation for text in pair
+    )
+    stored_bytes = sum(
+        len(text.encode()) for conversation in stored for pair in conversation for text in pair
+    )
+
+    def read_all(rows, decode):
+        start = time.perf_counter()
+        for conversation in rows:
+            for prompt, generation in conversation:
+                decode(prompt)
+                decode(generation)
+        return time.perf_counter() - start
+
+    plain_seconds = read_all(conversations, lambda value: value)
+    compressed_seconds = read_all(stored, decompress_text)
+    count = len(conversations)
+
+    print(f"Conversations:        {count} x {arguments.turns} turns")
+    print(f"Threshold:            {arguments.threshold} bytes")
+    print(f"Plain storage:        {raw_bytes / 2**20:.2f} MiB")
+    print(f"Compressed storage:   {stored_bytes / 2**20:.2f} MiB ({stored_bytes / raw_bytes:.1%})")
+    print(
+        "get_conversation read: "
+        f"{compressed_seconds / count * 1e6:.1f} us/conversation "
+        f"(+{(compressed_seconds - plain_seconds) / count * 1e6:.1f} us over plain text)"
+    )
+    print(f"Export read:          {compressed_seconds:.3f} s for all conversations")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+"""Incrementally maintained analytics rollups for organizers.
+
+The gameplay and grading paths update the rollup tables in the same transaction as the change
+they record, so the dashboard only ever reads the (small) rollup tables.
+"""
+# Standard library imports.
+from collections import defaultdict
+import datetime
+from logging import getLogger
+
+# Third-party imports.
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+# CTFd imports.
+from CTFd.models import db
+
+# LLM Verification Plugin module imports.
+from .llmv_models import (
+    LLMVChatPair,
+    LLMVGeneration,
+    LLMVHourlyRollup,
+    LLMVModelRollup,
+    LLMVUsageRollup,
+    LlmChallenge,
+    LlmModels,
+    SUBMITTED_STATUSES,
+)
+
+log = getLogger(__name__)
+
+
+# Submitted statuses that mean a grader has looked at the generation.
+GRADED_STATUSES = tuple(status for status in SUBMITTED_STATUSES if status != "pending")
+
+
+def _hour(date):
+    return date.replace(minute=0, second=0, microsecond=0)
+
+
+def _increment(rollup_model, keys, **deltas):
+    """Add `deltas` to a rollup row's counters, creating the row if it doesn't exist yet."""
+    deltas = {column: delta for column, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    values = {
+        getattr(rollup_model, column): getattr(rollup_model, column) + delta
+        for column, delta in deltas.items()
+    }
+    if rollup_model.query.filter_by(**keys).update(values, synchronize_session=False):
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(rollup_model(**keys, **deltas))
+    except IntegrityError:
+        # Another request created the row first.
+        rollup_model.query.filter_by(**keys).update(values, synchronize_session=False)
+
+
+def record_generation_started(challenge_id, model_id):
+    """Count a new conversation."""
+    _increment(
+        LLMVModelRollup,
+        {"challenge_id": challenge_id, "model_id": model_id},
+        generations=1,
+    )
+
+
+def record_generation_removed(challenge_id, model_id, count=1):
+    """Stop counting conversations that were deleted before they had any turns."""
+    _increment(
+        LLMVModelRollup,
+        {"challenge_id": challenge_id, "model_id": model_id},
+        generations=-count,
+    )
+
+
+def record_generations_purged(rows):
+    """Stop counting purged generations, the way `rebuild_rollups` would have counted them.
+
+    Arguments:
+        rows (list[tuple]): `(challenge_id, model_id, status, submitted_date, graded_date,
+            turns)` of each purged generation.
+    """
+    model_deltas = defaultdict(lambda: defaultdict(int))
+    hourly_deltas = defaultdict(lambda: defaultdict(int))
+    for challenge_id, model_id, status, submitted_date, graded_date, turns in rows:
+        deltas = model_deltas[(challenge_id, model_id)]
+        deltas["generations"] -= 1
+        if status not in SUBMITTED_STATUSES:
+            continue
+        deltas["submissions"] -= 1
+        deltas[status] -= 1
+        if status == "correct":
+            deltas["correct_turns"] -= turns
+        if status in GRADED_STATUSES and graded_date is not None:
+            deltas = hourly_deltas[(_hour(graded_date), challenge_id)]
+            deltas["graded"] -= 1
+            deltas["correct"] -= int(status == "correct")
+        if submitted_date is None:
+            continue
+        deltas = hourly_deltas[(_hour(submitted_date), challenge_id)]
+        deltas["submissions"] -= 1
+        if status == "pending":
+            deltas["pending"] -= 1
+    for (challenge_id, model_id), deltas in model_deltas.items():
+        _increment(
+            LLMVModelRollup, {"challenge_id": challenge_id, "model_id": model_id}, **deltas
+        )
+    for (hour, challenge_id), deltas in hourly_deltas.items():
+        _increment(LLMVHourlyRollup, {"hour": hour, "challenge_id": challenge_id}, **deltas)
+
+
+def record_status_change(generation, old_status, new_status):
+    """Update the rollups for a generation that was submitted or graded.
+
+    Call it before committing the status change, with `generation.submitted_date` set. It sets
+    `generation.graded_date` the first time the generation is graded; regrades are counted in
+    the hour of that first grading.
+
+    Arguments:
+        generation (LLMVGeneration): The generation whose status changed.
+        old_status (str): Status before the change.
+        new_status (str): Status after the change.
+    """
+    if old_status == new_status:
+        return
+    now = datetime.datetime.utcnow()
+    deltas = {}
+    if old_status in SUBMITTED_STATUSES:
+        deltas[old_status] = -1
+    if new_status in SUBMITTED_STATUSES:
+        deltas[new_status] = deltas.get(new_status, 0) + 1
+    if old_status not in SUBMITTED_STATUSES and new_status in SUBMITTED_STATUSES:
+        deltas["submissions"] = 1
+    if "correct" in (old_status, new_status):
+        turns = LLMVChatPair.query.filter_by(generation_id=generation.id).count()
+        deltas["correct_turns"] = turns if new_status == "correct" else -turns
+    _increment(
+        LLMVModelRollup,
+        {"challenge_id": generation.challenge_id, "model_id": generation.model_id},
+        **deltas,
+    )
+
+    submitted_hour = _hour(generation.submitted_date or now)
+    if new_status == "pending":
+        _increment(
+            LLMVHourlyRollup,
+            {"hour": submitted_hour, "challenge_id": generation.challenge_id},
+            submissions=1,
+            pending=1,
+        )
+    elif old_status == "pending":
+        _increment(
+            LLMVHourlyRollup,
+            {"hour": submitted_hour, "challenge_id": generation.challenge_id},
+            pending=-1,
+        )
+    if old_status in GRADED_STATUSES or new_status in GRADED_STATUSES:
+        if old_status not in GRADED_STATUSES or generation.graded_date is None:
+            generation.graded_date = now
+        _increment(
+            LLMVHourlyRollup,
+            {"hour": _hour(generation.graded_date), "challenge_id": generation.challenge_id},
+            graded=int(new_status in GRADED_STATUSES) - int(old_status in GRADED_STATUSES),
+            correct=int(new_status == "correct") - int(old_status == "correct"),
+        )
+
+
+def record_usage(generation, completion, window=None):
+    """Add a router call's token usage to its account's and challenge's totals.
+
+    Arguments:
+        generation (LLMVGeneration): The generation the router call was for.
+        completion (Completion): The router's response.
+        window (ContextWindow, optional): The history that was sent with the prompt.
+    """
+    record_usage_totals(
+        generation.account_id,
+        generation.challenge_id,
+        requests=1,
+        prompt_tokens=completion.prompt_tokens,
+        generation_tokens=completion.generation_tokens,
+        history_bytes=window.full_bytes if window else 0,
+        history_bytes_sent=window.sent_bytes if window else 0,
+    )
+
+
+def record_usage_totals(account_id, challenge_id, **totals):
+    """Add the summed usage of several router calls (e.g. flushed turns) in one update.
+
+    Arguments:
+        account_id (int): The account that made the calls.
+        challenge_id (int): The challenge the calls were for.
+        **totals: Amounts to add to `LLMVUsageRollup` counters (requests, tokens, history bytes).
+    """
+    _increment(
+        LLMVUsageRollup,
+        {"account_id": account_id, "challenge_id": challenge_id},
+        **totals,
+    )
+
+
+def rebuild_rollups():
+    """Recompute every rollup row from the raw generation and chat pair tables.
+
+    This is the (heavy) backfill for events that started before the rollups existed; run it
+    off-peak with `flask llmv rollups`.
+
+    History sizes can't be recomputed (the context policy may have changed since), so they are
+    carried over from the existing usage rows.
+    """
+    history_sizes = {
+        (account_id, challenge_id): (history_bytes, history_bytes_sent)
+        for account_id, challenge_id, history_bytes, history_bytes_sent in db.session.query(
+            LLMVUsageRollup.account_id,
+            LLMVUsageRollup.challenge_id,
+            LLMVUsageRollup.history_bytes,
+            LLMVUsageRollup.history_bytes_sent,
+        )
+    }
+    LLMVModelRollup.query.delete(synchronize_session=False)
+    LLMVHourlyRollup.query.delete(synchronize_session=False)
+    LLMVUsageRollup.query.delete(synchronize_session=False)
+    turns = (
+        db.session.query(
+            LLMVChatPair.generation_id, func.count(LLMVChatPair.id).label("turns")
+        )
+        .group_by(LLMVChatPair.generation_id)
+        .subquery()
+    )
+    rows = (
+        db.session.query(
+            LLMVGeneration.challenge_id,
+            LLMVGeneration.model_id,
+            LLMVGeneration.status,
+            LLMVGeneration.submitted_date,
+            LLMVGeneration.graded_date,
+            func.coalesce(turns.c.turns, 0),
+        )
+        .outerjoin(turns, turns.c.generation_id == LLMVGeneration.id)
+        .yield_per(1000)
+    )
+    model_rollups = {}
+    hourly_rollups = {}
+    for challenge_id, model_id, status, submitted_date, graded_date, turn_count in rows:
+        model_rollup = model_rollups.setdefault(
+            (challenge_id, model_id),
+            LLMVModelRollup(challenge_id=challenge_id, model_id=model_id),
+        )
+        model_rollup.generations += 1
+        if status not in SUBMITTED_STATUSES:
+            continue
+        model_rollup.submissions += 1
+        setattr(model_rollup, status, getattr(model_rollup, status) + 1)
+        if status == "correct":
+            model_rollup.correct_turns += turn_count
+        if status in GRADED_STATUSES and graded_date is not None:
+            hour = _hour(graded_date)
+            hourly_rollup = hourly_rollups.setdefault(
+                (hour, challenge_id),
+                LLMVHourlyRollup(hour=hour, challenge_id=challenge_id),
+            )
+            hourly_rollup.graded += 1
+            hourly_rollup.correct += int(status == "correct")
+        if submitted_date is None:
+            continue
+        hour = _hour(submitted_date)
+        hourly_rollup = hourly_rollups.setdefault(
+            (hour, challenge_id),
+            LLMVHourlyRollup(hour=hour, challenge_id=challenge_id),
+        )
+        hourly_rollup.submissions += 1
+        if status == "pending":
+            hourly_rollup.pending += 1
+    usage_rollups = [
+        LLMVUsageRollup(
+            account_id=account_id,
+            challenge_id=challenge_id,
+            requests=requests,
+            prompt_tokens=prompt_tokens or 0,
+            generation_tokens=generation_tokens or 0,
+            history_bytes=history_sizes.get((account_id, challenge_id), (0, 0))[0],
+            history_bytes_sent=history_sizes.get((account_id, challenge_id), (0, 0))[1],
+        )
+        for account_id, challenge_id, requests, prompt_tokens, generation_tokens in (
+            db.session.query(
+                LLMVGeneration.account_id,
+                LLMVGeneration.challenge_id,
+                func.count(LLMVChatPair.id),
+                func.sum(LLMVChatPair.prompt_tokens),
+                func.sum(LLMVChatPair.generation_tokens),
+            )
+            .join(LLMVChatPair, LLMVChatPair.generation_id == LLMVGeneration.id)
+            .group_by(LLMVGeneration.account_id, LLMVGeneration.challenge_id)
+        )
+    ]
+    db.session.add_all(model_rollups.values())
+    db.session.add_all(hourly_rollups.values())
+    db.session.add_all(usage_rollups)
+    db.session.commit()
+    log.info(
+        f"Rebuilt {len(model_rollups)} model rollups and {len(hourly_rollups)} hourly rollups"
+    )
+
+
+def analytics_summary(hours=24):
+    """Get the dashboard's statistics from the rollup tables.
+
+    Arguments:
+        hours (int, optional): How many hours of submission history to include. Defaults to 24.
+
+    Returns:
+        dict: Per challenge and model success rates, token usage and history bytes saved by
+            context policies for the top accounts and challenges, hourly submissions and grader backlog.
+    """
+    models = []
+    backlog = 0
+    for rollup, challenge_name, model_name in (
+        db.session.query(
+            LLMVModelRollup,
+            LlmChallenge.name,
+            LlmModels.anon_name,
+        )
+        .join(LlmChallenge, LlmChallenge.id == LLMVModelRollup.challenge_id)
+        .join(LlmModels, LlmModels.id == LLMVModelRollup.model_id)
+        .order_by(LLMVModelRollup.challenge_id, LLMVModelRollup.model_id)
+    ):
+        graded = rollup.correct + rollup.incorrect
+        backlog += rollup.pending
+        models.append(
+            {
+                "challenge_id": rollup.challenge_id,
+                "challenge": challenge_name,
+                "model_id": rollup.model_id,
+                "model": model_name,
+                "generations": rollup.generations,
+                "submissions": rollup.submissions,
+                "pending": rollup.pending,
+                "correct": rollup.correct,
+                "incorrect": rollup.incorrect,
+                "success_rate": rollup.correct / graded if graded else None,
+                "average_turns_to_success": (
+                    rollup.correct_turns / rollup.correct if rollup.correct else None
+                ),
+            }
+        )
+
+    now = datetime.datetime.utcnow()
+    since = _hour(now) - datetime.timedelta(hours=hours - 1)
+    hourly = [
+        {
+            "hour": hour.isoformat(),
+            "submissions": int(submissions),
+            "graded": int(graded),
+            "correct": int(correct),
+        }
+        for hour, submissions, graded, correct in db.session.query(
+            LLMVHourlyRollup.hour,
+            func.sum(LLMVHourlyRollup.submissions),
+            func.sum(LLMVHourlyRollup.graded),
+            func.sum(LLMVHourlyRollup.correct),
+        )
+        .filter(LLMVHourlyRollup.hour >= since)
+        .group_by(LLMVHourlyRollup.hour)
+        .order_by(LLMVHourlyRollup.hour)
+    ]
+
+    oldest_pending_hour = (
+        db.session.query(func.min(LLMVHourlyRollup.hour))
+        .filter(LLMVHourlyRollup.pending > 0)
+        .scalar()
+    )
+    usage_totals = (
+        func.sum(LLMVUsageRollup.requests),
+        func.sum(LLMVUsageRollup.prompt_tokens),
+        func.sum(LLMVUsageRollup.generation_tokens),
+        func.sum(LLMVUsageRollup.history_bytes),
+        func.sum(LLMVUsageRollup.history_bytes_sent),
+    )
+    usage = {
+        grouping: [
+            {
+                "id": group_id,
+                "requests": int(requests),
+                "prompt_tokens": int(prompt_tokens),
+                "generation_tokens": int(generation_tokens),
+                "history_bytes": int(history_bytes),
+                "history_bytes_saved": int(history_bytes - history_bytes_sent),
+            }
+            for (
+                group_id,
+                requests,
+                prompt_tokens,
+                generation_tokens,
+                history_bytes,
+                history_bytes_sent,
+            ) in db.session.query(
+                column, *usage_totals
+            )
+            .group_by(column)
+            .order_by((usage_totals[1] + usage_totals[2]).desc())
+            .limit(50)
+        ]
+        for grouping, column in (
+            ("accounts", LLMVUsageRollup.account_id),
+            ("challenges", LLMVUsageRollup.challenge_id),
+        )
+    }
+    return {
+        "models": models,
+        "usage": usage,
+        "hourly": hourly,
+        "backlog": {
+            "pending": backlog,
+            "oldest_hour": oldest_pending_hour.isoformat() if oldest_pending_hour else None,
+            "age_seconds": (
+                (now - oldest_pending_hour).total_seconds() if oldest_pending_hour else 0
+            ),
+        },
+    }
@@ -0,0 +1,153 @@
+"""Move the conversations of old, graded generations out of the live chat pair table."""
+# Standard library imports.
+import datetime
+from json import dumps as json_dumps, loads as json_loads
+from logging import getLogger
+import time
+import zlib
+
+# Third-party imports.
+from sqlalchemy import func
+
+# CTFd imports.
+from CTFd.models import db
+
+# LLM Verification Plugin module imports.
+from .llmv_models import LLMVChatArchive, LLMVChatPair, LLMVGeneration
+from .llmv_write_behind import buffered_pairs
+
+log = getLogger(__name__)
+
+# Generation statuses that won't change again, so their conversations can be archived.
+GRADED_STATUSES = ("correct", "awarded", "incorrect")
+
+
+def pack_conversation(pairs):
+    """Compress a generation's chat pairs into one archive blob."""
+    return zlib.compress(
+        json_dumps(
+            [
+                {
+                    "id": pair.id,
+                    "uuid": pair.uuid,
+                    "prompt": pair.prompt,
+                    "generation": pair.generation,
+                    "date": pair.date.isoformat() if pair.date else None,
+                }
+                for pair in pairs
+            ]
+        ).encode(),
+        level=9,
+    )
+
+
+def unpack_conversation(generation_id, blob):
+    """Rebuild (detached) chat pairs from an archive blob."""
+    return [
+        LLMVChatPair(
+            id=pair["id"],
+            uuid=pair["uuid"],
+            generation_id=generation_id,
+            prompt=pair["prompt"],
+            generation=pair["generation"],
+            date=datetime.datetime.fromisoformat(pair["date"]) if pair["date"] else None,
+        )
+        for pair in json_loads(zlib.decompress(blob))
+    ]
+
+
+def load_conversation(generation_id):
+    """Get a generation's chat pairs in order, whether they're live, buffered or archived.
+
+    Arguments:
+        generation_id (int, required): ID of the generation.
+
+    Returns:
+        list[LLMVChatPair]: The conversation's chat pairs, oldest first.
+    """
+    conversation = (
+        LLMVChatPair.query.filter_by(generation_id=generation_id)
+        .order_by(LLMVChatPair.date)
+        .all()
+    )
+    # Add turns that are still buffered in Redis, unless a flush stored them meanwhile.
+    stored = {pair.uuid for pair in conversation}
+    conversation += [
+        pair for pair in buffered_pairs(generation_id) if pair.uuid not in stored
+    ]
+    if conversation:
+        return conversation
+    archive = LLMVChatArchive.query.filter_by(generation_id=generation_id).first()
+    if archive is None:
+        return []
+    return unpack_conversation(generation_id, archive.pairs)
+
+
+def archive_graded_conversations(older_than_days, batch_size=200, pause=0.5, max_batches=None):
+    """Archive the chat pairs of graded generations in small, separately committed batches.
+
+    Each batch archives whole conversations and deletes their live chat pairs in one short
+    transaction, so the job can be stopped at any time and resumed by running it again.
+
+    Arguments:
+        older_than_days (int, required): Only archive generations graded this many days ago.
+        batch_size (int, optional): Number of generations to archive per batch. Defaults to 200.
+        pause (float, optional): Seconds to sleep between batches so live traffic isn't
+            starved. Defaults to 0.5.
+        max_batches (int, optional): Stop after this many batches. Defaults to no limit.
+
+    Returns:
+        int: Number of generations archived.
+    """
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=older_than_days)
+    archived = 0
+    batches = 0
+    last_id = 0
+    while max_batches is None or batches < max_batches:
+        generation_ids = [
+            generation_id
+            for (generation_id,) in db.session.query(LLMVGeneration.id)
+            .filter(
+                LLMVGeneration.id > last_id,
+                LLMVGeneration.status.in_(GRADED_STATUSES),
+                # Generations graded before grading dates were stored fall back to when they
+                # were submitted.
+                func.coalesce(LLMVGeneration.graded_date, LLMVGeneration.submitted_date)
+                < cutoff,
+                LLMVGeneration.pairs.any(),
+            )
+            .order_by(LLMVGeneration.id)
+            .limit(batch_size)
+        ]
+        if not generation_ids:
+            break
+        pairs = (
+            LLMVChatPair.query.filter(LLMVChatPair.generation_id.in_(generation_ids))
+            .order_by(LLMVChatPair.generation_id, LLMVChatPair.date)
+            .all()
+        )
+        conversations = {generation_id: [] for generation_id in generation_ids}
+        for pair in pairs:
+            conversations[pair.generation_id].append(pair)
+        for generation_id, conversation in conversations.items():
+            db.session.add(
+                LLMVChatArchive(
+                    generation_id=generation_id,
+                    pair_count=len(conversation),
+                    pairs=pack_conversation(conversation),
+                )
+            )
+        LLMVChatPair.query.filter(
+            LLMVChatPair.id.in_([pair.id for pair in pairs])
+        ).delete(synchronize_session=False)
+        db.session.commit()
+
+        archived += len(generation_ids)
+        batches += 1
+        last_id = generation_ids[-1]
+        log.info(
+            f"Archived {len(pairs)} chat pairs from {len(generation_ids)} generations "
+            f"(up to generation {last_id}, {archived} total)"
+        )
+        time.sleep(pause)
+    return archived
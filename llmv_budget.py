@@ -0,0 +1,113 @@
+"""Per-account and per-challenge upstream token budgets, and per-account rate limits."""
+# Standard library imports.
+from logging import getLogger
+import time
+
+# Third-party imports.
+from sqlalchemy import func
+
+# CTFd imports.
+from CTFd.cache import cache
+from CTFd.models import db
+
+# LLM Verification Plugin module imports.
+from .config_manager import get_settings
+from .llmv_models import LLMVUsageRollup
+
+log = getLogger(__name__)
+
+
+def account_token_budget():
+    """Get the number of upstream tokens each user/team may spend; 0 means unlimited."""
+    return get_settings().team_token_budget
+
+
+def _usage_key(grouping, group_id):
+    return f"llmv_token_usage_{grouping}_{group_id}"
+
+
+def _usage(grouping, column, group_id):
+    """Get a cached running total of tokens, loading it from the usage rollup on a miss."""
+    key = _usage_key(grouping, group_id)
+    tokens = cache.get(key)
+    if tokens is None:
+        tokens = int(
+            db.session.query(
+                func.coalesce(
+                    func.sum(
+                        LLMVUsageRollup.prompt_tokens + LLMVUsageRollup.generation_tokens
+                    ),
+                    0,
+                )
+            )
+            .filter(column == group_id)
+            .scalar()
+        )
+        # Trust the running total for a while before re-reading it from the database.
+        cache.set(key, tokens, timeout=get_settings().usage_cache_timeout)
+    return tokens
+
+
+def account_usage(account_id):
+    return _usage("account", LLMVUsageRollup.account_id, account_id)
+
+
+def challenge_usage(challenge_id):
+    return _usage("challenge", LLMVUsageRollup.challenge_id, challenge_id)
+
+
+def budget_exceeded(account_id, challenge):
+    """Check whether an account may make another router call for a challenge.
+
+    Arguments:
+        account_id (int): ID of the user (or team in "teams" mode).
+        challenge (ChallengeConfig): The challenge the prompt is for.
+
+    Returns:
+        str: A message for the player if a budget is used up, otherwise `None`.
+    """
+    account_budget = account_token_budget()
+    if account_budget and account_usage(account_id) >= account_budget:
+        log.info(f"Account {account_id} has used its token budget of {account_budget}")
+        return "Your generation budget for this event has been used up."
+    if challenge.token_budget and challenge_usage(challenge.id) >= challenge.token_budget:
+        log.info(
+            f"Challenge {challenge.id} has used its token budget of {challenge.token_budget}"
+        )
+        return "The generation budget for this challenge has been used up."
+    return None
+
+
+def add_usage(account_id, challenge_id, tokens):
+    """Add committed token usage to the cached running totals that are currently loaded."""
+    for key in (
+        _usage_key("account", account_id),
+        _usage_key("challenge", challenge_id),
+    ):
+        if cache.get(key) is not None:
+            cache.cache.inc(key, tokens)
+
+
+def rate_limited(account_id, amount=1):
+    """Count a generation request against the account's rate limit.
+
+    Arguments:
+        account_id (int): ID of the user (or team in "teams" mode).
+        amount (int, optional): Router calls the request makes, e.g. one per model for a
+            fan-out. Defaults to 1.
+
+    Returns:
+        bool: `True` if the account has used up the `generate_rate_limit` requests it may make
+            per `generate_rate_interval` seconds.
+    """
+    settings = get_settings()
+    if not settings.generate_rate_limit:
+        return False
+    window = int(time.time() // settings.generate_rate_interval)
+    key = f"llmv_generate_rate_{account_id}_{window}"
+    cache.add(key, 0, timeout=settings.generate_rate_interval)
+    requests = cache.cache.inc(key, amount)
+    if requests > settings.generate_rate_limit:
+        log.info(f"Account {account_id} is over the rate limit of {settings.generate_rate_limit}")
+        return True
+    return False
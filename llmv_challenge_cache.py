@@ -0,0 +1,116 @@
+"""Versioned in-process cache of the LLM challenge settings used on the generate path.
+
+Each worker keeps the settings it has loaded in memory. A version stamp in CTFd's cache (shared
+by every worker when CTFd is configured with Redis) is replaced whenever an admin creates,
+updates or deletes a challenge, and a worker drops its copies as soon as it sees a new stamp.
+"""
+# Standard library imports.
+from dataclasses import dataclass
+from logging import getLogger
+import threading
+from uuid import uuid4
+
+# CTFd imports.
+from CTFd.cache import cache
+
+# LLM Verification Plugin module imports.
+from .config_manager import get_settings
+from .llmv_models import LlmChallenge
+
+log = getLogger(__name__)
+
+VERSION_KEY = "llmv_challenge_config_version"
+
+
+@dataclass(frozen=True)
+class ChallengeConfig:
+    """Runtime settings of an LLM challenge, detached from the database session."""
+
+    id: int
+    name: str
+    value: int
+    state: str
+    preprompt: str
+    chat_limit: int
+    token_budget: int
+    context_policy: str
+    context_limit: int
+    fan_out: bool
+    score_rules: str
+
+    @classmethod
+    def from_challenge(cls, challenge):
+        return cls(
+            id=challenge.id,
+            name=challenge.name,
+            value=challenge.value,
+            state=challenge.state,
+            preprompt=challenge.preprompt,
+            chat_limit=challenge.chat_limit,
+            token_budget=challenge.token_budget,
+            context_policy=challenge.context_policy,
+            context_limit=challenge.context_limit,
+            fan_out=bool(int(challenge.fan_out or 0)),
+            score_rules=challenge.score_rules or "",
+        )
+
+
+_lock = threading.Lock()
+_version = None
+_configs = {}
+
+
+def current_version():
+    """Get the shared version stamp, creating it if no worker has yet."""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid4().hex, timeout=0)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def invalidate_challenge_configs():
+    """Make every worker reload challenge settings on its next request."""
+    global _version
+    cache.set(VERSION_KEY, uuid4().hex, timeout=0)
+    with _lock:
+        _version = None
+        _configs.clear()
+    log.info("Invalidated cached challenge settings")
+
+
+def get_challenge_config(challenge_id):
+    """Get an LLM challenge's runtime settings, loading them from the database on a miss.
+
+    Arguments:
+        challenge_id (int | str): ID of the challenge.
+
+    Returns:
+        ChallengeConfig: The challenge's settings, or `None` if there's no such LLM challenge.
+    """
+    global _version
+    try:
+        challenge_id = int(challenge_id)
+    except (TypeError, ValueError):
+        return None
+    version = current_version()
+    with _lock:
+        if version != _version:
+            _configs.clear()
+            _version = version
+        config = _configs.get(challenge_id)
+    if config is not None:
+        return config
+
+    challenge = LlmChallenge.query.filter_by(id=challenge_id).first()
+    if challenge is None:
+        return None
+    config = ChallengeConfig.from_challenge(challenge)
+    with _lock:
+        # Don't keep settings that were loaded before an invalidation that happened meanwhile.
+        if version == _version:
+            # Forget the least recently loaded challenge once the cache is full.
+            while _configs and len(_configs) >= get_settings().challenge_cache_size:
+                del _configs[next(iter(_configs))]
+            _configs[challenge_id] = config
+    return config
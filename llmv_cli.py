@@ -0,0 +1,352 @@
+"""Flask CLI commands for maintaining the LLM Verification plugin's tables."""
+# Standard library imports.
+from logging import getLogger
+import time
+
+# Third-party imports.
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+# CTFd imports.
+from CTFd.models import Users, db
+
+# LLM Verification Plugin module imports.
+from .llmv_analytics import rebuild_rollups
+from .llmv_archive import archive_graded_conversations
+from .llmv_compression import backfill_compression
+from .llmv_models import LLMVGeneration, LlmModels, fill_models_table
+from .llmv_pending import collect_empty_generations, reconcile_pending_turns
+from .llmv_prescoring import backfill_scores
+from .llmv_purge import purge_generations
+from .llmv_query_budget import check_route_budgets
+from .llmv_replay import create_replay_run, replay_report, run_replay
+from .llmv_write_behind import flush_due
+
+log = getLogger(__name__)
+
+llmv_cli = AppGroup("llmv", help="LLM Verification Plugin maintenance commands.")
+
+
+@llmv_cli.command("archive")
+@click.option(
+    "--older-than-days",
+    default=30,
+    show_default=True,
+    help="Only archive generations graded at least this many days ago.",
+)
+@click.option("--batch-size", default=200, show_default=True, help="Generations per batch.")
+@click.option(
+    "--pause", default=0.5, show_default=True, help="Seconds to sleep between batches."
+)
+@click.option("--max-batches", default=None, type=int, help="Stop after this many batches.")
+def archive(older_than_days, batch_size, pause, max_batches):
+    """Move graded conversations into the compressed archive table."""
+    archived = archive_graded_conversations(
+        older_than_days=older_than_days,
+        batch_size=batch_size,
+        pause=pause,
+        max_batches=max_batches,
+    )
+    click.echo(f"Archived {archived} generations")
+
+
+@llmv_cli.command("compress")
+@click.option("--batch-size", default=500, show_default=True, help="Rows read per batch.")
+@click.option(
+    "--threshold",
+    default=None,
+    type=int,
+    help="Minimum size in bytes to compress. Defaults to the compress_threshold setting.",
+)
+def compress(batch_size, threshold):
+    """Compress existing large prompts, generations and pre-prompts."""
+    with db.engine.connect() as connection:
+        compressed = backfill_compression(
+            connection, batch_size=batch_size, threshold=threshold, commit_batches=True
+        )
+    click.echo(f"Compressed {compressed} values")
+
+
+@llmv_cli.command("models")
+def models():
+    """Fill the models table from the LLM Router, e.g. after it was down when CTFd started."""
+    fill_models_table()
+    click.echo(f"The models table has {LlmModels.query.count()} models")
+
+
+@llmv_cli.command("rollups")
+def rollups():
+    """Rebuild the analytics rollups from the raw generation tables."""
+    rebuild_rollups()
+    click.echo("Rebuilt analytics rollups")
+
+
+@llmv_cli.command("reconcile")
+@click.option(
+    "--older-than-seconds",
+    default=300,
+    show_default=True,
+    help="Only recover turns that have been pending at least this long.",
+)
+@click.option("--batch-size", default=50, show_default=True, help="Pending turns per pass.")
+@click.option(
+    "--max-attempts",
+    default=5,
+    show_default=True,
+    help="Router calls before a lost turn is given up.",
+)
+@click.option(
+    "--interval",
+    default=None,
+    type=float,
+    help="Keep running, reconciling every this many seconds.",
+)
+def reconcile(older_than_seconds, batch_size, max_attempts, interval):
+    """Recover turns that workers lost mid router call."""
+    while True:
+        counts = reconcile_pending_turns(
+            older_than_seconds=older_than_seconds,
+            batch_size=batch_size,
+            max_attempts=max_attempts,
+        )
+        click.echo(
+            f"Recovered {counts['recovered']}, dropped {counts['dropped']}, "
+            f"retrying {counts['retrying']} and skipped {counts['skipped']} pending turns"
+        )
+        if interval is None:
+            break
+        # End the transaction so the next pass sees new pending turns.
+        db.session.rollback()
+        time.sleep(interval)
+
+
+@llmv_cli.command("gc")
+@click.option(
+    "--older-than-hours",
+    default=1,
+    show_default=True,
+    help="Only delete empty generations created at least this many hours ago.",
+)
+@click.option("--batch-size", default=500, show_default=True, help="Generations per batch.")
+@click.option(
+    "--pause", default=0.5, show_default=True, help="Seconds to sleep between batches."
+)
+@click.option("--max-batches", default=None, type=int, help="Stop after this many batches.")
+def gc(older_than_hours, batch_size, pause, max_batches):
+    """Delete unsubmitted generations that never got a turn."""
+    deleted = collect_empty_generations(
+        older_than_hours=older_than_hours,
+        batch_size=batch_size,
+        pause=pause,
+        max_batches=max_batches,
+    )
+    click.echo(f"Deleted {deleted} empty generations")
+
+
+@llmv_cli.command("purge")
+@click.option("--challenge-id", default=None, type=int, help="Purge this challenge's generations.")
+@click.option("--account-id", default=None, type=int, help="Purge this account's generations.")
+@click.option(
+    "--older-than-days", default=None, type=int, help="Purge generations at least this old."
+)
+@click.option(
+    "--status",
+    "statuses",
+    multiple=True,
+    help="Only purge generations with this status (repeatable).",
+)
+@click.option("--batch-size", default=200, show_default=True, help="Generations per batch.")
+@click.option(
+    "--pause", default=0.5, show_default=True, help="Seconds to sleep between batches."
+)
+@click.option("--max-batches", default=None, type=int, help="Stop after this many batches.")
+def purge(challenge_id, account_id, older_than_days, statuses, batch_size, pause, max_batches):
+    """Delete generations by challenge, account or age in throttled batches."""
+
+    def echo_progress(report):
+        click.echo(
+            f"{report['status']}: purged {report['deleted']} of {report['total']} generations "
+            f"in {report['batches']} batches ({report['elapsed']:.1f}s)"
+        )
+
+    try:
+        purge_generations(
+            challenge_id=challenge_id,
+            account_id=account_id,
+            older_than_days=older_than_days,
+            statuses=statuses or None,
+            batch_size=batch_size,
+            pause=pause,
+            max_batches=max_batches,
+            progress=echo_progress,
+        )
+    except ValueError as error:
+        raise click.UsageError(str(error))
+
+
+@llmv_cli.command("flush")
+@click.option(
+    "--batch-size",
+    default=None,
+    type=int,
+    help="Generations per commit. Defaults to the write_behind_batch_size setting.",
+)
+@click.option(
+    "--all", "flush_all", is_flag=True, help="Flush every buffered turn, not just due ones."
+)
+@click.option(
+    "--interval",
+    default=None,
+    type=float,
+    help="Keep running, flushing due turns every this many seconds.",
+)
+def flush(batch_size, flush_all, interval):
+    """Store turns buffered in Redis by the write_behind setting."""
+    while True:
+        inserted = flush_due(batch_size=batch_size, max_age=0 if flush_all else None)
+        click.echo(f"Flushed {inserted} buffered turns")
+        if interval is None:
+            break
+        db.session.rollback()
+        time.sleep(interval)
+
+
+def echo_replay_report(report):
+    click.echo(
+        f"Replay run {report['run_id']} ({report['status']}): {report['done']} of "
+        f"{report['total']} conversations in {report['elapsed']:.1f}s, "
+        f"{report['generations_per_second']:.2f} generations/s"
+    )
+    for model, summary in sorted(report["models"].items()):
+        click.echo(
+            f"  {model}: {summary['completed']} completed, {summary['error']} failed, "
+            f"{summary['mean_duration']:.2f}s mean, {summary['tokens']} tokens"
+        )
+
+
+@llmv_cli.command("replay")
+@click.option(
+    "--model",
+    "models",
+    multiple=True,
+    help="Router name of a model to replay against (repeatable).",
+)
+@click.option(
+    "--status",
+    "statuses",
+    multiple=True,
+    default=("correct",),
+    show_default=True,
+    help="Status of the generations to replay (repeatable).",
+)
+@click.option("--challenge-id", default=None, type=int, help="Only replay this challenge.")
+@click.option("--limit", default=None, type=int, help="Replay at most this many generations.")
+@click.option("--name", default=None, help="Label for the run.")
+@click.option("--resume", "run_id", default=None, type=int, help="Resume this replay run.")
+@click.option(
+    "--retry-errors", is_flag=True, help="When resuming, replay failed conversations again."
+)
+@click.option(
+    "--concurrency",
+    default=4,
+    show_default=True,
+    help="Most conversations replayed at once.",
+)
+def replay(models, statuses, challenge_id, limit, name, run_id, retry_errors, concurrency):
+    """Replay graded conversations against other models."""
+    try:
+        if run_id is None:
+            run_id = create_replay_run(
+                models, statuses=statuses, challenge_id=challenge_id, limit=limit, name=name
+            ).id
+            click.echo(f"Created replay run {run_id}")
+        report = run_replay(run_id, concurrency=concurrency, retry_errors=retry_errors)
+    except ValueError as error:
+        raise click.UsageError(str(error))
+    echo_replay_report(report)
+
+
+@llmv_cli.command("replay-report")
+@click.argument("run_id", type=int)
+def replay_report_command(run_id):
+    """Show a replay run's progress and throughput."""
+    try:
+        echo_replay_report(replay_report(run_id))
+    except ValueError as error:
+        raise click.UsageError(str(error))
+
+
+@llmv_cli.command("score")
+@click.option("--challenge-id", default=None, type=int, help="Only score this challenge.")
+@click.option(
+    "--status",
+    "statuses",
+    multiple=True,
+    default=["pending"],
+    show_default=True,
+    help="Score generations with this status; repeat for several.",
+)
+@click.option("--unscored-only", is_flag=True, help="Skip generations that have a score.")
+@click.option("--batch-size", default=100, show_default=True, help="Generations per batch.")
+@click.option(
+    "--pause", default=0.0, show_default=True, help="Seconds to sleep between batches."
+)
+def score(challenge_id, statuses, unscored_only, batch_size, pause):
+    """Pre-score submitted generations with the configured scorers, e.g. after new rules."""
+    scored = backfill_scores(
+        challenge_id=challenge_id,
+        statuses=statuses,
+        unscored_only=unscored_only,
+        batch_size=batch_size,
+        pause=pause,
+    )
+    click.echo(f"Scored {scored} generations")
+
+
+@llmv_cli.command("query-budgets")
+@click.option("--admin", "admin_name", required=True, help="Admin to request admin pages as.")
+@click.option("--user", "user_name", default=None, help="Player to request challenge routes as.")
+@click.option("--challenge-id", required=True, type=int, help="LLM challenge to request.")
+@click.option(
+    "--generate/--no-generate",
+    default=True,
+    show_default=True,
+    help="Also request /generate (stores a turn through the router).",
+)
+def query_budgets(admin_name, user_name, challenge_id, generate):
+    """Check every route's SQL statements and ORM rows against its query budget.
+
+    Run it against the development stack, whose router is the mock router.
+    """
+    admin = Users.query.filter_by(name=admin_name, type="admin").first()
+    user = Users.query.filter_by(name=user_name).first() if user_name else admin
+    if admin is None or user is None:
+        raise click.UsageError("Unknown admin or user")
+    generation_id = (
+        db.session.query(LLMVGeneration.id)
+        .filter_by(challenge_id=challenge_id)
+        .order_by(LLMVGeneration.id.desc())
+        .limit(1)
+        .scalar()
+    )
+    results = check_route_budgets(
+        current_app._get_current_object(),
+        admin,
+        user,
+        challenge_id,
+        generation_id=generation_id,
+        generate=generate,
+    )
+    failed = False
+    for result in results:
+        budget = result["budget"]
+        ok = result["problem"] is None and result["status"] < 400
+        failed = failed or not ok
+        click.echo(
+            f"{'ok  ' if ok else 'FAIL'} {result['view']:<28} {result['status']} "
+            f"{result['statements']:>4}/{budget.statements} statements "
+            f"{result['rows']:>5}/{budget.rows if budget.rows is not None else '-'} rows"
+        )
+    if failed:
+        raise SystemExit(1)
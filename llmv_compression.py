@@ -0,0 +1,140 @@
+"""Transparent compression for large LLMV text columns."""
+# Standard library imports.
+from base64 import b85decode, b85encode
+from contextlib import nullcontext
+from logging import getLogger
+import zlib
+
+# Third-party imports.
+import sqlalchemy as sa
+from sqlalchemy.types import Text, TypeDecorator
+
+# LLM Verification Plugin module imports.
+from .config_manager import get_settings
+
+log = getLogger(__name__)
+
+# Prefix that marks a value as compressed. Values without it are read back as plain text, so
+# rows written before compression was turned on (or after it's turned off) keep working.
+COMPRESSED_MARKER = "\x1fz1:"
+# Columns that are stored with `CompressedText`, as `(table, column)`.
+COMPRESSED_COLUMNS = (
+    ("llmv_chat_pair", "prompt"),
+    ("llmv_chat_pair", "generation"),
+    ("llm_challenge", "preprompt"),
+)
+
+
+def compression_enabled():
+    """Check whether new values should be compressed (the `compress_text` setting)."""
+    return get_settings().compress_text
+
+
+def compression_threshold():
+    """Get the minimum size in bytes of a value that gets compressed.
+
+    Smaller values aren't worth it; the marker and encoding would outweigh the savings.
+    """
+    return get_settings().compress_threshold
+
+
+def compress_text(value, threshold=None):
+    """Compress a text value if it's large enough for compression to pay off.
+
+    Arguments:
+        value (str): The text to store.
+        threshold (int, optional): Minimum size in bytes to compress. Defaults to
+            `compression_threshold()`.
+
+    Returns:
+        str: The marked, compressed value, or the original value if it's small, already
+            compressed or doesn't shrink.
+    """
+    if value is None or value.startswith(COMPRESSED_MARKER):
+        return value
+    raw = value.encode("utf-8")
+    if len(raw) < (compression_threshold() if threshold is None else threshold):
+        return value
+    compressed = COMPRESSED_MARKER + b85encode(zlib.compress(raw, level=6)).decode("ascii")
+    if len(compressed) >= len(raw):
+        return value
+    return compressed
+
+
+def decompress_text(value):
+    """Read back a value written by `compress_text()`; plain values are returned as-is."""
+    if value is None or not value.startswith(COMPRESSED_MARKER):
+        return value
+    try:
+        return zlib.decompress(b85decode(value[len(COMPRESSED_MARKER) :])).decode("utf-8")
+    except (ValueError, zlib.error):
+        # Plain text that happens to start with the marker (e.g. typed by a player).
+        return value
+
+
+class CompressedText(TypeDecorator):
+    """`Text` column that compresses large values when `LLMV_COMPRESS_TEXT` is set.
+
+    Compressed values aren't visible to the database's full-text index or `LIKE` searches, so
+    admin search skips them (see `llmv_search`).
+    """
+
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if not compression_enabled():
+            return value
+        return compress_text(value)
+
+    def process_result_value(self, value, dialect):
+        return decompress_text(value)
+
+
+def backfill_compression(connection, batch_size=500, threshold=None, commit_batches=False):
+    """Compress existing large values in every `CompressedText` column, one batch at a time.
+
+    Arguments:
+        connection: SQLAlchemy connection (e.g. `op.get_bind()` in a migration).
+        batch_size (int, optional): Rows read per batch. Defaults to 500.
+        threshold (int, optional): Minimum size in bytes to compress. Defaults to
+            `compression_threshold()`.
+        commit_batches (bool, optional): Commit each batch in its own transaction instead of
+            leaving the transaction to the caller (as migrations do). Defaults to `False`.
+
+    Returns:
+        int: Number of values that were compressed.
+    """
+    compressed_count = 0
+    for table_name, column_name in COMPRESSED_COLUMNS:
+        table = sa.table(table_name, sa.column("id"), sa.column(column_name))
+        value_column = table.c[column_name]
+        last_id = 0
+        while True:
+            rows = connection.execute(
+                sa.select(table.c.id, value_column)
+                .where(table.c.id > last_id)
+                .order_by(table.c.id)
+                .limit(batch_size)
+            ).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            updates = []
+            for row_id, value in rows:
+                compressed = compress_text(value, threshold=threshold)
+                if compressed is not value:
+                    updates.append((row_id, compressed))
+            if not updates:
+                continue
+            transaction = connection.begin() if commit_batches else nullcontext()
+            with transaction:
+                for row_id, compressed in updates:
+                    connection.execute(
+                        table.update()
+                        .where(table.c.id == row_id)
+                        .values({column_name: compressed})
+                    )
+            compressed_count += len(updates)
+        log.info(f"Compressed large values in {table_name}.{column_name}")
+    return compressed_count
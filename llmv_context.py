@@ -0,0 +1,143 @@
+"""Per-challenge context policies that limit how much conversation history is sent upstream.
+
+The full conversation is always stored locally; a policy only picks which earlier turns are
+sent to the router with the next prompt.
+"""
+# Standard library imports.
+from dataclasses import dataclass
+import json
+from logging import getLogger
+
+# LLM Verification Plugin module imports.
+from .remote_llm import estimate_tokens
+
+log = getLogger(__name__)
+
+# Send every earlier turn.
+FULL = "full"
+# Send the last `limit` turns.
+LAST_TURNS = "last_turns"
+# Send the newest turns that fit in `limit` bytes of JSON.
+BYTE_BUDGET = "bytes"
+# Send the newest turns that fit in an estimated `limit` tokens.
+TOKEN_BUDGET = "tokens"
+# Send the first turn and the last `limit` turns after it.
+PIN_FIRST = "pin_first"
+
+CONTEXT_POLICIES = {
+    FULL: "Full history",
+    LAST_TURNS: "Last N turns",
+    BYTE_BUDGET: "Byte budget",
+    TOKEN_BUDGET: "Token budget",
+    PIN_FIRST: "First turn and last N turns",
+}
+
+
+@dataclass
+class ContextWindow:
+    """History that will be sent to the router, and how much smaller it is than the original."""
+
+    history: list
+    full_bytes: int
+    sent_bytes: int
+
+    @property
+    def saved_bytes(self):
+        return self.full_bytes - self.sent_bytes
+
+
+def payload_bytes(history):
+    """Get the size of history as it is serialized in the router request."""
+    return len(json.dumps(history).encode("utf-8")) if history else 0
+
+
+def _newest_within(history, budget, size):
+    """Get the longest tail of `history` whose turns fit in `budget` when measured by `size`."""
+    used = 0
+    start = len(history)
+    while start > 0:
+        used += size(history[start - 1])
+        if used > budget:
+            break
+        start -= 1
+    return history[start:]
+
+
+def validate_context_settings(data):
+    """Check the context policy and limit of a challenge that an admin submitted.
+
+    Arguments:
+        data (dict): The submitted challenge fields. Missing fields aren't checked.
+
+    Raises:
+        ValueError: If the policy isn't one of `CONTEXT_POLICIES` or the limit isn't a
+            non-negative integer.
+    """
+    policy = data.get("context_policy")
+    if policy is not None and policy not in CONTEXT_POLICIES:
+        raise ValueError(f'Unknown context policy "{policy}"')
+    limit = data.get("context_limit")
+    if limit is None or limit == "":
+        return
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise ValueError(f'Context limit "{limit}" is not an integer')
+    if limit < 0:
+        raise ValueError(f"Context limit {limit} is negative")
+
+
+def window_history(history, policy, limit):
+    """Apply a context policy to a conversation's history.
+
+    Arguments:
+        history (list[dict]): Earlier turns, oldest first, as returned by `LLMVChatPair.json`.
+        policy (str): One of `CONTEXT_POLICIES`. Unknown policies send the full history.
+        limit (int): Turn count, byte or token budget of the policy; 0 sends the full history.
+
+    Returns:
+        list[dict]: The turns to send, oldest first.
+    """
+    limit = max(limit, 0)
+    if not limit or policy == FULL:
+        return history
+    if policy == LAST_TURNS:
+        return history[-limit:]
+    if policy == BYTE_BUDGET:
+        return _newest_within(history, limit, lambda turn: payload_bytes([turn]))
+    if policy == TOKEN_BUDGET:
+        return _newest_within(
+            history, limit, lambda turn: estimate_tokens(turn["prompt"], turn["generation"])
+        )
+    if policy == PIN_FIRST:
+        if len(history) <= limit + 1:
+            return history
+        return history[:1] + history[-limit:]
+    log.warning(f'Unknown context policy "{policy}", sending the full history')
+    return history
+
+
+def apply_context_policy(challenge, history):
+    """Pick the part of a conversation's history to send for a challenge's next prompt.
+
+    Arguments:
+        challenge (ChallengeConfig): The challenge whose context policy applies.
+        history (list[dict]): Every earlier turn of the conversation, oldest first.
+
+    Returns:
+        ContextWindow: The history to send and its size before and after windowing.
+    """
+    windowed = window_history(
+        history, challenge.context_policy or FULL, challenge.context_limit or 0
+    )
+    window = ContextWindow(
+        history=windowed,
+        full_bytes=payload_bytes(history),
+        sent_bytes=payload_bytes(windowed),
+    )
+    if window.saved_bytes:
+        log.debug(
+            f"Sending {len(windowed)} of {len(history)} turns for challenge {challenge.id}, "
+            f"saving {window.saved_bytes} bytes"
+        )
+    return window
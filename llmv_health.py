@@ -0,0 +1,172 @@
+"""Liveness and readiness of this worker, for load balancers and autoscalers.
+
+Readiness checks what gameplay needs: the database (and whether this worker's connection pool
+has any connections left), the router (probed at most every `health_probe_interval` seconds
+per worker, so frequent checks don't load it), and the models table that `load()` (or
+`flask llmv models`) fills from the router. Every check only reads. Queue depths and per-model router load are reported alongside, to scale on.
+"""
+# Standard library imports.
+from logging import getLogger
+import threading
+import time
+
+# Third-party imports.
+import requests
+from sqlalchemy import func, text
+
+# CTFd imports.
+from CTFd.models import db
+
+# LLM Verification Plugin module imports.
+from .config_manager import get_settings
+from .llmv_models import LLMVPendingTurn, LlmModels
+from .llmv_prescoring import queue_depth as scoring_queue_depth
+from .llmv_scheduler import router_stats
+from .llmv_write_behind import buffered_generation_count
+from .remote_llm import router_endpoint, router_session
+
+log = getLogger(__name__)
+
+# Models with a recent router error rate above this are reported as degraded.
+DEGRADED_ERROR_RATE = 0.5
+
+# Errors from loading the plugin, e.g. the router being down when the models table was filled.
+# Cleared once the readiness check sees a filled models table.
+load_errors = []
+
+_probe_lock = threading.Lock()
+_last_probe = None
+
+
+def probe_router():
+    """Check that the router answers, reusing this worker's last result for a while.
+
+    Returns:
+        dict: Whether the router is reachable, how long it took to answer (in seconds), any
+            error and how old the result is.
+    """
+    global _last_probe
+    settings = get_settings()
+    with _probe_lock:
+        now = time.monotonic()
+        if _last_probe is not None and now - _last_probe[0] < settings.health_probe_interval:
+            checked, result = _last_probe
+            return {**result, "age": round(now - checked, 3)}
+
+        result = {"ok": False, "latency": None, "error": None}
+        start = time.monotonic()
+        try:
+            route, headers = router_endpoint(settings, "/chat/models")
+            response = router_session(settings).get(
+                url=route,
+                headers=headers,
+                timeout=(settings.router_connect_timeout, settings.health_probe_timeout),
+            )
+            result["ok"] = response.status_code == 200
+            if not result["ok"]:
+                result["error"] = f"Status code {response.status_code}"
+        except (ValueError, requests.RequestException) as error:
+            result["error"] = str(error)
+        result["latency"] = round(time.monotonic() - start, 3)
+        if not result["ok"]:
+            log.warning(f"LLM Router probe failed: {result['error']}")
+        _last_probe = (time.monotonic(), result)
+        return {**result, "age": 0.0}
+
+
+def pool_status():
+    """Get the usage of this worker's database connection pool.
+
+    Returns:
+        dict: Connections in use and the most the pool allows (`None` for pools without a
+            limit), and whether every connection is in use.
+    """
+    pool = db.engine.pool
+    if not hasattr(pool, "checkedout"):
+        # SQLite's pools don't limit connections.
+        return {"checked_out": None, "limit": None, "saturated": False}
+    checked_out = pool.checkedout()
+    limit = pool.size() + max(getattr(pool, "_max_overflow", 0), 0)
+    return {
+        "checked_out": checked_out,
+        "limit": limit,
+        "saturated": checked_out >= limit,
+    }
+
+
+def check_database():
+    """Time a trivial query, unless every pooled connection is in use."""
+    pool = pool_status()
+    if pool["saturated"]:
+        # Don't wait for a connection; that's what a saturated pool would make requests do.
+        return {"ok": False, "latency": None, "error": "Connection pool saturated", **pool}
+    start = time.monotonic()
+    try:
+        db.session.execute(text("SELECT 1"))
+        error = None
+    except Exception as exception:
+        db.session.rollback()
+        error = str(exception)
+    return {
+        "ok": error is None,
+        "latency": round(time.monotonic() - start, 3),
+        "error": error,
+        **pool,
+    }
+
+
+def check_models():
+    """Check that the models table is filled.
+
+    The check only reads; if `load()` couldn't fill the table, fill it with `flask llmv models`.
+    """
+    count = db.session.query(func.count(LlmModels.id)).scalar()
+    return {"ok": bool(count), "count": count}
+
+
+def queue_depths():
+    """Get the number of items waiting in each of the plugin's background queues."""
+    return {
+        # Turns waiting on (or lost by) the router, shared by every worker.
+        "pending_turns": db.session.query(func.count(LLMVPendingTurn.id)).scalar(),
+        # Generations with turns buffered in Redis, shared by every worker.
+        "write_behind": buffered_generation_count(),
+        # Submissions waiting for this worker's scoring threads.
+        "scoring": scoring_queue_depth(),
+    }
+
+
+def router_load():
+    """Get this worker's live load and health per model, from its router calls."""
+    return {
+        model: {
+            "in_flight": load.in_flight,
+            "latency": round(load.latency, 3),
+            "error_rate": round(load.error_rate, 3),
+            "degraded": load.error_rate > DEGRADED_ERROR_RATE,
+        }
+        for model, load in router_stats.snapshot().items()
+    }
+
+
+def readiness():
+    """Check whether this worker can serve gameplay.
+
+    Returns:
+        tuple (bool, dict): Whether it's ready, and every check's result.
+    """
+    database = check_database()
+    router = probe_router()
+    models = check_models() if database["ok"] else {"ok": False, "count": None}
+    if models["ok"]:
+        # The only load errors are failures to fill the models table, which has been filled
+        # since (e.g. with `flask llmv models`).
+        load_errors.clear()
+    report = {
+        "checks": {"database": database, "router": router, "models": models},
+        "queues": queue_depths() if database["ok"] else None,
+        "router_load": router_load(),
+        "load_errors": list(load_errors),
+    }
+    ready = all(check["ok"] for check in report["checks"].values())
+    return ready, report
@@ -0,0 +1,72 @@
+"""Single-flight handling of client-supplied idempotency keys for text generation."""
+# Standard library imports.
+from logging import getLogger
+import time
+
+# CTFd imports.
+from CTFd.cache import cache
+from CTFd.models import db
+
+# LLM Verification Plugin module imports.
+from .llmv_models import LLMVChatPair
+from .llmv_write_behind import buffered_pair
+
+log = getLogger(__name__)
+
+# How long (in seconds) a worker may hold an idempotency key while it waits for the router.
+INFLIGHT_TIMEOUT = 120
+# How often (in seconds) a duplicate request checks whether the original one has finished.
+POLL_INTERVAL = 0.25
+
+
+def _inflight_key(idempotency_uuid):
+    return f"llmv_generate_inflight_{idempotency_uuid}"
+
+
+def completed_pair(idempotency_uuid):
+    """Get the chat pair stored (or buffered) for an idempotency key, if the request finished."""
+    pair = LLMVChatPair.query.filter_by(uuid=idempotency_uuid).first()
+    if pair is None:
+        pair = buffered_pair(idempotency_uuid)
+    return pair
+
+
+def claim(idempotency_uuid):
+    """Try to become the only worker generating text for an idempotency key.
+
+    Uses CTFd's cache, which is shared by every worker when CTFd is configured with Redis.
+
+    Returns:
+        bool: `True` if this request should call the router, `False` if a duplicate request
+            already is.
+    """
+    return cache.add(_inflight_key(idempotency_uuid), 1, timeout=INFLIGHT_TIMEOUT)
+
+
+def release(idempotency_uuid):
+    """Let other requests with this idempotency key proceed."""
+    cache.delete(_inflight_key(idempotency_uuid))
+
+
+def wait_for_pair(idempotency_uuid, timeout=INFLIGHT_TIMEOUT):
+    """Wait for the request that claimed an idempotency key to store its chat pair.
+
+    Returns:
+        LLMVChatPair: The stored chat pair, or `None` if the original request failed or timed
+            out without storing one.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        # End the read transaction so the next poll sees rows committed by other workers.
+        db.session.rollback()
+        pair = completed_pair(idempotency_uuid)
+        if pair is not None:
+            return pair
+        if cache.get(_inflight_key(idempotency_uuid)) is None:
+            # Check once more in case the original request stored its pair and released the key
+            # between the two checks.
+            db.session.rollback()
+            return completed_pair(idempotency_uuid)
+        time.sleep(POLL_INTERVAL)
+    log.warning(f"Timed out waiting for duplicate generation request {idempotency_uuid}")
+    return None
@@ -13,6 +13,8 @@ from logging.handlers import RotatingFileHandler
 from pathlib import Path
 import sys
 
+from .config_manager import get_settings, settings_manager
+
 
 def initialize_llmvctfd_loggers(module_name):
     """Create and initialize the loggers for the llmvctfd LLM Verification plugin.
@@ -39,9 +41,11 @@ def initialize_llmvctfd_loggers(module_name):
     log.addHandler(llm_verification_log)
     # Create a console logger for the LLM Verification Plugin.
     console_logger = StreamHandler(stream=sys.stdout)
-    # todo: Make LLM Verification Plugin log severity level configurable via `config.json`.
-    # Show console logs for all severity levels.
-    console_logger.setLevel(DEBUG)
+    # Show console logs at the configured severity level, and follow changes to it.
+    settings_manager.add_listener(
+        lambda settings: console_logger.setLevel(settings.log_level)
+    )
+    console_logger.setLevel(get_settings().log_level)
     # Add colorized formatter to console logger.
     console_logger.setFormatter(ColorizedFormatter())
     # Add the colorized console log handler to the LLM Verification Plugin's logger.
@@ -6,13 +6,17 @@ from typing import Dict
 
 # Third-party imports.
 from flask import Blueprint
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.hybrid import hybrid_property
+from werkzeug.exceptions import BadRequest
 
 # CTFd imports.
 from CTFd.models import Challenges, Submissions, db, Awards, Solves
 from CTFd.plugins.challenges import BaseChallenge
 from CTFd.utils.user import get_ip
 
+from .llmv_compression import CompressedText
+from .llmv_context import validate_context_settings
 from .remote_llm import get_models
 
 log = getLogger(__name__)
@@ -22,14 +26,17 @@ class LLMVChatPair(db.Model):
     __tablename__ = "llmv_chat_pair"
     __table_args__ = {"extend_existing": True}
     id = db.Column(db.Integer, primary_key=True)
-    uuid = db.Column(db.String(80))
+    uuid = db.Column(db.String(80), unique=True)
     generation_id = db.Column(
         db.Integer, db.ForeignKey("llmv_generation.id", ondelete="CASCADE")
     )
     conversation = db.relationship("LLMVGeneration", back_populates="pairs")
-    prompt = db.Column(db.Text)
-    generation = db.Column(db.Text, nullable=True)
+    prompt = db.Column(CompressedText)
+    generation = db.Column(CompressedText, nullable=True)
     date = db.Column(db.DateTime, default=datetime.datetime.utcnow, nullable=True)
+    # Upstream tokens used by this turn, as reported by the router (or estimated).
+    prompt_tokens = db.Column(db.Integer, default=0)
+    generation_tokens = db.Column(db.Integer, default=0)
 
     def json(self) -> Dict[str, str]:
         return {
@@ -56,6 +63,13 @@ class LLMVGeneration(db.Model):
     status = db.Column(db.String(80), default="unsubmitted")
     report = db.Column(db.Text)
     date = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    submitted_date = db.Column(db.DateTime, nullable=True)
+    # When the generation was first graded (regrades keep it), for the hourly rollups.
+    graded_date = db.Column(db.DateTime, nullable=True)
+    # Pre-score from 0 to 1 of how likely the submission is a success (see llmv_prescoring),
+    # and each scorer's score as JSON.
+    score = db.Column(db.Float, nullable=True)
+    score_details = db.Column(db.Text, nullable=True)
 
     pairs = db.relationship("LLMVChatPair", back_populates="conversation")
 
@@ -70,7 +84,261 @@ class LLMVGeneration(db.Model):
             return self.user_id
 
     def conversation(self):
-        return LLMVChatPair.query.filter_by(generation_id=self.id).all()
+        from .llmv_archive import load_conversation
+
+        return load_conversation(self.id)
+
+
+class LLMVProgress(db.Model):
+    """LLMV CTFd SQLAlchemy table for a user's submission progress on a challenge.
+
+    `submitted_models` has a row for every model the user has submitted a generation for. The
+    counts are the number of the user's generations in each submitted status.
+    """
+
+    __tablename__ = "llmv_progress"
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "challenge_id"),
+        {"extend_existing": True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"))
+    challenge_id = db.Column(
+        db.Integer, db.ForeignKey("challenges.id", ondelete="CASCADE")
+    )
+    pending = db.Column(db.Integer, default=0)
+    correct = db.Column(db.Integer, default=0)
+    awarded = db.Column(db.Integer, default=0)
+    incorrect = db.Column(db.Integer, default=0)
+    submitted_models = db.relationship(
+        "LLMVProgressModel", lazy="selectin", cascade="all, delete-orphan"
+    )
+
+    def __init__(self, *args, **kwargs):
+        for status in SUBMITTED_STATUSES:
+            kwargs.setdefault(status, 0)
+        super(LLMVProgress, self).__init__(**kwargs)
+
+    @property
+    def submitted(self):
+        return sum(getattr(self, status) for status in SUBMITTED_STATUSES)
+
+    def has_submitted(self, model_id):
+        return any(row.model_id == model_id for row in self.submitted_models)
+
+    def apply_status_change(self, model_id, old_status, new_status):
+        """Update the submitted models and counts for a generation that changed status."""
+        if old_status in SUBMITTED_STATUSES:
+            setattr(self, old_status, getattr(self, old_status) - 1)
+        if new_status in SUBMITTED_STATUSES:
+            setattr(self, new_status, getattr(self, new_status) + 1)
+            if not self.has_submitted(model_id):
+                self.submitted_models.append(LLMVProgressModel(model_id=model_id))
+
+
+class LLMVProgressModel(db.Model):
+    """LLMV CTFd SQLAlchemy table for a model a user has submitted a generation for."""
+
+    __tablename__ = "llmv_progress_model"
+    __table_args__ = (
+        db.UniqueConstraint("progress_id", "model_id"),
+        {"extend_existing": True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    progress_id = db.Column(
+        db.Integer, db.ForeignKey("llmv_progress.id", ondelete="CASCADE")
+    )
+    model_id = db.Column(db.Integer, db.ForeignKey("llm_models.id", ondelete="CASCADE"))
+
+
+class LLMVModelRollup(db.Model):
+    """LLMV CTFd SQLAlchemy table for running totals per challenge and model."""
+
+    __tablename__ = "llmv_rollup_model"
+    __table_args__ = (
+        db.UniqueConstraint("challenge_id", "model_id"),
+        {"extend_existing": True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    challenge_id = db.Column(
+        db.Integer, db.ForeignKey("challenges.id", ondelete="CASCADE")
+    )
+    model_id = db.Column(db.Integer, db.ForeignKey("llm_models.id", ondelete="CASCADE"))
+    generations = db.Column(db.Integer, default=0)
+    submissions = db.Column(db.Integer, default=0)
+    pending = db.Column(db.Integer, default=0)
+    correct = db.Column(db.Integer, default=0)
+    awarded = db.Column(db.Integer, default=0)
+    incorrect = db.Column(db.Integer, default=0)
+    # Total number of turns in the generations that were graded correct.
+    correct_turns = db.Column(db.Integer, default=0)
+
+    def __init__(self, *args, **kwargs):
+        for counter in (
+            "generations",
+            "submissions",
+            "correct_turns",
+            *SUBMITTED_STATUSES,
+        ):
+            kwargs.setdefault(counter, 0)
+        super(LLMVModelRollup, self).__init__(**kwargs)
+
+
+class LLMVHourlyRollup(db.Model):
+    """LLMV CTFd SQLAlchemy table for submission and grading totals per hour and challenge.
+
+    `submissions` and `pending` are bucketed by the hour the generations were submitted;
+    `graded` and `correct` by the hour they were first graded.
+    """
+
+    __tablename__ = "llmv_rollup_hourly"
+    __table_args__ = (
+        db.UniqueConstraint("hour", "challenge_id"),
+        {"extend_existing": True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    hour = db.Column(db.DateTime)
+    challenge_id = db.Column(
+        db.Integer, db.ForeignKey("challenges.id", ondelete="CASCADE")
+    )
+    submissions = db.Column(db.Integer, default=0)
+    pending = db.Column(db.Integer, default=0)
+    graded = db.Column(db.Integer, default=0)
+    correct = db.Column(db.Integer, default=0)
+
+    def __init__(self, *args, **kwargs):
+        for counter in ("submissions", "pending", "graded", "correct"):
+            kwargs.setdefault(counter, 0)
+        super(LLMVHourlyRollup, self).__init__(**kwargs)
+
+
+class LLMVUsageRollup(db.Model):
+    """LLMV CTFd SQLAlchemy table for upstream token usage per account and challenge."""
+
+    __tablename__ = "llmv_rollup_usage"
+    __table_args__ = (
+        db.UniqueConstraint("account_id", "challenge_id"),
+        {"extend_existing": True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    # User ID in "users" mode and team ID in "teams" mode.
+    account_id = db.Column(db.Integer, index=True)
+    challenge_id = db.Column(
+        db.Integer, db.ForeignKey("challenges.id", ondelete="CASCADE")
+    )
+    requests = db.Column(db.Integer, default=0)
+    prompt_tokens = db.Column(db.BigInteger, default=0)
+    generation_tokens = db.Column(db.BigInteger, default=0)
+    # Size of the conversation history before and after the challenge's context policy.
+    history_bytes = db.Column(db.BigInteger, default=0)
+    history_bytes_sent = db.Column(db.BigInteger, default=0)
+
+    def __init__(self, *args, **kwargs):
+        for counter in (
+            "requests",
+            "prompt_tokens",
+            "generation_tokens",
+            "history_bytes",
+            "history_bytes_sent",
+        ):
+            kwargs.setdefault(counter, 0)
+        super(LLMVUsageRollup, self).__init__(**kwargs)
+
+
+class LLMVPendingTurn(db.Model):
+    """LLMV CTFd SQLAlchemy table for a turn whose router call hasn't been stored yet.
+
+    A row is committed before the router is called and deleted with the turn's chat pair, so a
+    leftover row is a turn that a worker lost (it died, or the router timed out). The router
+    deduplicates calls by `uuid`, so the reconciler can fetch the completion again without
+    paying for another one.
+    """
+
+    __tablename__ = "llmv_pending_turn"
+    __table_args__ = {"extend_existing": True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    uuid = db.Column(db.String(80), unique=True)
+    generation_id = db.Column(
+        db.Integer, db.ForeignKey("llmv_generation.id", ondelete="CASCADE"), index=True
+    )
+    prompt = db.Column(db.Text)
+    date = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)
+    attempts = db.Column(db.Integer, default=0)
+
+
+class LLMVChatArchive(db.Model):
+    """LLMV CTFd SQLAlchemy table for the archived conversation of a graded generation.
+
+    Each row holds every chat pair of one generation as zlib-compressed JSON.
+    """
+
+    __tablename__ = "llmv_chat_archive"
+    __table_args__ = {"extend_existing": True}
+
+    generation_id = db.Column(
+        db.Integer,
+        db.ForeignKey("llmv_generation.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    pair_count = db.Column(db.Integer, default=0)
+    pairs = db.Column(db.LargeBinary(length=(2**32) - 1))
+    date = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+
+class LLMVReplayRun(db.Model):
+    """LLMV CTFd SQLAlchemy table for an offline replay of stored conversations.
+
+    `generation_ids` and `models` are JSON lists fixed when the run is created, so a run can
+    be resumed after it's interrupted.
+    """
+
+    __tablename__ = "llmv_replay_run"
+    __table_args__ = {"extend_existing": True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(128))
+    generation_ids = db.Column(db.Text)
+    models = db.Column(db.Text)
+    status = db.Column(db.String(32), default="created")
+    # Wall-clock seconds spent replaying, over every session of the run.
+    elapsed = db.Column(db.Float, default=0.0)
+    date = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+
+class LLMVReplayResult(db.Model):
+    """LLMV CTFd SQLAlchemy table for one generation replayed against one model.
+
+    `turns` is the replayed conversation as a JSON list of `LLMVChatPair.json()` dicts.
+    """
+
+    __tablename__ = "llmv_replay_result"
+    __table_args__ = (
+        db.UniqueConstraint("run_id", "generation_id", "model"),
+        {"extend_existing": True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(
+        db.Integer, db.ForeignKey("llmv_replay_run.id", ondelete="CASCADE"), index=True
+    )
+    generation_id = db.Column(
+        db.Integer, db.ForeignKey("llmv_generation.id", ondelete="CASCADE"), index=True
+    )
+    # Router name of the model the conversation was replayed against.
+    model = db.Column(db.String(80))
+    status = db.Column(db.String(32))
+    turns = db.Column(CompressedText)
+    error = db.Column(db.Text)
+    prompt_tokens = db.Column(db.Integer, default=0)
+    generation_tokens = db.Column(db.Integer, default=0)
+    duration = db.Column(db.Float, default=0.0)
+    date = db.Column(db.DateTime, default=datetime.datetime.utcnow)
 
 
 class LLMVSubmission(db.Model):
@@ -87,6 +355,37 @@ class LLMVSubmission(db.Model):
     )
 
 
+class LLMVFingerprint(db.Model):
+    """LLMV CTFd SQLAlchemy table for the MinHash signature of a submitted generation."""
+
+    __tablename__ = "llmv_fingerprint"
+    __table_args__ = {"extend_existing": True}
+
+    generation_id = db.Column(
+        db.Integer,
+        db.ForeignKey("llmv_generation.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    signature = db.Column(db.Text)
+
+
+class LLMVFingerprintBand(db.Model):
+    """LLMV CTFd SQLAlchemy table for the LSH buckets of a submitted generation."""
+
+    __tablename__ = "llmv_fingerprint_band"
+    __table_args__ = (
+        db.Index("llmv_fingerprint_band_bucket", "band", "bucket"),
+        {"extend_existing": True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    generation_id = db.Column(
+        db.Integer, db.ForeignKey("llmv_generation.id", ondelete="CASCADE")
+    )
+    band = db.Column(db.Integer)
+    bucket = db.Column(db.String(16))
+
+
 class LlmChallenge(Challenges):
     """SQLAlchemy Table model for LLM Challenges."""
 
@@ -96,8 +395,17 @@ class LlmChallenge(Challenges):
     id = db.Column(
         db.Integer, db.ForeignKey("challenges.id", ondelete="CASCADE"), primary_key=True
     )
-    preprompt = db.Column(db.Text)
+    preprompt = db.Column(CompressedText)
     chat_limit = db.Column(db.Integer, default=0)
+    # Upstream tokens all users may spend on this challenge; 0 means unlimited.
+    token_budget = db.Column(db.Integer, default=0)
+    # How much earlier conversation is sent to the router with each prompt (see llmv_context).
+    context_policy = db.Column(db.String(32), default="full")
+    context_limit = db.Column(db.Integer, default=0)
+    # 1 to let single-turn prompts be sent to every remaining model at once.
+    fan_out = db.Column(db.Integer, default=0)
+    # Pre-scoring keyword rules, one regular expression per line (see llmv_scorers).
+    score_rules = db.Column(db.Text, nullable=True)
 
     def __init__(self, *args, **kwargs):
         super(LlmChallenge, self).__init__(**kwargs)
@@ -193,6 +501,18 @@ class LlmSubmissionChallenge(BaseChallenge):
     )
     challenge_model = LlmChallenge
 
+    @classmethod
+    def validate(cls, data):
+        """Check the fields of a challenge that an administrator submitted.
+
+        Raises:
+            BadRequest: If a field is invalid.
+        """
+        try:
+            validate_context_settings(data)
+        except ValueError as error:
+            raise BadRequest(str(error))
+
     @classmethod
     def create(cls, request):
         """Process a challenge creation request submitted by an administrator.
@@ -200,18 +520,70 @@ class LlmSubmissionChallenge(BaseChallenge):
         Arguments:
             request: The Flask request object.
 
+        Raises:
+            BadRequest: If the context policy or limit is invalid, which translates to a 400
+                status code.
+
         Returns:
             Challenge: The newly created challenge.
         """
         data = request.form or request.get_json()
+        cls.validate(data)
         # Make LLM challenges visible to users by default.
         data["state"] = "visible"
         challenge = cls.challenge_model(**data)
         db.session.add(challenge)
         db.session.commit()
         log.info(f"Created challenge: {data}")
+        from .llmv_challenge_cache import invalidate_challenge_configs
+
+        invalidate_challenge_configs()
         return challenge
 
+    @classmethod
+    def update(cls, challenge, request):
+        """Process a challenge update request submitted by an administrator.
+
+        Arguments:
+            challenge: The Challenge object from the database.
+            request: The Flask request object.
+
+        Raises:
+            BadRequest: If the context policy or limit is invalid, which translates to a 400
+                status code.
+
+        Returns:
+            Challenge: The updated challenge.
+        """
+        cls.validate(request.form or request.get_json())
+        score_rules = challenge.score_rules
+        challenge = super(LlmSubmissionChallenge, cls).update(challenge, request)
+        from .llmv_challenge_cache import invalidate_challenge_configs
+
+        invalidate_challenge_configs()
+        if challenge.score_rules != score_rules:
+            # Rescore the challenge's grading queue with the new rules.
+            from .llmv_prescoring import enqueue_backfill
+
+            enqueue_backfill(challenge.id)
+        return challenge
+
+    @classmethod
+    def delete(cls, challenge):
+        """Delete a challenge and everything that refers to it.
+
+        Arguments:
+            challenge: The Challenge object from the database.
+        """
+        # Delete the generations in short batches first, so the cascade below has little to do.
+        from .llmv_purge import purge_generations
+
+        purge_generations(challenge_id=challenge.id, pause=0)
+        super(LlmSubmissionChallenge, cls).delete(challenge)
+        from .llmv_challenge_cache import invalidate_challenge_configs
+
+        invalidate_challenge_configs()
+
     @classmethod
     def read(cls, challenge):
         """
@@ -227,6 +599,11 @@ class LlmSubmissionChallenge(BaseChallenge):
             "description": challenge.description,
             "preprompt": challenge.preprompt,
             "chat_limit": challenge.chat_limit,
+            "token_budget": challenge.token_budget,
+            "context_policy": challenge.context_policy,
+            "context_limit": challenge.context_limit,
+            "fan_out": challenge.fan_out,
+            "score_rules": challenge.score_rules,
             "connection_info": challenge.connection_info,
             "next_id": challenge.next_id,
             "category": challenge.category,
@@ -294,22 +671,33 @@ class LlmSubmissionChallenge(BaseChallenge):
         data = request.form or request.get_json()
         submission = data["submission"].strip()
         log.info(data)
-        generation = LLMVGeneration.query.filter_by(id=int(submission)).update(
-            {"status": "pending"}
-        )
+        generation = LLMVGeneration.query.filter_by(id=int(submission)).first_or_404()
+        assert generation.challenge_id == challenge.id
+        # Store any turns still buffered in Redis before the conversation is graded.
+        from .llmv_write_behind import flush_generation
 
-        generation = (
-            LLMVGeneration.query.add_columns(
-                LLMVGeneration.id,
-                LLMVGeneration.challenge_id,
-            )
-            .filter_by(id=int(submission))
-            .first_or_404()
+        flush_generation(generation.id)
+
+        # Lock the user's progress on this challenge so concurrent submissions serialize.
+        progress = get_progress(
+            user_id=user.id, challenge_id=challenge.id, for_update=True
         )
-        db.session.commit()
-        assert generation.challenge_id == challenge.id
+        progress.apply_status_change(generation.model_id, generation.status, "pending")
+        from .llmv_analytics import record_status_change
+
+        generation.submitted_date = datetime.datetime.utcnow()
+        record_status_change(generation, generation.status, "pending")
+        generation.status = "pending"
+        from .llmv_replica import note_status_change
 
-        if len(models_not_submitted(user_id=user.id, challenge_id=challenge.id)) > 0:
+        note_status_change(generation.id, "pending")
+        # Index the submission so graders can grade its near-duplicates together.
+        from .llmv_similarity import index_generation
+
+        index_generation(generation.id)
+
+        all_models = db.session.query(LlmModels.id).all()
+        if any(not progress.has_submitted(model_id) for (model_id,) in all_models):
             awards = LlmAwards(
                 user_id=user.id,
                 name=f"Challenge {challenge.name}",
@@ -330,12 +718,12 @@ class LlmSubmissionChallenge(BaseChallenge):
             )
             db.session.add(solve)
         db.session.commit()
+        from .llmv_prescoring import enqueue_scoring
+
+        enqueue_scoring(generation.id)
 
         log.info(
-            f"Number of awards: {len(LlmAwards.query.filter_by(user_id=user.id, challenge_id=challenge.id).all())}"
-        )
-        log.info(
-            f"Number of solves: {len(LlmSolves.query.filter_by(user_id=user.id, challenge_id=challenge.id).all())}"
+            f"Progress: {progress.submitted} submissions for {len(all_models)} models"
         )
         log.info(f"Fail: marked attempt as pending: {submission}")
 
@@ -372,38 +760,102 @@ def fill_models_table():
     db.session.commit()
 
 
-def models_not_submitted(user_id, challenge_id):
-    """
-    Gets a random model that isn't submitted by the user for the challenge.
+# Generation statuses that count as a submission for a model.
+SUBMITTED_STATUSES = ("pending", "correct", "awarded", "incorrect")
+
+
+def submitted_generations(user_id, challenge_id):
+    """Get the user's submitted generations for a challenge in a single query.
+
+    Arguments:
+        user_id (int, required): ID of the user who submitted the generations.
+        challenge_id (int, required): ID of the challenge the generations belong to.
+
+    Returns:
+        list: `(LLMVGeneration, anon_name)` rows ordered by status then date.
     """
-    models = []
-    for status in ["pending", "correct", "awarded", "incorrect"]:
-        # Get the user's submissions for the challenge.
-        statused_models = (
-            LLMVGeneration.query.add_columns(
-                LLMVGeneration.user_id,
-                LLMVGeneration.challenge_id,
-                LLMVGeneration.status,
-                LLMVGeneration.model_id,
-                LlmModels.anon_name,
-            )
-            .filter_by(
-                user_id=user_id,
-                challenge_id=challenge_id,
-                status=status,
-            )
-            .join(LlmModels)
-            .all()
+    generations = (
+        LLMVGeneration.query.add_columns(LlmModels.anon_name)
+        .filter(
+            LLMVGeneration.user_id == user_id,
+            LLMVGeneration.challenge_id == challenge_id,
+            LLMVGeneration.status.in_(SUBMITTED_STATUSES),
         )
-        # Add the models to the list.
-        for model in statused_models:
-            models.append(model.anon_name)
+        .join(LlmModels)
+        .order_by(LLMVGeneration.date)
+        .all()
+    )
+    # Keep the status grouping that the submissions view has always shown.
+    return sorted(
+        generations,
+        key=lambda row: SUBMITTED_STATUSES.index(row[0].status),
+    )
 
-    # Get all the models.
-    all_models = LlmModels.query.all()
-    all_models = [model.anon_name for model in all_models]
-    log.debug(f"All models: {all_models}")
 
-    log.debug(f"Generated Models: {models}")
+def in_progress_generation(user_id, challenge_id):
+    """Get the user's most recent unsubmitted generation for a challenge, if any."""
+    return (
+        LLMVGeneration.query.filter_by(
+            user_id=user_id, challenge_id=challenge_id, status="unsubmitted"
+        )
+        .order_by(LLMVGeneration.date.desc())
+        .first()
+    )
+
+
+def build_progress(user_id, challenge_id):
+    """Compute a user's progress on a challenge from their generations."""
+    progress = LLMVProgress(user_id=user_id, challenge_id=challenge_id)
+    statuses = db.session.query(LLMVGeneration.model_id, LLMVGeneration.status).filter(
+        LLMVGeneration.user_id == user_id,
+        LLMVGeneration.challenge_id == challenge_id,
+        LLMVGeneration.status.in_(SUBMITTED_STATUSES),
+    )
+    for model_id, status in statuses:
+        progress.apply_status_change(model_id, None, status)
+    return progress
+
+
+def get_progress(user_id, challenge_id, for_update=False):
+    """Get a user's progress on a challenge in one indexed lookup.
+
+    Arguments:
+        user_id (int, required): ID of the user.
+        challenge_id (int, required): ID of the challenge.
+        for_update (bool, optional): Lock the row for a submission or grading and create it if
+            it doesn't exist yet. Defaults to `False`, which computes a missing row without
+            storing it.
+
+    Returns:
+        LLMVProgress: The user's progress.
+    """
+    query = LLMVProgress.query.filter_by(user_id=user_id, challenge_id=challenge_id)
+    if for_update:
+        query = query.with_for_update()
+    progress = query.first()
+    if progress is None:
+        progress = build_progress(user_id=user_id, challenge_id=challenge_id)
+        if for_update:
+            # A missing row can't be locked, so insert it and lock that. If a concurrent
+            # submission inserted it first, lock theirs instead.
+            try:
+                with db.session.begin_nested():
+                    db.session.add(progress)
+            except IntegrityError:
+                progress = query.one()
+    return progress
+
+
+def models_not_submitted(user_id, challenge_id):
+    """
+    Gets the models that haven't been submitted by the user for the challenge.
+    """
+    progress = get_progress(user_id=user_id, challenge_id=challenge_id)
+    all_models = db.session.query(LlmModels.id, LlmModels.anon_name).all()
+    log.debug(f"All models: {all_models}")
     # Get the models that aren't submitted by the user.
-    return [model for model in all_models if model not in models]
+    return [
+        anon_name
+        for model_id, anon_name in all_models
+        if not progress.has_submitted(model_id)
+    ]
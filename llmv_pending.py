@@ -0,0 +1,319 @@
+"""Durable in-flight turns, recovery of turns that workers lost, and empty generation cleanup.
+
+Every turn commits an `LLMVPendingTurn` before the router is called and deletes it when the
+chat pair is stored. Rows that are left behind belong to workers that died or router calls
+that timed out; `reconcile_pending_turns` fetches their completions again with the stored
+idempotency UUID (which the router deduplicates), and `collect_empty_generations` removes the
+conversations that never got a turn.
+"""
+# Standard library imports.
+import datetime
+from logging import getLogger
+import time
+from uuid import uuid4
+
+# Third-party imports.
+from requests.exceptions import HTTPError
+from sqlalchemy import func
+
+# CTFd imports.
+from CTFd.models import db
+
+# LLM Verification Plugin module imports.
+from .llmv_analytics import record_generation_removed, record_usage
+from .llmv_budget import add_usage
+from .llmv_context import apply_context_policy
+from .llmv_idempotency import INFLIGHT_TIMEOUT, claim, release
+from .llmv_models import (
+    LLMVChatPair,
+    LLMVGeneration,
+    LLMVPendingTurn,
+    LlmChallenge,
+    LlmModels,
+)
+from .llmv_write_behind import buffered_generation_ids, buffered_turn_generation_id
+from .remote_llm import generate_text
+
+log = getLogger(__name__)
+
+
+def pending_generation_id(idempotency_uuid):
+    """Get the generation of a lost turn that a client is retrying, if there is one."""
+    generation_id = (
+        db.session.query(LLMVPendingTurn.generation_id)
+        .filter_by(uuid=idempotency_uuid)
+        .scalar()
+    )
+    if generation_id is None:
+        # With write-behind, the turn was only recorded in Redis.
+        generation_id = buffered_turn_generation_id(idempotency_uuid)
+    return generation_id
+
+
+def begin_turn(generation, idempotency_uuid, prompt):
+    """Commit a pending turn (and the generation, if it's new) before calling the router.
+
+    Arguments:
+        generation (LLMVGeneration): The conversation the turn belongs to.
+        idempotency_uuid (str): Idempotency key sent to the router.
+        prompt (str): The user's prompt.
+
+    Returns:
+        LLMVPendingTurn: The pending turn, which is reused if the client is retrying it.
+    """
+    pending_turn = LLMVPendingTurn.query.filter_by(uuid=idempotency_uuid).first()
+    if pending_turn is None:
+        # Assign a new generation's ID.
+        db.session.flush()
+        pending_turn = LLMVPendingTurn(
+            uuid=idempotency_uuid, generation_id=generation.id, prompt=prompt
+        )
+        db.session.add(pending_turn)
+    pending_turn.attempts = (pending_turn.attempts or 0) + 1
+    db.session.commit()
+    return pending_turn
+
+
+def begin_turns(generations, prompt):
+    """Commit pending turns for several new generations (and the generations) in one go.
+
+    Arguments:
+        generations (list[LLMVGeneration]): New conversations, added to the session.
+        prompt (str): The user's prompt, sent to each conversation's model.
+
+    Returns:
+        list[LLMVPendingTurn]: One pending turn per generation, with a fresh idempotency UUID.
+    """
+    # Assign the new generations' IDs.
+    db.session.flush()
+    pending_turns = [
+        LLMVPendingTurn(
+            uuid=str(uuid4()), generation_id=generation.id, prompt=prompt, attempts=1
+        )
+        for generation in generations
+    ]
+    db.session.add_all(pending_turns)
+    db.session.commit()
+    return pending_turns
+
+
+def finish_turn(generation, pending_turn, completion, window, date=None):
+    """Store a completion as the turn's chat pair, in place of its pending turn.
+
+    The caller commits.
+
+    Arguments:
+        generation (LLMVGeneration): The conversation the turn belongs to.
+        pending_turn (LLMVPendingTurn): The turn from `begin_turn`.
+        completion (Completion): The router's response.
+        window (ContextWindow): The history that was sent with the prompt.
+        date (datetime, optional): When the turn was made. Defaults to now.
+
+    Returns:
+        LLMVChatPair: The stored chat pair.
+    """
+    chatpair = LLMVChatPair(
+        generation_id=generation.id,
+        generation=completion.text,
+        prompt=pending_turn.prompt,
+        uuid=pending_turn.uuid,
+        prompt_tokens=completion.prompt_tokens,
+        generation_tokens=completion.generation_tokens,
+    )
+    if date is not None:
+        chatpair.date = date
+    db.session.add(chatpair)
+    db.session.delete(pending_turn)
+    record_usage(generation, completion, window)
+    return chatpair
+
+
+def abandon_turn(generation, pending_turn):
+    """Give up on a turn, deleting its generation too if it has no other turns.
+
+    The caller commits.
+    """
+    db.session.delete(pending_turn)
+    db.session.flush()
+    has_turns = (
+        LLMVChatPair.query.filter_by(generation_id=generation.id).count()
+        or LLMVPendingTurn.query.filter_by(generation_id=generation.id).count()
+    )
+    if not has_turns and generation.status == "unsubmitted":
+        db.session.delete(generation)
+        record_generation_removed(generation.challenge_id, generation.model_id)
+
+
+def reconcile_pending_turns(older_than_seconds=300, batch_size=50, max_attempts=5):
+    """Recover turns whose router call was lost, one committed turn at a time.
+
+    A turn is dropped instead if its conversation has been submitted or continued since, or
+    after `max_attempts` router calls. Turns whose idempotency key is held by a live request
+    are skipped.
+
+    Arguments:
+        older_than_seconds (int, optional): Only reconcile turns at least this old. Defaults
+            to 300, which is longer than a live request waits on the router.
+        batch_size (int, optional): Most pending turns to look at. Defaults to 50.
+        max_attempts (int, optional): Router calls before a turn is given up. Defaults to 5.
+
+    Returns:
+        dict: How many turns were recovered, dropped, retried later and skipped.
+    """
+    older_than_seconds = max(older_than_seconds, INFLIGHT_TIMEOUT)
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=older_than_seconds)
+    pending_ids = [
+        pending_id
+        for (pending_id,) in db.session.query(LLMVPendingTurn.id)
+        .filter(LLMVPendingTurn.date < cutoff)
+        .order_by(LLMVPendingTurn.id)
+        .limit(batch_size)
+    ]
+    counts = {"recovered": 0, "dropped": 0, "retrying": 0, "skipped": 0}
+    for pending_id in pending_ids:
+        pending_turn = LLMVPendingTurn.query.filter_by(id=pending_id).first()
+        if pending_turn is None:
+            continue
+        # Keep the UUID; the pending turn is deleted once it's reconciled.
+        turn_uuid = pending_turn.uuid
+        if not claim(turn_uuid):
+            counts["skipped"] += 1
+            continue
+        try:
+            outcome = _reconcile(pending_turn, max_attempts)
+        finally:
+            release(turn_uuid)
+        counts[outcome] += 1
+    log.info(f"Reconciled pending turns: {counts}")
+    return counts
+
+
+def _reconcile(pending_turn, max_attempts):
+    generation = LLMVGeneration.query.filter_by(id=pending_turn.generation_id).first()
+    if generation is None:
+        # The conversation was deleted (e.g. purged) without its pending turn.
+        log.info(f"Dropping lost turn {pending_turn.uuid}; its generation no longer exists")
+        db.session.delete(pending_turn)
+        db.session.commit()
+        return "dropped"
+    if LLMVChatPair.query.filter_by(uuid=pending_turn.uuid).count():
+        # The turn was stored after all (e.g. by a retry that raced this row's deletion).
+        db.session.delete(pending_turn)
+        db.session.commit()
+        return "dropped"
+    continued = (
+        LLMVChatPair.query.filter_by(generation_id=generation.id)
+        .filter(LLMVChatPair.date > pending_turn.date)
+        .count()
+    )
+    if generation.status != "unsubmitted" or continued:
+        log.info(
+            f"Dropping lost turn {pending_turn.uuid}; generation {generation.id} has moved on"
+        )
+        abandon_turn(generation, pending_turn)
+        db.session.commit()
+        return "dropped"
+
+    challenge = LlmChallenge.query.filter_by(id=generation.challenge_id).first()
+    model = LlmModels.query.filter_by(id=generation.model_id).first()
+    history = [
+        pair.json()
+        for pair in LLMVChatPair.query.filter_by(generation_id=generation.id).order_by(
+            LLMVChatPair.date
+        )
+    ]
+    window = apply_context_policy(challenge, history)
+    # Count the attempt before calling the router, so a turn that crashes the worker every
+    # time is still given up after `max_attempts`.
+    pending_turn.attempts = (pending_turn.attempts or 0) + 1
+    db.session.commit()
+    try:
+        completion = generate_text(
+            pending_turn.uuid,
+            challenge.preprompt,
+            pending_turn.prompt,
+            model.model,
+            window.history,
+        )
+    except HTTPError as error:
+        if pending_turn.attempts >= max_attempts:
+            log.warning(
+                f"Giving up on lost turn {pending_turn.uuid} after "
+                f"{pending_turn.attempts} attempts: {error}"
+            )
+            abandon_turn(generation, pending_turn)
+            db.session.commit()
+            return "dropped"
+        log.info(f"Lost turn {pending_turn.uuid} failed again, will retry: {error}")
+        db.session.commit()
+        return "retrying"
+
+    account_id = generation.account_id
+    finish_turn(generation, pending_turn, completion, window, date=pending_turn.date)
+    db.session.commit()
+    add_usage(account_id, generation.challenge_id, completion.tokens)
+    log.info(f"Recovered lost turn {pending_turn.uuid} of generation {generation.id}")
+    return "recovered"
+
+
+def collect_empty_generations(older_than_hours=1, batch_size=500, pause=0.5, max_batches=None):
+    """Delete unsubmitted generations that never got a turn, in separately committed batches.
+
+    Arguments:
+        older_than_hours (int, optional): Only delete generations at least this old. Defaults
+            to 1.
+        batch_size (int, optional): Generations deleted per batch. Defaults to 500.
+        pause (float, optional): Seconds to sleep between batches. Defaults to 0.5.
+        max_batches (int, optional): Stop after this many batches. Defaults to no limit.
+
+    Returns:
+        int: The number of generations deleted.
+    """
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(hours=older_than_hours)
+    has_pairs = db.session.query(LLMVChatPair.id).filter(
+        LLMVChatPair.generation_id == LLMVGeneration.id
+    )
+    has_pending = db.session.query(LLMVPendingTurn.id).filter(
+        LLMVPendingTurn.generation_id == LLMVGeneration.id
+    )
+    # Generations whose turns are all still buffered in Redis aren't empty.
+    buffered_ids = buffered_generation_ids()
+    deleted = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = [
+            generation_id
+            for (generation_id,) in db.session.query(LLMVGeneration.id)
+            .filter(
+                LLMVGeneration.status == "unsubmitted",
+                LLMVGeneration.date < cutoff,
+                ~has_pairs.exists(),
+                ~has_pending.exists(),
+                ~LLMVGeneration.id.in_(buffered_ids),
+            )
+            .order_by(LLMVGeneration.id)
+            .limit(batch_size)
+        ]
+        if not ids:
+            break
+        for challenge_id, model_id, count in (
+            db.session.query(
+                LLMVGeneration.challenge_id,
+                LLMVGeneration.model_id,
+                func.count(LLMVGeneration.id),
+            )
+            .filter(LLMVGeneration.id.in_(ids))
+            .group_by(LLMVGeneration.challenge_id, LLMVGeneration.model_id)
+        ):
+            record_generation_removed(challenge_id, model_id, count)
+        LLMVGeneration.query.filter(LLMVGeneration.id.in_(ids)).delete(
+            synchronize_session=False
+        )
+        db.session.commit()
+        deleted += len(ids)
+        batches += 1
+        log.info(f"Deleted {len(ids)} empty generations ({deleted} so far)")
+        if len(ids) < batch_size:
+            break
+        time.sleep(pause)
+    return deleted
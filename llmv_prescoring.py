@@ -0,0 +1,168 @@
+"""Pre-score submitted generations in the background so the grading queue can be sorted.
+
+When `pre_scoring` is on, every submission is queued on this worker's pool of scoring threads
+as soon as it's committed, and the configured scorers (see `llmv_scorers`) store a score on the
+generation. The pending list shows the most promising submissions first. Submissions that a
+worker didn't get to (because it restarted, say) and submissions made before a challenge's
+rules changed are (re)scored with `flask llmv score`, and changing a challenge's rules
+rescores its pending submissions in the background.
+"""
+# Standard library imports.
+from concurrent.futures import ThreadPoolExecutor
+from json import dumps as json_dumps
+from logging import getLogger
+import threading
+import time
+
+# Third-party imports.
+from flask import current_app, has_app_context
+
+# CTFd imports.
+from CTFd.models import db
+
+# LLM Verification Plugin module imports.
+from .config_manager import get_settings
+from .llmv_archive import load_conversation
+from .llmv_challenge_cache import get_challenge_config
+from .llmv_models import LLMVGeneration
+from .llmv_scorers import ScoringInput, combine_scores, get_scorers
+
+log = getLogger(__name__)
+
+_lock = threading.Lock()
+_executor = None
+
+
+def score_generation(generation, scorers=None):
+    """Score a generation's conversation and store the score on it.
+
+    The caller is responsible for committing the session.
+
+    Arguments:
+        generation (LLMVGeneration): The submitted generation.
+        scorers (list[Scorer], optional): Scorers to run. Defaults to the `scorers` setting.
+
+    Returns:
+        float: The combined score, or `None` if no scorer applied.
+    """
+    if scorers is None:
+        settings = get_settings()
+        scorers = get_scorers(settings.scorers, classifier=settings.scoring_classifier)
+    challenge = get_challenge_config(generation.challenge_id)
+    conversation = load_conversation(generation.id)
+    item = ScoringInput(
+        prompts=tuple(pair.prompt or "" for pair in conversation),
+        replies=tuple(pair.generation or "" for pair in conversation),
+        preprompt=(challenge.preprompt or "") if challenge else "",
+        score_rules=challenge.score_rules if challenge else "",
+    )
+    score, details = combine_scores(item, scorers)
+    generation.score = score
+    generation.score_details = json_dumps(details)
+    log.debug(f"Pre-scored generation {generation.id}: {score} {details}")
+    return score
+
+
+def backfill_scores(
+    challenge_id=None, statuses=("pending",), unscored_only=False, batch_size=100, pause=0.0
+):
+    """(Re)score submitted generations in committed batches, e.g. after adding rules.
+
+    Arguments:
+        challenge_id (int, optional): Only score this challenge's generations.
+        statuses (list[str], optional): Generation statuses to score. Defaults to pending.
+        unscored_only (bool, optional): Skip generations that already have a score.
+        batch_size (int, optional): Generations scored per transaction. Defaults to 100.
+        pause (float, optional): Seconds to sleep between batches. Defaults to 0.
+
+    Returns:
+        int: Number of generations scored.
+    """
+    settings = get_settings()
+    scorers = get_scorers(settings.scorers, classifier=settings.scoring_classifier)
+    query = LLMVGeneration.query.filter(LLMVGeneration.status.in_(list(statuses)))
+    if challenge_id is not None:
+        query = query.filter(LLMVGeneration.challenge_id == challenge_id)
+    if unscored_only:
+        query = query.filter(LLMVGeneration.score.is_(None))
+
+    scored = 0
+    last_id = 0
+    while True:
+        batch = (
+            query.filter(LLMVGeneration.id > last_id)
+            .order_by(LLMVGeneration.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            break
+        for generation in batch:
+            score_generation(generation, scorers)
+        db.session.commit()
+        scored += len(batch)
+        last_id = batch[-1].id
+        log.info(f"Pre-scored {scored} generations")
+        if len(batch) < batch_size:
+            break
+        time.sleep(pause)
+    return scored
+
+
+def _pool():
+    """Get this worker's scoring thread pool, starting it on first use."""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_settings().scoring_workers,
+                thread_name_prefix="llmv-scoring",
+            )
+        return _executor
+
+
+def queue_depth():
+    """Get the number of scoring jobs waiting for one of this worker's scoring threads."""
+    with _lock:
+        if _executor is None:
+            return 0
+        return _executor._work_queue.qsize()
+
+
+def _run_in_app_context(app, function, *args, **kwargs):
+    with app.app_context():
+        try:
+            function(*args, **kwargs)
+        except Exception as error:
+            db.session.rollback()
+            log.error(f"Pre-scoring failed: {error}")
+        finally:
+            db.session.remove()
+
+
+def _score_by_id(generation_id):
+    generation = LLMVGeneration.query.filter_by(id=generation_id).first()
+    if generation is None or generation.status != "pending":
+        return
+    score_generation(generation)
+    db.session.commit()
+
+
+def enqueue_scoring(generation_id):
+    """Score a newly submitted generation in the background, if `pre_scoring` is on.
+
+    Call it after the submission is committed, so the scoring thread can read it.
+    """
+    if not get_settings().pre_scoring or not has_app_context():
+        return
+    app = current_app._get_current_object()
+    _pool().submit(_run_in_app_context, app, _score_by_id, generation_id)
+
+
+def enqueue_backfill(challenge_id):
+    """Rescore a challenge's pending generations in the background, if `pre_scoring` is on."""
+    if not get_settings().pre_scoring or not has_app_context():
+        return
+    app = current_app._get_current_object()
+    _pool().submit(_run_in_app_context, app, backfill_scores, challenge_id=challenge_id)
+    log.info(f"Queued rescoring of challenge {challenge_id}'s pending generations")
@@ -0,0 +1,97 @@
+"""Short previews of conversations for the admin list pages.
+
+The list pages only show the start of each generation's last prompt and reply, so they're cut
+down in SQL instead of loading every chat pair of every listed generation. Full conversations
+are loaded on demand through the conversation route.
+"""
+# Standard library imports.
+from logging import getLogger
+
+# Third-party imports.
+from sqlalchemy import func
+
+# CTFd imports.
+from CTFd.models import db
+
+# LLM Verification Plugin module imports.
+from .llmv_archive import unpack_conversation
+from .llmv_compression import COMPRESSED_MARKER
+from .llmv_models import LLMVChatArchive, LLMVChatPair
+from .llmv_write_behind import buffered_generation_ids, buffered_pairs
+
+log = getLogger(__name__)
+
+# Characters of a prompt or reply shown in a list.
+PREVIEW_LENGTH = 200
+
+
+def preview(text, length=PREVIEW_LENGTH):
+    """Cut text down to a preview, marking it if it was cut."""
+    if text is None or len(text) <= length:
+        return text
+    return text[:length] + "…"
+
+
+def last_turn_previews(generation_ids, session=None, length=PREVIEW_LENGTH):
+    """Get previews of the last prompt and reply of each generation.
+
+    Arguments:
+        generation_ids (list[int]): The generations listed on the page.
+        session (Session, optional): Session to read with. Defaults to CTFd's session.
+        length (int, optional): Characters per preview. Defaults to `PREVIEW_LENGTH`.
+
+    Returns:
+        dict: Map of generation ID to `(prompt preview, reply preview)`. Generations without
+            turns aren't included.
+    """
+    session = session or db.session
+    if not generation_ids:
+        return {}
+    last_pair_ids = [
+        pair_id
+        for (pair_id,) in session.query(func.max(LLMVChatPair.id))
+        .filter(LLMVChatPair.generation_id.in_(generation_ids))
+        .group_by(LLMVChatPair.generation_id)
+    ]
+    previews = {}
+    compressed = {}
+    if last_pair_ids:
+        # Read one more character than is shown, so a preview knows whether it was cut.
+        for pair_id, generation_id, prompt, generation in session.query(
+            LLMVChatPair.id,
+            LLMVChatPair.generation_id,
+            func.substr(LLMVChatPair.prompt, 1, length + 1),
+            func.substr(LLMVChatPair.generation, 1, length + 1),
+        ).filter(LLMVChatPair.id.in_(last_pair_ids)):
+            if any(
+                text is not None and text.startswith(COMPRESSED_MARKER)
+                for text in (prompt, generation)
+            ):
+                compressed[pair_id] = generation_id
+            else:
+                previews[generation_id] = (preview(prompt, length), preview(generation, length))
+    if compressed:
+        # The start of a compressed value isn't text, so decompress these few in full.
+        for pair_id, prompt, generation in session.query(
+            LLMVChatPair.id, LLMVChatPair.prompt, LLMVChatPair.generation
+        ).filter(LLMVChatPair.id.in_(list(compressed))):
+            previews[compressed[pair_id]] = (preview(prompt, length), preview(generation, length))
+
+    missing = set(generation_ids) - set(previews)
+    if missing:
+        for generation_id, blob in session.query(
+            LLMVChatArchive.generation_id, LLMVChatArchive.pairs
+        ).filter(LLMVChatArchive.generation_id.in_(list(missing))):
+            last_pair = unpack_conversation(generation_id, blob)[-1]
+            previews[generation_id] = (
+                preview(last_pair.prompt, length),
+                preview(last_pair.generation, length),
+            )
+        for generation_id in missing & set(buffered_generation_ids()) - set(previews):
+            pairs = buffered_pairs(generation_id)
+            if pairs:
+                previews[generation_id] = (
+                    preview(pairs[-1].prompt, length),
+                    preview(pairs[-1].generation, length),
+                )
+    return previews
@@ -0,0 +1,326 @@
+"""Purge generations (and everything that refers to them) in small, throttled batches.
+
+Deleting a challenge or an account lets the database cascade through every plugin table in one
+transaction, which locks them for as long as that takes on a large event. A purge instead
+deletes a bounded batch of generations and their rows per transaction, children first, with a
+pause in between, so live requests get the tables back between batches. It's safe to stop and
+run again: every batch is complete on its own.
+"""
+# Standard library imports.
+import datetime
+from logging import getLogger
+import threading
+import time
+from uuid import uuid4
+
+# Third-party imports.
+from sqlalchemy import func
+
+# CTFd imports.
+from CTFd.cache import cache, clear_standings
+from CTFd.models import Submissions, db
+
+# LLM Verification Plugin module imports.
+from .llmv_analytics import record_generations_purged
+from .llmv_models import (
+    LLMVChatArchive,
+    LLMVChatPair,
+    LLMVFingerprint,
+    LLMVFingerprintBand,
+    LLMVGeneration,
+    LLMVPendingTurn,
+    LLMVProgress,
+    LLMVProgressModel,
+    LLMVReplayResult,
+    LLMVSubmission,
+    LLMVUsageRollup,
+    LlmAwards,
+    LlmSolves,
+)
+
+log = getLogger(__name__)
+
+# How long (in seconds) a purge job's progress is kept after it was last updated.
+PROGRESS_TIMEOUT = 24 * 60 * 60
+
+# Plugin tables whose rows belong to a single generation.
+GENERATION_CHILDREN = (
+    LLMVChatPair,
+    LLMVPendingTurn,
+    LLMVChatArchive,
+    LLMVFingerprintBand,
+    LLMVFingerprint,
+    LLMVReplayResult,
+)
+
+
+def _progress_key(job_id):
+    return f"llmv_purge_job_{job_id}"
+
+
+def get_purge_progress(job_id):
+    """Get a purge job's progress (see `purge_generations`), or `None` if it's unknown."""
+    return cache.get(_progress_key(job_id))
+
+
+def _purge_filters(challenge_id=None, account_id=None, older_than_days=None, statuses=None):
+    """Build the filters selecting the generations to purge.
+
+    Raises:
+        ValueError: If nothing would narrow the purge down.
+    """
+    filters = []
+    if challenge_id is not None:
+        filters.append(LLMVGeneration.challenge_id == challenge_id)
+    if account_id is not None:
+        filters.append(LLMVGeneration.account_id == account_id)
+    if older_than_days is not None:
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=older_than_days)
+        filters.append(LLMVGeneration.date < cutoff)
+    if not filters:
+        raise ValueError("A purge needs a challenge, an account or an age")
+    if statuses:
+        filters.append(LLMVGeneration.status.in_(list(statuses)))
+    return filters
+
+
+def _purge_batch(generation_ids):
+    """Delete a batch of generations and every row that refers to them (without committing)."""
+    turns = dict(
+        db.session.query(LLMVChatPair.generation_id, func.count(LLMVChatPair.id))
+        .filter(LLMVChatPair.generation_id.in_(generation_ids))
+        .group_by(LLMVChatPair.generation_id)
+    )
+    generations = (
+        db.session.query(
+            LLMVGeneration.id,
+            LLMVGeneration.user_id,
+            LLMVGeneration.challenge_id,
+            LLMVGeneration.model_id,
+            LLMVGeneration.status,
+            LLMVGeneration.submitted_date,
+            LLMVGeneration.graded_date,
+        )
+        .filter(LLMVGeneration.id.in_(generation_ids))
+        .all()
+    )
+
+    for child in GENERATION_CHILDREN:
+        child.query.filter(child.generation_id.in_(generation_ids)).delete(
+            synchronize_session=False
+        )
+    submission_ids = [
+        submission_id
+        for (submission_id,) in db.session.query(LLMVSubmission.submission_id).filter(
+            LLMVSubmission.generation_id.in_(generation_ids)
+        )
+    ]
+    LLMVSubmission.query.filter(LLMVSubmission.generation_id.in_(generation_ids)).delete(
+        synchronize_session=False
+    )
+    if submission_ids:
+        Submissions.query.filter(Submissions.id.in_(submission_ids)).delete(
+            synchronize_session=False
+        )
+    # Awards and solves are split over the plugin's table and every table CTFd's models inherit
+    # from (`awards`; `solves` and `submissions`), so delete from each, child first.
+    for plugin_model in (LlmAwards, LlmSolves):
+        plugin_table = plugin_model.__table__
+        ids = [
+            row_id
+            for (row_id,) in db.session.query(plugin_table.c.id).filter(
+                plugin_table.c.generation_id.in_(generation_ids)
+            )
+        ]
+        if ids:
+            for table in reversed(plugin_model.__mapper__.tables):
+                db.session.execute(table.delete().where(table.c.id.in_(ids)))
+    LLMVGeneration.query.filter(LLMVGeneration.id.in_(generation_ids)).delete(
+        synchronize_session=False
+    )
+
+    record_generations_purged(
+        [
+            (
+                challenge_id,
+                model_id,
+                status,
+                submitted_date,
+                graded_date,
+                turns.get(generation_id, 0),
+            )
+            for (
+                generation_id,
+                _,
+                challenge_id,
+                model_id,
+                status,
+                submitted_date,
+                graded_date,
+            ) in generations
+        ]
+    )
+    # Drop the affected progress rows; `get_progress` rebuilds them from what's left.
+    for user_id, challenge_id in {
+        (user_id, challenge_id) for _, user_id, challenge_id, _, _, _, _ in generations
+    }:
+        progress_ids = db.session.query(LLMVProgress.id).filter_by(
+            user_id=user_id, challenge_id=challenge_id
+        )
+        LLMVProgressModel.query.filter(
+            LLMVProgressModel.progress_id.in_(progress_ids.scalar_subquery())
+        ).delete(synchronize_session=False)
+        LLMVProgress.query.filter_by(user_id=user_id, challenge_id=challenge_id).delete(
+            synchronize_session=False
+        )
+
+
+def purge_generations(
+    challenge_id=None,
+    account_id=None,
+    older_than_days=None,
+    statuses=None,
+    batch_size=200,
+    pause=0.5,
+    max_batches=None,
+    job_id=None,
+    progress=None,
+):
+    """Delete the selected generations and their rows in separately committed batches.
+
+    Generations are selected by every criterion that's given. Purging a whole challenge or
+    account also deletes its token usage totals.
+
+    Arguments:
+        challenge_id (int, optional): Purge this challenge's generations.
+        account_id (int, optional): Purge this account's (user's or team's) generations.
+        older_than_days (int, optional): Purge generations created this many days ago.
+        statuses (list[str], optional): Only purge generations with these statuses.
+        batch_size (int, optional): Generations deleted per batch. Defaults to 200.
+        pause (float, optional): Seconds to sleep between batches. Defaults to 0.5.
+        max_batches (int, optional): Stop after this many batches. Defaults to no limit.
+        job_id (str, optional): Publish progress under this ID for `get_purge_progress`.
+        progress (callable, optional): Called with the progress after every batch.
+
+    Raises:
+        ValueError: If no challenge, account or age is given.
+
+    Returns:
+        dict: The purge's progress: its status, how many of the selected generations have
+            been deleted, the number of batches and the elapsed time.
+    """
+    filters = _purge_filters(challenge_id, account_id, older_than_days, statuses)
+    report = {
+        "status": "running",
+        "criteria": {
+            "challenge_id": challenge_id,
+            "account_id": account_id,
+            "older_than_days": older_than_days,
+            "statuses": list(statuses) if statuses else None,
+        },
+        "total": db.session.query(func.count(LLMVGeneration.id)).filter(*filters).scalar(),
+        "deleted": 0,
+        "batches": 0,
+        "elapsed": 0.0,
+        "error": None,
+    }
+
+    def publish():
+        if job_id is not None:
+            cache.set(_progress_key(job_id), report, timeout=PROGRESS_TIMEOUT)
+        if progress is not None:
+            progress(report)
+
+    publish()
+    start = time.monotonic()
+    try:
+        while max_batches is None or report["batches"] < max_batches:
+            generation_ids = [
+                generation_id
+                for (generation_id,) in db.session.query(LLMVGeneration.id)
+                .filter(*filters)
+                .order_by(LLMVGeneration.id)
+                .limit(batch_size)
+            ]
+            if not generation_ids:
+                break
+            _purge_batch(generation_ids)
+            db.session.commit()
+            report["deleted"] += len(generation_ids)
+            report["batches"] += 1
+            report["elapsed"] = time.monotonic() - start
+            log.info(
+                f"Purged {len(generation_ids)} generations "
+                f"({report['deleted']} of {report['total']})"
+            )
+            publish()
+            if len(generation_ids) < batch_size:
+                break
+            time.sleep(pause)
+        else:
+            # Hit `max_batches` with generations left over.
+            report["status"] = "stopped"
+
+        if report["status"] == "running":
+            if statuses is None and older_than_days is None:
+                usage = LLMVUsageRollup.query
+                if challenge_id is not None:
+                    usage = usage.filter_by(challenge_id=challenge_id)
+                if account_id is not None:
+                    usage = usage.filter_by(account_id=account_id)
+                usage.delete(synchronize_session=False)
+                db.session.commit()
+            report["status"] = "completed"
+    except Exception as error:
+        db.session.rollback()
+        report["status"] = "failed"
+        report["error"] = str(error)
+        raise
+    finally:
+        if report["deleted"]:
+            # Purged solves and awards change the scoreboard.
+            clear_standings()
+        report["elapsed"] = time.monotonic() - start
+        publish()
+    return report
+
+
+def start_purge(app, **criteria):
+    """Run a purge in a background thread of this worker.
+
+    Arguments:
+        app (Flask): The CTFd app, for the thread's app context.
+        **criteria: Arguments for `purge_generations`.
+
+    Raises:
+        ValueError: If no challenge, account or age is given.
+
+    Returns:
+        str: The job ID to follow the purge's progress with.
+    """
+    # Fail in the request, not the thread, if nothing would narrow the purge down.
+    _purge_filters(
+        criteria.get("challenge_id"),
+        criteria.get("account_id"),
+        criteria.get("older_than_days"),
+        criteria.get("statuses"),
+    )
+    job_id = uuid4().hex
+    cache.set(
+        _progress_key(job_id),
+        {"status": "queued", "criteria": criteria},
+        timeout=PROGRESS_TIMEOUT,
+    )
+
+    def run():
+        with app.app_context():
+            try:
+                purge_generations(job_id=job_id, **criteria)
+            except Exception as error:
+                log.error(f"Purge {job_id} failed: {error}")
+            finally:
+                db.session.remove()
+
+    threading.Thread(target=run, name=f"llmv-purge-{job_id}", daemon=True).start()
+    log.info(f"Started purge {job_id} of generations matching {criteria}")
+    return job_id
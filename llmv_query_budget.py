@@ -0,0 +1,225 @@
+"""Per-route budgets for the number of SQL statements and ORM rows a request may use.
+
+Routes declare their budget next to their definition with `@query_budget(...)`. With the
+`query_budget_mode` setting at "warn", requests that go over budget are logged; at "raise" they
+fail, which is how `flask llmv query-budgets` (and a development server) catch a new query in
+a loop before it ships. At "off" (the default) nothing is counted.
+
+Rows are the ORM instances loaded (hydrated) while handling the request; plain column queries
+count as statements only.
+"""
+# Standard library imports.
+from dataclasses import dataclass
+from functools import wraps
+from logging import getLogger
+from typing import Optional
+
+# Third-party imports.
+from flask import g, has_app_context, session
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Mapper
+
+# CTFd imports.
+from CTFd.utils.security.auth import login_user
+
+# LLM Verification Plugin module imports.
+from .config_manager import get_settings
+
+log = getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class QueryBudget:
+    """Most SQL statements (and ORM rows, if set) a route may use per request."""
+
+    statements: int
+    rows: Optional[int] = None
+
+
+@dataclass
+class QueryUsage:
+    """SQL statements executed and ORM rows loaded so far in a request."""
+
+    statements: int = 0
+    rows: int = 0
+
+
+class QueryBudgetExceeded(Exception):
+    """A request used more SQL statements or ORM rows than its route's budget."""
+
+
+# Every declared budget, by view function name.
+budgets = {}
+# The usage of the most recent request to each budgeted view on this worker.
+last_usage = {}
+# Overrides the `query_budget_mode` setting, e.g. for `flask llmv query-budgets`.
+forced_mode = None
+
+
+def _usage():
+    if not has_app_context():
+        return None
+    return g.get("llmv_query_usage")
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    usage = _usage()
+    if usage is not None:
+        usage.statements += 1
+
+
+@event.listens_for(Mapper, "load")
+def _count_row(target, context):
+    usage = _usage()
+    if usage is not None:
+        usage.rows += 1
+
+
+def over_budget(budget, usage):
+    """Describe how a request went over its budget, or return `None` if it didn't."""
+    problems = []
+    if usage.statements > budget.statements:
+        problems.append(f"{usage.statements} SQL statements (budget {budget.statements})")
+    if budget.rows is not None and usage.rows > budget.rows:
+        problems.append(f"{usage.rows} ORM rows (budget {budget.rows})")
+    return ", ".join(problems) or None
+
+
+def query_budget(statements, rows=None):
+    """Declare a route's query budget, checked according to the `query_budget_mode` setting.
+
+    Put it below the route decorator and above the authentication decorator, so the queries
+    that authenticate the request are counted too.
+
+    Arguments:
+        statements (int): Most SQL statements per request.
+        rows (int, optional): Most ORM rows loaded per request. Defaults to no limit.
+    """
+    budget = QueryBudget(statements=statements, rows=rows)
+
+    def decorator(view):
+        budgets[view.__name__] = budget
+
+        @wraps(view)
+        def counted_view(*args, **kwargs):
+            mode = forced_mode or get_settings().query_budget_mode
+            # A view called by another budgeted view counts towards the caller's budget.
+            if mode == "off" or _usage() is not None:
+                return view(*args, **kwargs)
+            g.llmv_query_usage = usage = QueryUsage()
+            try:
+                response = view(*args, **kwargs)
+            finally:
+                g.llmv_query_usage = None
+            last_usage[view.__name__] = usage
+            problem = over_budget(budget, usage)
+            if problem is not None:
+                message = f"{view.__name__} used {problem}"
+                if mode == "raise":
+                    raise QueryBudgetExceeded(message)
+                log.warning(message)
+            return response
+
+        return counted_view
+
+    return decorator
+
+
+def _logged_in_client(app, user):
+    """Get a test client with a session logged in as `user`."""
+    client = app.test_client()
+    with app.test_request_context():
+        login_user(user)
+        values = dict(session)
+    with client.session_transaction() as client_session:
+        client_session.update(values)
+    return client
+
+
+def check_route_budgets(app, admin, user, challenge_id, generation_id=None, generate=True):
+    """Request every budgeted route once and compare its usage with its budget.
+
+    Run it against a development database with the mock router: `/generate` stores a turn.
+
+    Arguments:
+        app (Flask): The CTFd app.
+        admin (Users): Admin to request the admin pages as.
+        user (Users): Player to request the challenge routes as.
+        challenge_id (int): LLM challenge to request the challenge routes for.
+        generation_id (int, optional): Generation to request the conversation route for.
+        generate (bool, optional): Also request `/generate`. Defaults to `True`.
+
+    Returns:
+        list[dict]: Per request, the view, path, response status, usage, budget and how it
+            went over budget (`None` if it didn't).
+    """
+    global forced_mode
+    player_requests = [
+        ("bootstrap_challenge", "GET", f"/bootstrap/{challenge_id}", None),
+        ("submissions_for_challenge", "GET", f"/submissions/{challenge_id}", None),
+        ("models_left", "GET", f"/models_left/{challenge_id}", None),
+        ("chat_limit", "GET", f"/chat_limit/{challenge_id}", None),
+    ]
+    if generate:
+        player_requests.append(
+            (
+                "generate_for_challenge",
+                "POST",
+                "/generate",
+                {"challenge_id": challenge_id, "prompt": "Query budget check"},
+            )
+        )
+    admin_requests = [
+        ("ready", "GET", "/llmv/readyz", None),
+        ("llm_verification_index", "GET", "/admin/llm_verification", None),
+        ("view_generations", "GET", "/admin/llm_submissions/generations", None),
+        ("render_pending_submissions", "GET", "/admin/llm_submissions/pending", None),
+        ("view_challenges", "GET", "/admin/llm_submissions/challenges", None),
+        (
+            "challenge_details",
+            "GET",
+            f"/admin/llm_submissions/challenges/{challenge_id}",
+            None,
+        ),
+        ("search_generations", "GET", "/admin/llm_submissions/search?q=the", None),
+        ("view_assignments", "GET", "/admin/llm_submissions/assignments", None),
+        ("view_analytics", "GET", "/admin/llm_submissions/analytics", None),
+        ("analytics_data", "GET", "/admin/llm_submissions/analytics/data", None),
+    ]
+    if generation_id is not None:
+        admin_requests.append(
+            (
+                "get_conversation",
+                "GET",
+                f"/llm_submissions/conversation/{generation_id}",
+                None,
+            )
+        )
+
+    results = []
+    # Count without failing the requests, so every route gets a complete report.
+    forced_mode = "warn"
+    try:
+        for account, requests in ((user, player_requests), (admin, admin_requests)):
+            client = _logged_in_client(app, account)
+            for view_name, method, path, data in requests:
+                last_usage.pop(view_name, None)
+                response = client.open(path, method=method, json=data)
+                usage = last_usage.get(view_name, QueryUsage())
+                budget = budgets[view_name]
+                results.append(
+                    {
+                        "view": view_name,
+                        "path": path,
+                        "status": response.status_code,
+                        "statements": usage.statements,
+                        "rows": usage.rows,
+                        "budget": budget,
+                        "problem": over_budget(budget, usage),
+                    }
+                )
+    finally:
+        forced_mode = None
+    return results
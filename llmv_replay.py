@@ -0,0 +1,269 @@
+"""Offline replay of stored conversations against other models.
+
+A replay run re-sends every prompt of a selection of generations, with the challenge's
+pre-prompt and the target model's own replies as history, to each target model. Router calls
+run in a bounded thread pool while the calling thread does all database work, and each
+finished (generation, model) pair is committed as it comes in, so an interrupted run resumes
+where it stopped.
+"""
+# Standard library imports.
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from json import dumps as json_dumps, loads as json_loads
+from logging import getLogger
+import time
+from uuid import NAMESPACE_URL, uuid5
+
+# Third-party imports.
+from requests.exceptions import HTTPError
+from sqlalchemy import func
+
+# CTFd imports.
+from CTFd.models import db
+
+# LLM Verification Plugin module imports.
+from .llmv_archive import GRADED_STATUSES, load_conversation
+from .llmv_context import window_history
+from .llmv_models import LLMVGeneration, LLMVReplayResult, LLMVReplayRun, LlmChallenge
+from .remote_llm import generate_text
+
+log = getLogger(__name__)
+
+
+def get_replay_run(run_id):
+    """Get a replay run by ID.
+
+    Raises:
+        ValueError: If there's no such run.
+    """
+    run = LLMVReplayRun.query.filter_by(id=run_id).first()
+    if run is None:
+        raise ValueError(f"There is no replay run {run_id}")
+    return run
+
+
+def create_replay_run(models, statuses=("correct",), challenge_id=None, limit=None, name=None):
+    """Select graded generations and create a replay run for them.
+
+    Arguments:
+        models (list[str]): Router names of the models to replay against.
+        statuses (tuple[str], optional): Statuses of the generations to replay. Defaults to
+            successful ones.
+        challenge_id (int, optional): Only replay generations of this challenge.
+        limit (int, optional): Replay at most this many (of the newest) generations.
+        name (str, optional): Label for the run.
+
+    Raises:
+        ValueError: If no models are given or a status isn't a graded status.
+
+    Returns:
+        LLMVReplayRun: The committed run.
+    """
+    if not models:
+        raise ValueError("At least one model is needed to replay against")
+    unknown = set(statuses) - set(GRADED_STATUSES)
+    if unknown:
+        raise ValueError(f"Only graded generations can be replayed, not {sorted(unknown)}")
+    query = db.session.query(LLMVGeneration.id).filter(LLMVGeneration.status.in_(statuses))
+    if challenge_id is not None:
+        query = query.filter(LLMVGeneration.challenge_id == challenge_id)
+    query = query.order_by(LLMVGeneration.id.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    generation_ids = sorted(generation_id for (generation_id,) in query)
+    run = LLMVReplayRun(
+        name=name,
+        generation_ids=json_dumps(generation_ids),
+        models=json_dumps(list(models)),
+    )
+    db.session.add(run)
+    db.session.commit()
+    log.info(
+        f"Created replay run {run.id} of {len(generation_ids)} generations "
+        f"against {list(models)}"
+    )
+    return run
+
+
+def _replay_conversation(run_id, generation_id, model, preprompt, prompts, policy, limit):
+    """Replay one conversation against one model (in a worker thread, without the database).
+
+    Returns:
+        dict: Column values for the `LLMVReplayResult`.
+    """
+    start = time.monotonic()
+    turns = []
+    prompt_tokens = generation_tokens = 0
+    try:
+        for index, prompt in enumerate(prompts):
+            # A deterministic UUID lets the router return completions it already produced
+            # for this turn when an interrupted run is resumed.
+            turn_uuid = str(
+                uuid5(NAMESPACE_URL, f"llmv-replay/{run_id}/{generation_id}/{model}/{index}")
+            )
+            completion = generate_text(
+                turn_uuid, preprompt, prompt, model, window_history(turns, policy, limit)
+            )
+            turns.append({"prompt": prompt, "generation": completion.text})
+            prompt_tokens += completion.prompt_tokens
+            generation_tokens += completion.generation_tokens
+        status, error = "completed", None
+    except (HTTPError, ValueError) as router_error:
+        status, error = "error", str(router_error)
+    return {
+        "run_id": run_id,
+        "generation_id": generation_id,
+        "model": model,
+        "status": status,
+        "turns": json_dumps(turns),
+        "error": error,
+        "prompt_tokens": prompt_tokens,
+        "generation_tokens": generation_tokens,
+        "duration": time.monotonic() - start,
+    }
+
+
+def run_replay(run_id, concurrency=4, retry_errors=False):
+    """Replay (or resume) a run, committing each conversation's result as it finishes.
+
+    Arguments:
+        run_id (int): ID of the `LLMVReplayRun`.
+        concurrency (int, optional): Most conversations replayed at once. Defaults to 4.
+        retry_errors (bool, optional): Replay conversations that failed last time again.
+            Defaults to `False`.
+
+    Raises:
+        ValueError: If there's no such run.
+
+    Returns:
+        dict: The run's throughput report (see `replay_report`).
+    """
+    run = get_replay_run(run_id)
+    generation_ids = json_loads(run.generation_ids)
+    models = json_loads(run.models)
+
+    if retry_errors:
+        LLMVReplayResult.query.filter_by(run_id=run.id, status="error").delete(
+            synchronize_session=False
+        )
+        db.session.commit()
+    finished = {
+        (generation_id, model)
+        for generation_id, model in db.session.query(
+            LLMVReplayResult.generation_id, LLMVReplayResult.model
+        ).filter_by(run_id=run.id)
+    }
+    jobs = [
+        (generation_id, model)
+        for generation_id in generation_ids
+        for model in models
+        if (generation_id, model) not in finished
+    ]
+    log.info(
+        f"Replaying {len(jobs)} conversations of run {run.id} "
+        f"({len(finished)} already done) with concurrency {concurrency}"
+    )
+    run.status = "running"
+    db.session.commit()
+
+    challenges = {}
+    conversations = {}
+
+    def prepare(generation_id, model):
+        """Load what a worker needs to replay a conversation (in this thread)."""
+        if generation_id not in conversations:
+            generation = LLMVGeneration.query.filter_by(id=generation_id).first()
+            if generation is None:
+                conversations[generation_id] = None
+            else:
+                if generation.challenge_id not in challenges:
+                    challenges[generation.challenge_id] = LlmChallenge.query.filter_by(
+                        id=generation.challenge_id
+                    ).first()
+                challenge = challenges[generation.challenge_id]
+                conversations[generation_id] = (
+                    challenge.preprompt,
+                    [pair.prompt for pair in load_conversation(generation_id)],
+                    challenge.context_policy,
+                    challenge.context_limit or 0,
+                )
+        if conversations[generation_id] is None:
+            return None
+        return (run.id, generation_id, model, *conversations[generation_id])
+
+    start = time.monotonic()
+    jobs = iter(jobs)
+    in_flight = set()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while True:
+                # Keep the pool busy without queueing every job (and its prompts) up front.
+                while len(in_flight) < concurrency * 2:
+                    job = next(jobs, None)
+                    if job is None:
+                        break
+                    arguments = prepare(*job)
+                    if arguments is None:
+                        log.warning(f"Generation {job[0]} no longer exists, skipping it")
+                        continue
+                    in_flight.add(executor.submit(_replay_conversation, *arguments))
+                if not in_flight:
+                    break
+                completed, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    db.session.add(LLMVReplayResult(**future.result()))
+                # Checkpoint: everything committed here is skipped on resume.
+                db.session.commit()
+        run.status = "completed"
+    finally:
+        run.elapsed = (run.elapsed or 0.0) + time.monotonic() - start
+        if run.status == "running":
+            run.status = "interrupted"
+        db.session.commit()
+    report = replay_report(run.id)
+    log.info(f"Replay run {run.id} finished: {report}")
+    return report
+
+
+def replay_report(run_id):
+    """Get a replay run's progress, throughput and per-model results.
+
+    Returns:
+        dict: Conversation counts, generations (replayed conversations) per second over the
+            run's wall-clock time, and per model, how many replays completed or failed, their
+            mean duration and tokens used.
+    """
+    run = get_replay_run(run_id)
+    total = len(json_loads(run.generation_ids)) * len(json_loads(run.models))
+    models = {}
+    done = 0
+    for model, status, count, duration, prompt_tokens, generation_tokens in (
+        db.session.query(
+            LLMVReplayResult.model,
+            LLMVReplayResult.status,
+            func.count(LLMVReplayResult.id),
+            func.avg(LLMVReplayResult.duration),
+            func.sum(LLMVReplayResult.prompt_tokens),
+            func.sum(LLMVReplayResult.generation_tokens),
+        )
+        .filter_by(run_id=run.id)
+        .group_by(LLMVReplayResult.model, LLMVReplayResult.status)
+    ):
+        summary = models.setdefault(
+            model, {"completed": 0, "error": 0, "mean_duration": 0.0, "tokens": 0}
+        )
+        summary[status] = count
+        summary["tokens"] += int(prompt_tokens or 0) + int(generation_tokens or 0)
+        if status == "completed":
+            summary["mean_duration"] = float(duration or 0.0)
+        done += count
+    elapsed = run.elapsed or 0.0
+    return {
+        "run_id": run.id,
+        "name": run.name,
+        "status": run.status,
+        "total": total,
+        "done": done,
+        "elapsed": elapsed,
+        "generations_per_second": done / elapsed if elapsed else 0.0,
+        "models": models,
+    }
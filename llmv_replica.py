@@ -0,0 +1,144 @@
+"""Route the admin pages' heavy read queries to a read replica, if one is configured.
+
+With the `replica_url` setting, `read_session()` returns a session on the replica instead of
+CTFd's (primary) session. Generations that were just submitted or graded are remembered for
+`replica_lag_window` seconds, and until the replica shows every one of them with its new status,
+reads fall back to the primary so admins never see a queue that's behind their own grading.
+"""
+# Standard library imports.
+from logging import getLogger
+import math
+import threading
+import time
+
+# Third-party imports.
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+# CTFd imports.
+from CTFd.cache import cache
+from CTFd.models import db
+
+# LLM Verification Plugin module imports.
+from .config_manager import get_settings
+from .llmv_models import LLMVGeneration
+from .llmv_write_behind import redis_client
+
+log = getLogger(__name__)
+
+# Recent status changes, as a Redis sorted set of "<generation ID>:<new status>" scored by the
+# time of the change (or, without Redis, a cached dict of ID to (new status, time)).
+RECENT_WRITES_KEY = "llmv_replica_recent_writes"
+
+_lock = threading.Lock()
+_recent_lock = threading.Lock()
+_sessions = {}
+
+
+def _replica_session(replica_url):
+    """Get the (thread-local) session factory for a replica, creating its engine once."""
+    with _lock:
+        session = _sessions.get(replica_url)
+        if session is None:
+            engine = create_engine(replica_url, pool_pre_ping=True)
+            session = scoped_session(sessionmaker(bind=engine, autoflush=False))
+            _sessions[replica_url] = session
+        return session
+
+
+def remove_read_sessions(exception=None):
+    """Return this thread's replica connections to their pools (at the end of each request)."""
+    for session in list(_sessions.values()):
+        session.remove()
+
+
+def note_status_change(generation_id, status):
+    """Remember that a generation's status changed, so reads wait for the replica to see it.
+
+    Arguments:
+        generation_id (int): ID of the generation.
+        status (str): Its new status.
+    """
+    settings = get_settings()
+    if not settings.replica_url or not settings.replica_lag_window:
+        return
+    now = time.time()
+    timeout = math.ceil(settings.replica_lag_window)
+    client = redis_client()
+    if client is not None:
+        # One member per change, so concurrent graders don't overwrite each other's.
+        pipeline = client.pipeline()
+        pipeline.zadd(RECENT_WRITES_KEY, {f"{generation_id}:{status}": now})
+        pipeline.expire(RECENT_WRITES_KEY, timeout)
+        pipeline.execute()
+        return
+    # Without Redis, CTFd's cache belongs to this process, so a lock keeps updates whole.
+    with _recent_lock:
+        recent = _recent_writes(settings)
+        recent[generation_id] = (status, now)
+        cache.set(RECENT_WRITES_KEY, recent, timeout=timeout)
+
+
+def _recent_writes(settings):
+    """Get the status changes within the lag window, as `{ID: (new status, time)}`."""
+    now = time.time()
+    client = redis_client()
+    if client is None:
+        return {
+            generation_id: change
+            for generation_id, change in (cache.get(RECENT_WRITES_KEY) or {}).items()
+            if now - change[1] < settings.replica_lag_window
+        }
+    client.zremrangebyscore(RECENT_WRITES_KEY, "-inf", now - settings.replica_lag_window)
+    recent = {}
+    # Oldest first, so a generation ends up with its latest status.
+    for member, changed in client.zrange(RECENT_WRITES_KEY, 0, -1, withscores=True):
+        if isinstance(member, bytes):
+            member = member.decode()
+        generation_id, status = member.split(":", 1)
+        recent[int(generation_id)] = (status, changed)
+    return recent
+
+
+def _caught_up(session, recent):
+    """Check whether the replica has every recent status change."""
+    statuses = dict(
+        session.query(LLMVGeneration.id, LLMVGeneration.status).filter(
+            LLMVGeneration.id.in_(list(recent))
+        )
+    )
+    return all(
+        statuses.get(generation_id) == status
+        for generation_id, (status, _) in recent.items()
+    )
+
+
+def read_session():
+    """Get the session that read-only admin queries should use.
+
+    Returns:
+        Session: A replica session if one is configured, reachable and caught up with recent
+            submissions and grading, otherwise CTFd's primary session.
+    """
+    settings = get_settings()
+    if not settings.replica_url:
+        return db.session
+    session = _replica_session(settings.replica_url)
+    recent = _recent_writes(settings)
+    try:
+        if not recent:
+            # Nothing to wait for; just check that the replica answers.
+            session.execute(text("SELECT 1"))
+            return session
+        caught_up = _caught_up(session, recent)
+    except SQLAlchemyError as error:
+        session.rollback()
+        log.warning(f"Read replica is unavailable, reading from the primary: {error}")
+        return db.session
+    if not caught_up:
+        # Don't keep a snapshot from before the replica caught up.
+        session.rollback()
+        log.debug("Read replica is behind recent grading, reading from the primary")
+        return db.session
+    return session
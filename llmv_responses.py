@@ -0,0 +1,99 @@
+"""Fast JSON serialization and compression for the plugin's API responses.
+
+`orjson` serializes several times faster than the standard library and is used when it's
+installed. Responses larger than the `response_compression_threshold` setting are compressed
+with Brotli (when the `brotli` package is installed and the client accepts it) or gzip.
+"""
+# Standard library imports.
+import datetime
+import gzip
+from logging import getLogger
+
+# Third-party imports.
+from flask import Response, json as flask_json, request
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:
+    # Fall back to Flask's serializer.
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    # Fall back to gzip.
+    brotli = None
+
+# LLM Verification Plugin module imports.
+from .config_manager import get_settings
+
+log = getLogger(__name__)
+
+# gzip level 6 is zlib's default trade-off between size and CPU.
+GZIP_LEVEL = 6
+# Brotli quality 4 compresses better than gzip -6 in about the same time.
+BROTLI_QUALITY = 4
+
+
+def _default(value):
+    # Dates are formatted like `jsonify` formats them, so clients can't tell the difference.
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return http_date(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(data):
+    """Serialize data to a JSON string, with orjson if it's installed."""
+    if orjson is not None:
+        return orjson.dumps(
+            data,
+            default=_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+        ).decode()
+    return flask_json.dumps(data)
+
+
+def _encode(body):
+    """Compress a response body with the best encoding the client accepts.
+
+    Returns:
+        tuple (bytes, str): The (possibly) compressed body and its content encoding, or
+            `None` if it was left as it is.
+    """
+    threshold = get_settings().response_compression_threshold
+    if not threshold or len(body) < threshold:
+        return body, None
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return brotli.compress(body, quality=BROTLI_QUALITY), "br"
+    if accepted["gzip"]:
+        return gzip.compress(body, compresslevel=GZIP_LEVEL), "gzip"
+    return body, None
+
+
+def json_response(data, status=200):
+    """Build a JSON response like `jsonify`, but faster and compressed when it's large.
+
+    Arguments:
+        data (dict): The response data.
+        status (int, optional): HTTP status code. Defaults to 200.
+
+    Returns:
+        Response: The JSON response.
+    """
+    body, encoding = _encode(dumps(data).encode())
+    response = Response(body, status=status, mimetype="application/json")
+    response.vary.add("Accept-Encoding")
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def wants_turns():
+    """Check whether the client renders conversations itself from structured turn data.
+
+    Clients ask for turns (lists of `{"prompt", "generation"}`) instead of server-rendered
+    HTML fragments with `?format=turns`.
+    """
+    return request.args.get("format") == "turns"
@@ -1,22 +1,40 @@
 """Additional LLMV RESTful API routes that are added to CTFd."""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
 from logging import getLogger
-import random
-from uuid import uuid4
+from urllib.parse import urlparse
+from uuid import UUID, uuid4
 
 # Third-party imports.
-from flask import Blueprint, jsonify, render_template, request, abort
+from flask import (
+    Blueprint,
+    Response,
+    abort,
+    current_app,
+    render_template,
+    request,
+    stream_with_context,
+)
 from requests.exceptions import HTTPError
-from werkzeug.exceptions import BadRequest
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import BadRequest, HTTPException
+
+try:
+    from flask_sock import Sock
+except ImportError:
+    # WebSocket chat sessions are optional; view.js falls back to /generate without them.
+    Sock = None
 
 # CTFd imports.
 from CTFd.models import Submissions, db
 from CTFd.plugins import bypass_csrf_protection
 from CTFd.utils.decorators import admins_only, authed_only
 from CTFd.utils.modes import get_model
-from CTFd.utils.user import get_current_user, is_admin
+from CTFd.utils.user import authed, get_current_user, is_admin
 from CTFd.utils.scores import get_standings
 
 # LLM Verification Plugin module imports.
+from .config_manager import get_settings
 from .llmv_models import (
     LLMVSubmission,
     LlmAwards,
@@ -25,9 +43,51 @@ from .llmv_models import (
     LLMVGeneration,
     LlmModels,
     models_not_submitted,
-    LLMVChatPair,
+    LLMVPendingTurn,
+    SUBMITTED_STATUSES,
+    get_progress,
+    in_progress_generation,
+    submitted_generations,
+)
+from .llmv_analytics import (
+    analytics_summary,
+    record_generation_started,
+    record_status_change,
+)
+from .llmv_archive import load_conversation
+from .llmv_budget import add_usage, budget_exceeded, rate_limited
+from .llmv_challenge_cache import get_challenge_config
+from .llmv_context import apply_context_policy
+from .llmv_health import readiness
+from .llmv_idempotency import (
+    claim as claim_idempotency_key,
+    completed_pair,
+    release as release_idempotency_key,
+    wait_for_pair,
 )
-from .remote_llm import generate_text
+from .llmv_pending import (
+    abandon_turn,
+    begin_turn,
+    begin_turns,
+    finish_turn,
+    pending_generation_id,
+)
+from .llmv_previews import last_turn_previews
+from .llmv_purge import get_purge_progress, start_purge
+from .llmv_query_budget import query_budget
+from .llmv_replica import note_status_change, read_session
+from .llmv_responses import dumps, json_response, wants_turns
+from .llmv_scheduler import get_strategy, router_stats
+from .llmv_search import search_conversations, unsearchable_count
+from .llmv_similarity import pending_clusters
+from .llmv_write_behind import (
+    begin_buffered_turn,
+    buffer_turn,
+    flush_generation,
+    write_behind_enabled,
+)
+from .remote_llm import RouterUnavailable, generate_text
+from .utils import get_filter_by_mode
 
 
 log = getLogger(__name__)
@@ -41,13 +101,41 @@ def add_routes() -> Blueprint:
     )
 
     @llm_verifications.route("/admin/llm_verification", methods=["GET"])
+    @query_budget(statements=15, rows=500)
     @admins_only
     def llm_verification_index():
         """Define a route for the LLMV plugin's index page."""
         standings = get_standings(admin=True)
         return render_template("index.html", standings=standings)
 
+    @llm_verifications.route("/llmv/healthz", methods=["GET"])
+    def liveness():
+        """Add a route that answers as long as the worker is serving requests."""
+        return json_response({"success": True, "data": {"alive": True}})
+
+    @llm_verifications.route("/llmv/readyz", methods=["GET"])
+    @query_budget(statements=6, rows=5)
+    def ready():
+        """Add a route for load balancers to check whether this worker can serve gameplay.
+
+        It responds with 503 when the database, the router or the models table isn't usable.
+        Admins also get each check's details, queue depths and per-model router load.
+
+        Returns:
+            JSON(dict): {'success': bool, 'data': {'ready': bool, 'checks': {name: bool}, ...}}
+        """
+        is_ready, report = readiness()
+        if is_admin():
+            data = {"ready": is_ready, **report}
+        else:
+            data = {
+                "ready": is_ready,
+                "checks": {name: check["ok"] for name, check in report["checks"].items()},
+            }
+        return json_response({"success": is_ready, "data": data}, status=200 if is_ready else 503)
+
     @llm_verifications.route("/generate", methods=["POST"])
+    @query_budget(statements=40, rows=100)
     @bypass_csrf_protection
     @authed_only
     def generate_for_challenge():
@@ -57,123 +145,467 @@ def add_routes() -> Blueprint:
             f'for challenge ID "{request.json["challenge_id"]}"'
         )
 
-        challenge = LlmChallenge.query.filter_by(
-            id=request.json["challenge_id"]
-        ).first_or_404()
+        challenge = get_challenge_config(request.json["challenge_id"])
+        if challenge is None:
+            abort(404)
+
+        def generate(idempotency_uuid):
+            return generate_turn(challenge, idempotency_uuid)
+
+        return json_response(run_idempotent(request.json.get("idempotency_key"), generate))
+
+    @llm_verifications.route("/generate/fan_out", methods=["POST"])
+    @bypass_csrf_protection
+    @authed_only
+    def fan_out_for_challenge():
+        """Add a route that sends a single-turn prompt to every remaining model at once.
+
+        Each model's turn is streamed back as a line of JSON as soon as it's stored, so covering
+        every model takes as long as the slowest one instead of all of them in a row.
+
+        Every model's call counts against the rate limit. Token budgets are checked once,
+        before the calls, so a fan-out may overshoot a budget by up to one turn per model
+        after the first.
+        """
+        challenge = get_challenge_config(request.json["challenge_id"])
+        if challenge is None:
+            abort(404)
+        if not challenge.fan_out or challenge.chat_limit > 1:
+            raise BadRequest("This challenge doesn't send prompts to every model at once")
+        prompt = request.json["prompt"]
+        log.info(
+            f'Received fan-out generation request from user "{get_current_user().name}" '
+            f'for challenge ID "{challenge.id}"'
+        )
+
+        left_over_model = models_not_submitted(
+            user_id=get_current_user().id, challenge_id=challenge.id
+        )
+        if len(left_over_model) == 0:
+            return json_response(turn_error("This challenge is complete."))
+        _, account_id = get_filter_by_mode(LLMVGeneration)
+        if rate_limited(account_id, amount=len(left_over_model)):
+            return json_response(
+                turn_error("You're generating too quickly, try again in a minute.")
+            )
+        budget_message = budget_exceeded(account_id, challenge)
+        if budget_message is not None:
+            return json_response(turn_error(budget_message))
 
-        if "generation_id" in request.json:
-            log.info(
-                "Found old generation id %s, using that", request.json["generation_id"]
+        # Create every model's conversation and pending turn in one transaction.
+        models = LlmModels.query.filter(LlmModels.anon_name.in_(left_over_model)).all()
+        generations = []
+        for model in models:
+            generations.append(
+                LLMVGeneration(
+                    user_id=get_current_user().id,
+                    team_id=get_current_user().team_id,
+                    challenge_id=challenge.id,
+                    model_id=model.id,
+                )
             )
+            record_generation_started(challenge.id, model.id)
+        db.session.add_all(generations)
+        pending_turns = begin_turns(generations, prompt)
+        jobs = [
+            (generation.id, pending_turn.uuid, model.model, model.anon_name)
+            for generation, pending_turn, model in zip(generations, pending_turns, models)
+        ]
+        window = apply_context_policy(challenge, [])
+
+        def stream():
+            workers = min(len(jobs), get_settings().router_pool_size)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(
+                        generate_text, turn_uuid, challenge.preprompt, prompt, router_name
+                    ): (generation_id, turn_uuid, anon_name)
+                    for generation_id, turn_uuid, router_name, anon_name in jobs
+                }
+                for future in as_completed(futures):
+                    generation_id, turn_uuid, anon_name = futures[future]
+                    response = store_fan_out_turn(
+                        future, generation_id, turn_uuid, window, account_id
+                    )
+                    response["data"]["model"] = anon_name
+                    yield dumps(response) + "\n"
+
+        return Response(stream_with_context(stream()), mimetype="application/x-ndjson")
+
+    def store_fan_out_turn(future, generation_id, turn_uuid, window, account_id):
+        """Store one model's result of a fan-out prompt.
+
+        Returns:
+            dict: The response data for the model's turn.
+        """
+        llmv_generation = LLMVGeneration.query.filter_by(id=generation_id).first()
+        pending_turn = LLMVPendingTurn.query.filter_by(uuid=turn_uuid).first()
+        try:
+            completion = future.result()
+        except RouterUnavailable as error:
+            log.error(f"Remote LLM experienced an error when generating text: {error}")
+            # Keep the pending turn for the reconciler.
+            return turn_error("There was an error in the backend, try again?")
+        except HTTPError as error:
+            log.error(f"Remote LLM experienced an error when generating text: {error}")
+            abandon_turn(llmv_generation, pending_turn)
+            db.session.commit()
+            return turn_error("There was an error in the backend, try again?")
+        finish_turn(llmv_generation, pending_turn, completion, window)
+        db.session.commit()
+        add_usage(account_id, llmv_generation.challenge_id, completion.tokens)
+        return {
+            "success": True,
+            "data": {"text": completion.text, "id": generation_id},
+        }
+
+    def turn_error(text):
+        """Build the response for a turn that couldn't be generated."""
+        return {"success": False, "data": {"text": text, "id": -1}}
+
+    def run_idempotent(idempotency_key, generate):
+        """Generate a turn at most once per client-supplied idempotency key.
+
+        Arguments:
+            idempotency_key (str): The key the client sent, or `None` to always generate.
+            generate (callable): Generates and stores a turn under the idempotency UUID it's
+                given, returning the response data.
+
+        Raises:
+            BadRequest: If the idempotency key isn't a UUID.
+
+        Returns:
+            dict: The response data for the turn.
+        """
+        # Without a client-supplied idempotency key, every request is a new turn.
+        if idempotency_key is None:
+            return generate(str(uuid4()))
+
+        try:
+            idempotency_uuid = str(UUID(idempotency_key))
+        except (TypeError, ValueError):
+            raise BadRequest("The idempotency key must be a UUID")
+        # Replay the result of a request with this key that has already finished.
+        chatpair = completed_pair(idempotency_uuid)
+        if chatpair is not None:
+            return replay_turn(chatpair)
+        # Otherwise wait for a duplicate request that's still waiting on the router.
+        if not claim_idempotency_key(idempotency_uuid):
+            log.info(f"Coalescing duplicate generation request {idempotency_uuid}")
+            chatpair = wait_for_pair(idempotency_uuid)
+            if chatpair is None:
+                return turn_error("There was an error in the backend, try again?")
+            return replay_turn(chatpair)
+        try:
+            return generate(idempotency_uuid)
+        finally:
+            release_idempotency_key(idempotency_uuid)
+
+    def assign_model(anon_names):
+        """Pick the model for a new conversation with the configured assignment strategy.
+
+        Arguments:
+            anon_names (list[str]): Anonymous names of the models the user may still submit.
+
+        Returns:
+            LlmModels: The assigned model.
+        """
+        candidates = {
+            model.model: model
+            for model in LlmModels.query.filter(LlmModels.anon_name.in_(anon_names))
+        }
+        strategy = get_strategy(get_settings().assignment_strategy)
+        chosen = strategy.choose(sorted(candidates), router_stats.snapshot())
+        router_stats.record_assignment(chosen)
+        log.debug(f'Assigned model "{chosen}" with the "{strategy.name}" strategy')
+        return candidates[chosen]
+
+
+    def replay_turn(chatpair):
+        """Respond with a chat pair that was already generated for an idempotency key.
+
+        Errors are returned as turn errors rather than raised, so they don't end a chat
+        session's WebSocket.
+        """
+        llmv_generation = LLMVGeneration.query.filter_by(id=chatpair.generation_id).first()
+        if llmv_generation is None:
+            return turn_error("This conversation no longer exists.")
+        if llmv_generation.account_id != get_current_user().id:
+            return turn_error("This idempotency key belongs to another user.")
+        return turn_response(chatpair, llmv_generation.id)
+
+    def turn_response(chatpair, generation_id, success=True):
+        """Build the response for a stored turn.
+
+        Clients that render conversations themselves (see `wants_turns`) get just the new
+        turn to append; others get the whole conversation rendered as an HTML fragment.
+        """
+        data = {"text": chatpair.generation, "id": generation_id}
+        if wants_turns():
+            data["turn"] = chatpair.json()
+        else:
+            data["fragment"] = get_conversation(generation_id)
+        return {"success": success, "data": data}
+
+    def generate_turn(challenge, idempotency_uuid):
+        """Generate text for the prompt in the request and store it as a new chat pair.
+
+        Arguments:
+            challenge (ChallengeConfig): The challenge the prompt was submitted to.
+            idempotency_uuid (str): Idempotency key sent to the router and stored on the pair.
+
+        Returns:
+            dict: The response data for the turn.
+        """
+        _, account_id = get_filter_by_mode(LLMVGeneration)
+        if rate_limited(account_id):
+            return turn_error("You're generating too quickly, try again in a minute.")
+        budget_message = budget_exceeded(account_id, challenge)
+        if budget_message is not None:
+            return turn_error(budget_message)
+
+        # A retry of a lost turn continues the conversation the turn was for.
+        generation_id = pending_generation_id(idempotency_uuid) or request.json.get(
+            "generation_id"
+        )
+        llmv_generation, history, error = open_generation(challenge, generation_id)
+        if error is not None:
+            return error
+        return complete_turn(
+            challenge, llmv_generation, history, request.json["prompt"], idempotency_uuid
+        )
+
+    def open_generation(challenge, generation_id=None):
+        """Get the conversation a prompt continues, or start a new one with an assigned model.
+
+        Arguments:
+            challenge (ChallengeConfig): The challenge the prompt was submitted to.
+            generation_id (int, optional): ID of the user's unsubmitted conversation to continue.
+
+        Returns:
+            tuple (LLMVGeneration, list[dict], dict): The conversation, its earlier turns and
+                `None`, or `None, None` and the error response if it can't be continued.
+        """
+        if generation_id is not None:
+            log.info("Found old generation id %s, using that", generation_id)
             llmv_generation = LLMVGeneration.query.filter_by(
-                id=request.json["generation_id"]
+                id=generation_id
             ).first_or_404()
             if llmv_generation.status != "unsubmitted":
                 log.error(
-                    f"Generation {request.json['generation_id']} has been submitted, status: {llmv_generation.status}, returning"
+                    f"Generation {generation_id} has been submitted, status: {llmv_generation.status}, returning"
                 )
-                response = {
-                    "success": False,
-                    "data": {"text": "This challenge is complete.", "id": -1},
-                }
-                return jsonify(response)
+                return None, None, turn_error("This challenge is complete.")
             if llmv_generation.account_id != get_current_user().id:
                 log.error(
-                    f"Generation {request.json['generation_id']} is not owned by user {get_current_user().id}, returning"
+                    f"Generation {generation_id} is not owned by user {get_current_user().id}, returning"
                 )
-                response = {
-                    "success": False,
-                    "data": {"text": "This challenge is complete.", "id": -1},
-                }
-                return jsonify(response)
+                return None, None, turn_error("This challenge is complete.")
             if llmv_generation.challenge_id != challenge.id:
                 log.error(
-                    f"Generation {request.json['generation_id']} is not for challenge {challenge.id}, returning"
+                    f"Generation {generation_id} is not for challenge {challenge.id}, returning"
                 )
-                response = {
-                    "success": False,
-                    "data": {"text": "This challenge is complete.", "id": -1},
-                }
-                return jsonify(response)
-            history = llmv_generation.pairs
-            history = [h.json() for h in llmv_generation.pairs]
+                return None, None, turn_error("This challenge is complete.")
+            history = [pair.json() for pair in load_conversation(llmv_generation.id)]
             log.info('Found history "%s"', history)
-        else:
-            left_over_model = models_not_submitted(
-                user_id=get_current_user().id, challenge_id=challenge.id
-            )
-            if len(left_over_model) == 0:
-                response = {
-                    "success": False,
-                    "data": {"text": "This challenge is complete.", "id": -1},
-                }
-                return jsonify(response)
-            # Add the generated text to the database.
-            user_id = get_current_user().id
-            team_id = get_current_user().team_id
-            challenge_id = request.json["challenge_id"]
-            anon_name = random.choice(left_over_model)
-            # Return a random model that isn't submitted by the user.
-            model = LlmModels.query.filter_by(anon_name=anon_name).first()
-            llmv_generation = LLMVGeneration(
-                user_id=user_id,
-                team_id=team_id,
-                challenge_id=challenge_id,
-                model_id=model.id,
-            )
-            db.session.add(llmv_generation)
-            history = []
-            log.info("No old generation id, starting new generation")
+            return llmv_generation, history, None
+
+        left_over_model = models_not_submitted(
+            user_id=get_current_user().id, challenge_id=challenge.id
+        )
+        if len(left_over_model) == 0:
+            return None, None, turn_error("This challenge is complete.")
+        # Add the generated text to the database.
+        user_id = get_current_user().id
+        team_id = get_current_user().team_id
+        # Assign one of the models that the user hasn't submitted, based on router load.
+        model = assign_model(left_over_model)
+        llmv_generation = LLMVGeneration(
+            user_id=user_id,
+            team_id=team_id,
+            challenge_id=challenge.id,
+            model_id=model.id,
+        )
+        db.session.add(llmv_generation)
+        record_generation_started(challenge.id, model.id)
+        log.info("No old generation id, starting new generation")
+        return llmv_generation, [], None
+
+    def complete_turn(challenge, llmv_generation, history, prompt, idempotency_uuid):
+        """Send a prompt to the router and store the reply as the conversation's next turn.
 
+        Arguments:
+            challenge (ChallengeConfig): The challenge the prompt was submitted to.
+            llmv_generation (LLMVGeneration): The conversation from `open_generation`.
+            history (list[dict]): The conversation's earlier turns. The new turn is appended to
+                it once it's stored.
+            prompt (str): The user's prompt.
+            idempotency_uuid (str): Idempotency key sent to the router and stored on the pair.
+
+        Returns:
+            dict: The response data for the turn.
+        """
         preprompt = challenge.preprompt
         log.debug(
             f'Found pre-prompt "{preprompt}" '
-            f'for challenge {request.json["challenge_id"]} "{challenge.name}"'
+            f'for challenge {challenge.id} "{challenge.name}"'
         )
         log.debug(
             f'User "{get_current_user().name}" '
-            f'submitted prompt: "{request.json["prompt"]}"'
+            f'submitted prompt: "{prompt}"'
         )
-        # Combine the pre-prompt and user-provided prompt with a space between them.
-        prompt = request.json["prompt"]
         log.debug(f'pre-prompt {preprompt} and user-provided-prompt: "{prompt}"')
-        idempotency_uuid = str(uuid4())
+        # Only send the part of the history the challenge's context policy allows.
+        window = apply_context_policy(challenge, history)
+        model = LlmModels.query.filter_by(id=llmv_generation.model_id).first()
+        if write_behind_enabled():
+            # Store a new conversation now, so its turns can be buffered until they're flushed,
+            # and remember it so a retry of this turn continues it.
+            db.session.commit()
+            begin_buffered_turn(llmv_generation, idempotency_uuid)
+            pending_turn = None
+        else:
+            # Record the turn before calling the router so it can be recovered if it's lost.
+            pending_turn = begin_turn(llmv_generation, idempotency_uuid, prompt)
         try:
-            model = LlmModels.query.filter_by(id=llmv_generation.model_id).first()
-            generated_text = generate_text(
-                idempotency_uuid, preprompt, prompt, model.model, history
+            completion = generate_text(
+                idempotency_uuid, preprompt, prompt, model.model, window.history
             )
             generation_succeeded = True
 
+        except RouterUnavailable as error:
+            log.error(f"Remote LLM experienced an error when generating text: {error}")
+            # Keep the pending turn; a retry with the same idempotency key (or the reconciler)
+            # fetches the completion the router may already have generated.
+            return turn_error("There was an error in the backend, try again?")
         except HTTPError as error:
             log.error(f"Remote LLM experienced an error when generating text: {error}")
+            if pending_turn is not None:
+                abandon_turn(llmv_generation, pending_turn)
+                db.session.commit()
             # Send the error message from the HTTPError as the response to the user.
-            response = {
-                "success": False,
-                "data": {
-                    "text": "There was an error in the backend, try again?",
-                    "id": -1,
-                },
-            }
-            return jsonify(response)
+            return turn_error("There was an error in the backend, try again?")
 
-        chatpair = LLMVChatPair(
-            generation_id=llmv_generation.id,
-            generation=generated_text,
-            prompt=prompt,
-            uuid=idempotency_uuid,
-        )
-        db.session.add(chatpair)
-        db.session.commit()
-        generation_id = llmv_generation.id
-        fragment = get_conversation(generation_id)
-        response = {
-            "success": generation_succeeded,
-            "data": {"text": generated_text, "fragment": fragment, "id": generation_id},
-        }
-        return jsonify(response)
+        if pending_turn is None:
+            chatpair = buffer_turn(
+                llmv_generation, idempotency_uuid, prompt, completion, window
+            )
+        else:
+            chatpair = finish_turn(llmv_generation, pending_turn, completion, window)
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # Another worker stored a pair for this idempotency key first.
+                db.session.rollback()
+                return replay_turn(completed_pair(idempotency_uuid))
+        _, account_id = get_filter_by_mode(LLMVGeneration)
+        add_usage(account_id, challenge.id, completion.tokens)
+        history.append(chatpair.json())
+        return turn_response(chatpair, llmv_generation.id, success=generation_succeeded)
+
+    if Sock is not None:
+        sock = Sock()
+
+        @sock.route("/chat/<challenge_id>", bp=llm_verifications)
+        def chat_session(ws, challenge_id):
+            """Add a WebSocket route for the turns of a multi-turn conversation.
+
+            The user is authenticated and the conversation loaded once, when the session opens.
+            Each message is a prompt (and optional idempotency key), and each turn is stored
+            before its reply is sent, like `/generate`.
+            """
+            if not authed():
+                ws.close(reason=1008, message="Not logged in")
+                return
+            # Browsers don't apply the same-origin policy to WebSockets.
+            origin = request.headers.get("Origin")
+            if origin is not None and urlparse(origin).netloc != request.host:
+                ws.close(reason=1008, message="Cross-origin chat sessions are not allowed")
+                return
+            if get_challenge_config(challenge_id) is None:
+                ws.close(reason=1008, message="Unknown challenge")
+                return
+
+            generation_id = request.args.get("generation_id", None, type=int)
+            if generation_id == -1:
+                generation_id = None
+            llmv_generation = None
+            history = None
+            try:
+                while True:
+                    # Return the database connection to the pool while waiting for the next prompt.
+                    db.session.rollback()
+                    try:
+                        message = json.loads(ws.receive())
+                        prompt = message["prompt"]
+                    except (TypeError, ValueError, KeyError):
+                        ws.send(dumps(turn_error("Invalid message")))
+                        continue
+
+                    # Re-read the (cached) challenge so an admin's edits apply to open sessions.
+                    challenge = get_challenge_config(challenge_id)
+                    if challenge is None:
+                        # Deleted while the session was open.
+                        ws.send(dumps(turn_error("This challenge is complete.")))
+                        ws.close(reason=1008, message="Unknown challenge")
+                        break
+                    _, account_id = get_filter_by_mode(LLMVGeneration)
+                    if rate_limited(account_id):
+                        ws.send(
+                            dumps(
+                                turn_error("You're generating too quickly, try again in a minute.")
+                            )
+                        )
+                        continue
+                    budget_message = budget_exceeded(account_id, challenge)
+                    if budget_message is not None:
+                        ws.send(dumps(turn_error(budget_message)))
+                        continue
+                    if llmv_generation is not None and llmv_generation.status != "unsubmitted":
+                        ws.send(dumps(turn_error("This challenge is complete.")))
+                        continue
+                    if llmv_generation is None:
+                        # A retry of a lost turn continues the conversation the turn was for.
+                        try:
+                            lost_generation_id = pending_generation_id(
+                                str(UUID(message.get("idempotency_key")))
+                            )
+                        except (TypeError, ValueError):
+                            lost_generation_id = None
+                        llmv_generation, history, error = open_generation(
+                            challenge, lost_generation_id or generation_id
+                        )
+                        if error is not None:
+                            ws.send(dumps(error))
+                            continue
+
+                    turns = len(history)
+
+                    def generate(idempotency_uuid):
+                        return complete_turn(
+                            challenge, llmv_generation, history, prompt, idempotency_uuid
+                        )
+
+                    ws.send(dumps({"type": "generating"}))
+                    try:
+                        response = run_idempotent(message.get("idempotency_key"), generate)
+                    except HTTPException as error:
+                        response = turn_error(error.description)
+                    if response["success"]:
+                        generation_id = response["data"]["id"]
+                    if len(history) == turns:
+                        # Nothing was stored by this session (an error, or a replayed turn), so
+                        # reload the conversation for the next prompt.
+                        llmv_generation = None
+                    ws.send(dumps(response))
+            finally:
+                # Store the session's buffered turns once the user leaves.
+                if generation_id is not None:
+                    db.session.rollback()
+                    flush_generation(generation_id)
 
     @llm_verifications.route("/submissions/<challenge_id>", methods=["GET"])
+    @query_budget(statements=30, rows=300)
     @authed_only
     def submissions_for_challenge(challenge_id):
         """Define a route for for showing users their answer submissions."""
@@ -184,25 +616,22 @@ def add_routes() -> Blueprint:
         )
         # Query the database for the user's answer submissions for this challenge.
         user_id = get_current_user().id
+        submitted = submitted_generations(user_id=user_id, challenge_id=challenge_id)
+        turns = wants_turns()
         collected_submissions = []
-        for status in ["pending", "correct", "awarded", "incorrect"]:
-            generations = (
-                LLMVGeneration.query.add_columns(
-                    LlmModels.anon_name,
-                )
-                .filter_by(user_id=user_id, challenge_id=challenge_id, status=status)
-                .join(LlmModels)
-                .all()
-            )
-            for generation, model_name in generations:
-                collected_submissions.append(
-                    {
-                        "date": generation.date,
-                        "status": status,
-                        "model": model_name,
-                        "fragment": get_conversation(generation.id),
-                    }
-                )
+        for generation, model_name in submitted:
+            submission = {
+                "date": generation.date,
+                "status": generation.status,
+                "model": model_name,
+            }
+            if turns:
+                submission["turns"] = [
+                    pair.json() for pair in load_conversation(generation.id)
+                ]
+            else:
+                submission["fragment"] = get_conversation(generation.id)
+            collected_submissions.append(submission)
 
         left_over_model = models_not_submitted(
             user_id=user_id, challenge_id=challenge_id
@@ -219,9 +648,67 @@ def add_routes() -> Blueprint:
             f'Showed user "{get_current_user().name}" '
             f'their answer submissions for challenge "{challenge_id}"'
         )
-        return jsonify(response)
+        return json_response(response)
+
+    @llm_verifications.route("/bootstrap/<challenge_id>", methods=["GET"])
+    @query_budget(statements=20, rows=100)
+    @authed_only
+    def bootstrap_challenge(challenge_id):
+        """Define a route that returns everything the challenge view needs when it opens.
+
+        This replaces separate calls to `/chat_limit`, `/models_left` and `/submissions` so the
+        challenge modal only needs one round-trip and one pass over the user's generations.
+        """
+        log.debug(
+            f'User "{get_current_user().name}" '
+            f'requested the challenge view for challenge "{challenge_id}"'
+        )
+        user_id = get_current_user().id
+        challenge = get_challenge_config(challenge_id)
+        if challenge is None:
+            abort(404)
+        progress = get_progress(user_id=user_id, challenge_id=challenge.id)
+        left_over_model = models_not_submitted(
+            user_id=user_id, challenge_id=challenge.id
+        )
+
+        # Resume the user's unsubmitted conversation (if there is one).
+        generation_id = -1
+        history = []
+        fragment = ""
+        if left_over_model:
+            generation = in_progress_generation(
+                user_id=user_id, challenge_id=challenge.id
+            )
+            if generation is not None:
+                conversation = load_conversation(generation.id)
+                generation_id = generation.id
+                history = [pair.json() for pair in conversation]
+                # Clients that render the history themselves don't need it as HTML too.
+                if not wants_turns():
+                    fragment = render_template(
+                        "conversation.html", conversation=conversation
+                    )
+
+        summary = {status: getattr(progress, status) for status in SUBMITTED_STATUSES}
+
+        response = {
+            "success": True,
+            "data": {
+                "chat_limit": challenge.chat_limit,
+                "websocket": Sock is not None,
+                "fan_out": challenge.fan_out and challenge.chat_limit <= 1,
+                "models_left": left_over_model,
+                "generation_id": generation_id,
+                "history": history,
+                "fragment": fragment,
+                "submissions": {"count": progress.submitted, "statuses": summary},
+            },
+        }
+        return json_response(response)
 
     @llm_verifications.route("/models_left/<challenge_id>", methods=["GET"])
+    @query_budget(statements=10, rows=20)
     @authed_only
     def models_left(challenge_id):
         """Define a route for for showing users their answer submissions."""
@@ -236,9 +723,10 @@ def add_routes() -> Blueprint:
             user_id=user_id, challenge_id=challenge_id
         )
         response = {"success": True, "data": {"models_left": left_over_model}}
-        return jsonify(response)
+        return json_response(response)
 
     @llm_verifications.route("/chat_limit/<challenge_id>", methods=["GET"])
+    @query_budget(statements=6, rows=10)
     @authed_only
     def chat_limit(challenge_id):
         """Define a route for for showing users their answer submissions."""
@@ -248,9 +736,11 @@ def add_routes() -> Blueprint:
             f'requested their answer submissions for challenge "{challenge_id}"'
         )
         # Query the database for the user's answer submissions for this challenge.
-        challenge = LlmChallenge.query.filter_by(id=challenge_id).first_or_404()
+        challenge = get_challenge_config(challenge_id)
+        if challenge is None:
+            abort(404)
         response = {"success": True, "data": {"chat_limit": challenge.chat_limit}}
-        return jsonify(response)
+        return json_response(response)
 
     # @llm_verifications.route('/admin/llm_submissions/pending', methods=['GET'])
     # @admins_only
@@ -319,23 +809,21 @@ def add_routes() -> Blueprint:
     @llm_verifications.route(
         "/llm_submissions/conversation/<generation_id>", methods=["GET"]
     )
+    @query_budget(statements=8, rows=100)
     @authed_only
     def get_conversation(generation_id):
         log.debug(f"Getting conversation for generation {generation_id}")
         generation = LLMVGeneration.query.filter_by(id=generation_id).first_or_404()
-        if generation.account_id != get_current_user().id or not is_admin():
+        if generation.account_id != get_current_user().id and not is_admin():
             abort(403, description="You are not authorized to view this page.")
 
-        conversation = (
-            LLMVChatPair.query.filter_by(generation_id=generation_id)
-            .order_by(LLMVChatPair.date)
-            .all()
-        )
+        conversation = load_conversation(generation.id)
 
         return render_template("conversation.html", conversation=conversation)
 
-    def get_generations(request, pending_overide=False):
+    def get_generations(request, pending_overide=False, session=None):
         """Add an admin route for viewing answer submissions that haven't been reviewed."""
+        session = session or read_session()
         filters = {}
         status = request.args.get("status", None, type=str)
         if status is not None:
@@ -352,27 +840,46 @@ def add_routes() -> Blueprint:
         if account_id is not None:
             filters["account_id"] = account_id
 
+        # The grading queue shows the most promising (pre-scored) submissions first.
+        sort = request.args.get("sort", "score" if pending_overide else "date", type=str)
+        if sort == "score":
+            order = (
+                LLMVGeneration.score.is_(None),
+                LLMVGeneration.score.desc(),
+                LLMVGeneration.date.desc(),
+            )
+        else:
+            order = (LLMVGeneration.date.desc(),)
+
         curr_page = abs(int(request.args.get("page", 1, type=int)))
         results_per_page = 50
         page_start = results_per_page * (curr_page - 1)
         page_end = results_per_page * (curr_page - 1) + results_per_page
-        sub_count = LLMVGeneration.query.count()
+        sub_count = session.query(LLMVGeneration).filter_by(**filters).count()
         page_count = int(sub_count / results_per_page) + (
             sub_count % results_per_page > 0
         )
         Model = get_model()
 
+        # Only load the columns the list shows; the conversation route loads the rest.
         generations = (
-            LLMVGeneration.query.add_columns(
+            session.query(
+                LLMVGeneration.id,
+                LLMVGeneration.team_id,
+                LLMVGeneration.account_id.label("account_id"),
+                LLMVGeneration.challenge_id,
+                LLMVGeneration.status,
+                LLMVGeneration.date,
+                LLMVGeneration.score,
+                LLMVGeneration.score_details,
                 LlmChallenge.name.label("challenge_name"),
-                LlmChallenge.description.label("challenge_description"),
                 Model.name.label("team_name"),
             )
             .select_from(LLMVGeneration)
             .filter_by(**filters)
             .join(LlmChallenge)
             .join(Model)
-            .order_by(LLMVGeneration.date.desc())
+            .order_by(*order)
             .slice(page_start, page_end)
             .all()
         )
@@ -380,33 +887,171 @@ def add_routes() -> Blueprint:
         return generations, page_count, curr_page
 
     @llm_verifications.route("/admin/llm_submissions/generations", methods=["GET"])
+    @query_budget(statements=15, rows=20)
     @admins_only
     def view_generations():
-        generations, page_count, curr_page = get_generations(request)
+        session = read_session()
+        generations, page_count, curr_page = get_generations(request, session=session)
+        previews = last_turn_previews([row.id for row in generations], session=session)
         log.info(f"Showed (admin) all generations, {len(generations)} generations")
         return render_template(
             "all_generations.html",
             generations=generations,
+            previews=previews,
             page_count=page_count,
             curr_page=curr_page,
         )
 
     @llm_verifications.route("/admin/llm_submissions/pending", methods=["GET"])
+    @query_budget(statements=20, rows=20)
     @admins_only
     def render_pending_submissions():
         """Add an admin route for viewing answer submissions that haven't been reviewed."""
+        # Read the queue and its clusters from the same (replica or primary) snapshot.
+        session = read_session()
         generations, page_count, curr_page = get_generations(
-            request, pending_overide=True
+            request, pending_overide=True, session=session
         )
+        # Only cluster this page's generations, not the whole queue.
+        clusters = pending_clusters(
+            challenge_id=request.args.get("challenge_id", None, type=int),
+            session=session,
+            generation_ids=[row.id for row in generations],
+        )
+        group_duplicates = request.args.get("group_duplicates", 0, type=int) == 1
+        if group_duplicates:
+            # Only show the first generation of each cluster in the page's order (the newest or
+            # most promising); grading it grades the cluster.
+            shown_clusters = set()
+            grouped = []
+            for row in generations:
+                cluster = tuple(clusters.get(row.id, [row.id]))
+                if cluster not in shown_clusters:
+                    shown_clusters.add(cluster)
+                    grouped.append(row)
+            generations = grouped
+        previews = last_turn_previews([row.id for row in generations], session=session)
         log.info(f"Showed (admin) {len(generations)} pending answer generations")
         return render_template(
             "verify_submissions.html",
             generations=generations,
+            previews=previews,
+            clusters=clusters,
+            group_duplicates=group_duplicates,
+            sort=request.args.get("sort", "score", type=str),
             page_count=page_count,
             curr_page=curr_page,
         )
 
+    @llm_verifications.route("/admin/llm_submissions/search", methods=["GET"])
+    @query_budget(statements=15, rows=200)
+    @admins_only
+    def search_generations():
+        """Add an admin route for searching the text of every prompt and generation."""
+        terms = request.args.get("q", "", type=str).strip()
+        filters = {}
+        for name, arg_type in (
+            ("challenge_id", int),
+            ("model_id", int),
+            ("status", str),
+            ("account_id", int),
+        ):
+            value = request.args.get(name, None, type=arg_type)
+            if value is not None:
+                filters[name] = value
+
+        curr_page = max(abs(int(request.args.get("page", 1, type=int))), 1)
+        results, page_count, unsearchable = [], 0, 0
+        if terms:
+            results, page_count = search_conversations(terms, filters, curr_page)
+            unsearchable = unsearchable_count(filters)
+        log.info(f'Showed (admin) {len(results)} search results for "{terms}"')
+        return render_template(
+            "search_generations.html",
+            results=results,
+            unsearchable=unsearchable,
+            terms=terms,
+            filters=filters,
+            page_count=page_count,
+            curr_page=curr_page,
+        )
+
+    @llm_verifications.route("/admin/llm_submissions/assignments", methods=["GET"])
+    @query_budget(statements=5, rows=10)
+    @admins_only
+    def view_assignments():
+        """Add an admin route for this worker's model assignments and router load."""
+        loads = router_stats.snapshot()
+        response = {
+            "success": True,
+            "data": {
+                "strategy": get_settings().assignment_strategy,
+                "models": {model: vars(load) for model, load in loads.items()},
+            },
+        }
+        return json_response(response)
+
+    @llm_verifications.route("/admin/llm_submissions/analytics", methods=["GET"])
+    @query_budget(statements=15, rows=50)
+    @admins_only
+    def view_analytics():
+        """Add an admin route for live event statistics, read from the rollup tables."""
+        hours = min(max(request.args.get("hours", 24, type=int), 1), 24 * 14)
+        return render_template(
+            "analytics.html", summary=analytics_summary(hours=hours), hours=hours
+        )
+
+    @llm_verifications.route("/admin/llm_submissions/analytics/data", methods=["GET"])
+    @query_budget(statements=15, rows=50)
+    @admins_only
+    def analytics_data():
+        """Add an admin API route for live event statistics, read from the rollup tables."""
+        hours = min(max(request.args.get("hours", 24, type=int), 1), 24 * 14)
+        return json_response({"success": True, "data": analytics_summary(hours=hours)})
+
+    @llm_verifications.route("/admin/llm_submissions/purge", methods=["POST"])
+    @query_budget(statements=5, rows=10)
+    @admins_only
+    def start_purge_job():
+        """Add an admin route that purges generations by challenge, account or age.
+
+        The purge runs in throttled batches in the background; follow it with the job ID.
+
+        Returns:
+            JSON(dict): {'success': True, 'data': {'job_id': str}}
+        """
+        data = request.get_json() or {}
+        try:
+            criteria = {
+                name: int(data[name])
+                for name in ("challenge_id", "account_id", "older_than_days", "batch_size")
+                if data.get(name) is not None
+            }
+            if data.get("pause") is not None:
+                criteria["pause"] = float(data["pause"])
+        except (TypeError, ValueError):
+            raise BadRequest("Purge criteria must be numbers")
+        if data.get("statuses"):
+            criteria["statuses"] = list(data["statuses"])
+        try:
+            job_id = start_purge(current_app._get_current_object(), **criteria)
+        except ValueError as error:
+            raise BadRequest(str(error))
+        log.info(f'Admin "{get_current_user().name}" started purge {job_id}: {criteria}')
+        return json_response({"success": True, "data": {"job_id": job_id}})
+
+    @llm_verifications.route("/admin/llm_submissions/purge/<job_id>", methods=["GET"])
+    @query_budget(statements=5, rows=10)
+    @admins_only
+    def purge_job_progress(job_id):
+        """Add an admin route for a purge's progress."""
+        report = get_purge_progress(job_id)
+        if report is None:
+            abort(404)
+        return json_response({"success": True, "data": report})
+
     @llm_verifications.route("/admin/llm_submissions/challenges", methods=["GET"])
+    @query_budget(statements=10, rows=20)
     @admins_only
     def view_challenges():
         """Add an admin route for viewing answer submissions that have been marked as correct."""
@@ -414,17 +1059,17 @@ def add_routes() -> Blueprint:
         results_per_page = 50
         page_start = results_per_page * (curr_page - 1)
         page_end = results_per_page * (curr_page - 1) + results_per_page
-        sub_count = LlmChallenge.query.count()
+        session = read_session()
+        sub_count = session.query(LlmChallenge).count()
         page_count = int(sub_count / results_per_page) + (
             sub_count % results_per_page > 0
         )
+        # The description and pre-prompt are loaded on demand by `challenge_details`.
         challenges = (
-            LlmChallenge.query.add_columns(
+            session.query(
                 LlmChallenge.id,
                 LlmChallenge.name,
-                LlmChallenge.description,
                 LlmChallenge.value,
-                LlmChallenge.preprompt,
                 LlmChallenge.category,
             )
             .select_from(LlmChallenge)
@@ -440,9 +1085,30 @@ def add_routes() -> Blueprint:
             curr_page=curr_page,
         )
 
+    @llm_verifications.route(
+        "/admin/llm_submissions/challenges/<challenge_id>", methods=["GET"]
+    )
+    @query_budget(statements=5, rows=5)
+    @admins_only
+    def challenge_details(challenge_id):
+        """Add an admin route for a challenge's full description and pre-prompt."""
+        challenge = LlmChallenge.query.filter_by(id=challenge_id).first_or_404()
+        return json_response(
+            {
+                "success": True,
+                "data": {
+                    "id": challenge.id,
+                    "name": challenge.name,
+                    "description": challenge.description,
+                    "preprompt": challenge.preprompt,
+                },
+            }
+        )
+
     @llm_verifications.route(
         "/admin/verify_submissions/<generation_id>/<status>", methods=["POST"]
     )
+    @query_budget(statements=25, rows=50)
     @admins_only
     def verify_submissions(generation_id, status):
         """Add a route for admins to mark answer attempts as correct or incorrect.
@@ -466,19 +1132,85 @@ def add_routes() -> Blueprint:
         )
         grt_submission = LLMVGeneration.query.filter_by(id=generation_id).first_or_404()
         log.debug(f"grt_submission: {grt_submission}")
+        grade_generation(grt_submission, status)
+        # Delete the answer submission from CTFd's "Submissions" table, which also cascade-deletes the answer submission from the LLMVSubmissions table.
+        db.session.commit()
+        db.session.close()
+        return json_response({"success": True})
+
+    @llm_verifications.route(
+        "/admin/verify_cluster/<generation_id>/<status>", methods=["POST"]
+    )
+    @query_budget(statements=80, rows=300)
+    @admins_only
+    def verify_cluster(generation_id, status):
+        """Add a route for admins to grade a pending generation and all of its near-duplicates.
+
+        Arguments:
+            generation_id (int): The ID of any pending generation in the cluster.
+            status (str): The status to mark every generation in the cluster with.
+                Choose from `solve` or `fail`.
+
+        Returns:
+            JSON(dict): {'success': True, 'data': {'graded': [generation IDs]}}
+        """
+        grt_submission = LLMVGeneration.query.filter_by(id=generation_id).first_or_404()
+        cluster = pending_clusters(challenge_id=grt_submission.challenge_id).get(
+            grt_submission.id, [grt_submission.id]
+        )
+        log.info(
+            f'Admin "{get_current_user().name}" '
+            f'marked answer submissions {cluster} '
+            f'as "{status}"'
+        )
+        graded = []
+        for generation in LLMVGeneration.query.filter(LLMVGeneration.id.in_(cluster)):
+            if generation.status != "pending" and generation.id != grt_submission.id:
+                continue
+            grade_generation(generation, status)
+            graded.append(generation.id)
+        db.session.commit()
+        db.session.close()
+        return json_response({"success": True, "data": {"graded": graded}})
+
+    def grade_generation(grt_submission, status):
+        """Mark a generation as correct or incorrect without committing the session.
+
+        Arguments:
+            grt_submission (LLMVGeneration): The generation to mark.
+            status (str): `solve` or `fail`.
+
+        Raises:
+            BadRequest: If the status is not `solve` or `fail`, which translates to a 400
+                status code.
+        """
         challenge = LlmChallenge.query.filter_by(
             id=grt_submission.challenge_id
         ).first_or_404()
         log.debug(f"challenge: {challenge}")
+        progress = get_progress(
+            user_id=grt_submission.user_id,
+            challenge_id=grt_submission.challenge_id,
+            for_update=True,
+        )
         if status == "solve":
+            progress.apply_status_change(
+                grt_submission.model_id, grt_submission.status, "correct"
+            )
+            record_status_change(grt_submission, grt_submission.status, "correct")
+            note_status_change(grt_submission.id, "correct")
             LLMVGeneration.query.filter_by(id=grt_submission.id).update(
                 {"points": challenge.value, "status": "correct"}
             )
-            db.session.commit()
         # Otherwise, if the answer submission was marked "incorrect"...
         elif status == "fail":
             # Note that the answer submission failed its challenge in the (CTFd) Fails table.
             # Delete the award or solve from the LlmAwards or LlmSolves table.
+            progress.apply_status_change(
+                grt_submission.model_id, grt_submission.status, "incorrect"
+            )
+            record_status_change(grt_submission, grt_submission.status, "incorrect")
+            note_status_change(grt_submission.id, "incorrect")
 
             LLMVGeneration.query.filter_by(id=grt_submission.id).update(
                 {"points": 0, "status": "incorrect"}
@@ -495,11 +1227,7 @@ def add_routes() -> Blueprint:
             # ... then return a 400 status code and don't clear the answer submission from the CTFd "Submissions" table.
             raise BadRequest(
                 f'Invalid argument "{status}" '
-                f'passed to parameter "status" for marking answer submission "{generation_id}"'
+                f'passed to parameter "status" for marking answer submission "{grt_submission.id}"'
             )
-        # Delete the answer submission from CTFd's "Submissions" table, which also cascade-deletes the answer submission from the LLMVSubmissions table.
-        db.session.commit()
-        db.session.close()
-        return jsonify({"success": True})
 
     return llm_verifications
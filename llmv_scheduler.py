@@ -0,0 +1,147 @@
+"""Choose which model a new conversation is assigned to, based on live router load.
+
+Router calls are tracked per worker in `router_stats`. Strategies only see a snapshot of those
+stats, so they can be exercised without CTFd, Flask or a router.
+"""
+# Standard library imports.
+from contextlib import contextmanager
+from dataclasses import dataclass
+from logging import getLogger
+import random
+import threading
+import time
+
+log = getLogger(__name__)
+
+# Weight of the newest observation in the moving averages.
+EWMA_ALPHA = 0.2
+
+
+@dataclass
+class ModelLoad:
+    """Snapshot of one model's live router load."""
+
+    in_flight: int = 0
+    latency: float = 0.0
+    error_rate: float = 0.0
+    requests: int = 0
+    assignments: int = 0
+
+
+class RouterStats:
+    """Thread-safe per-model router latency, error rate, in-flight and assignment counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models = {}
+
+    def _load(self, model):
+        return self._models.setdefault(model, ModelLoad())
+
+    @contextmanager
+    def track(self, model):
+        """Record one router call for a model; use it around the HTTP request."""
+        with self._lock:
+            self._load(model).in_flight += 1
+        start = time.monotonic()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            elapsed = time.monotonic() - start
+            with self._lock:
+                load = self._load(model)
+                load.in_flight -= 1
+                load.requests += 1
+                if load.requests == 1:
+                    load.latency = elapsed
+                else:
+                    load.latency += EWMA_ALPHA * (elapsed - load.latency)
+                load.error_rate += EWMA_ALPHA * (float(failed) - load.error_rate)
+
+    def record_assignment(self, model):
+        with self._lock:
+            self._load(model).assignments += 1
+
+    def snapshot(self):
+        """Get a copy of every model's load that won't change under the caller."""
+        with self._lock:
+            return {model: ModelLoad(**vars(load)) for model, load in self._models.items()}
+
+
+class AssignmentStrategy:
+    """Base class for picking the model of a new conversation."""
+
+    name = None
+
+    def choose(self, models, loads, rng=random):
+        """Pick one of the models.
+
+        Arguments:
+            models (list[str]): Router names of the models that are still eligible for the
+                user (never empty).
+            loads (dict): Map of router model name to its `ModelLoad`. Models that haven't been
+                called yet are missing.
+            rng (optional): Source of randomness. Defaults to the `random` module.
+
+        Returns:
+            str: One of `models`.
+        """
+        raise NotImplementedError
+
+
+class RandomStrategy(AssignmentStrategy):
+    """Pick uniformly at random, ignoring load."""
+
+    name = "random"
+
+    def choose(self, models, loads, rng=random):
+        return rng.choice(models)
+
+
+class LeastOutstandingStrategy(AssignmentStrategy):
+    """Pick the model with the fewest in-flight router calls, breaking ties at random."""
+
+    name = "least_outstanding"
+
+    def choose(self, models, loads, rng=random):
+        in_flight = {model: loads.get(model, ModelLoad()).in_flight for model in models}
+        fewest = min(in_flight.values())
+        return rng.choice([model for model in models if in_flight[model] == fewest])
+
+
+class WeightedStrategy(AssignmentStrategy):
+    """Pick at random, weighted towards fast, reliable and idle models."""
+
+    name = "weighted"
+    # Latency (in seconds) assumed for models that haven't been called yet.
+    default_latency = 1.0
+
+    def weight(self, load):
+        latency = load.latency if load.requests else self.default_latency
+        return 1.0 / (
+            max(latency, 0.01) * (1.0 + 4.0 * load.error_rate) * (1.0 + load.in_flight)
+        )
+
+    def choose(self, models, loads, rng=random):
+        weights = [self.weight(loads.get(model, ModelLoad())) for model in models]
+        return rng.choices(models, weights=weights)[0]
+
+
+ASSIGNMENT_STRATEGIES = {
+    strategy.name: strategy
+    for strategy in (RandomStrategy, LeastOutstandingStrategy, WeightedStrategy)
+}
+DEFAULT_STRATEGY = LeastOutstandingStrategy.name
+
+# Router load seen by this worker.
+router_stats = RouterStats()
+
+
+def get_strategy(name):
+    """Get an assignment strategy by name, falling back to the default for unknown names."""
+    if name not in ASSIGNMENT_STRATEGIES:
+        log.warning(f'Unknown model assignment strategy "{name}", using "{DEFAULT_STRATEGY}"')
+        name = DEFAULT_STRATEGY
+    return ASSIGNMENT_STRATEGIES[name]()
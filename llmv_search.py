@@ -0,0 +1,162 @@
+"""Full-text search over LLMV conversations for admins and graders."""
+# Standard library imports.
+from logging import getLogger
+
+# Third-party imports.
+from sqlalchemy import Float, and_, column, func, literal, or_
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ColumnElement
+
+# CTFd imports.
+from CTFd.models import db
+from CTFd.utils.modes import get_model
+
+# LLM Verification Plugin module imports.
+from .llmv_compression import COMPRESSED_MARKER
+from .llmv_models import LLMVChatPair, LLMVGeneration, LlmChallenge, LlmModels
+
+log = getLogger(__name__)
+
+# Name of the SQLite FTS5 table that's kept in sync with `llmv_chat_pair` by triggers.
+SQLITE_FTS_TABLE = "llmv_chat_pair_fts"
+
+
+class MatchAgainst(ColumnElement):
+    """MariaDB/MySQL `MATCH (...) AGAINST (...)` relevance score for a FULLTEXT index."""
+
+    type = Float()
+    inherit_cache = True
+
+    def __init__(self, columns, terms):
+        self.columns = columns
+        self.terms = literal(terms)
+
+
+@compiles(MatchAgainst, "mysql")
+def compile_match_against(element, compiler, **kwargs):
+    columns = ", ".join(compiler.process(column, **kwargs) for column in element.columns)
+    terms = compiler.process(element.terms, **kwargs)
+    return f"MATCH ({columns}) AGAINST ({terms} IN NATURAL LANGUAGE MODE)"
+
+
+def _is_compressed(text_column):
+    """SQL condition for a `CompressedText` value that's stored compressed."""
+    return func.substr(text_column, 1, len(COMPRESSED_MARKER)) == COMPRESSED_MARKER
+
+
+def _fts5_query(terms):
+    """Quote each search word so user input can't be parsed as FTS5 query syntax."""
+    return " ".join('"' + word.replace('"', '""') + '"' for word in terms.split())
+
+
+def _ranked_pairs(terms):
+    """Build a query of `(LLMVChatPair, score)` rows that match the search terms.
+
+    The query uses the database's own full-text index when there is one (MariaDB/MySQL
+    FULLTEXT, SQLite FTS5) and falls back to a case-insensitive substring match otherwise.
+    Compressed values (see `compress_text`) can't be searched; a pair only matches on the
+    values it stores as plain text.
+
+    Returns:
+        tuple (query, score): The query and the score column to order by, with higher scores
+            being more relevant.
+    """
+    dialect = db.engine.dialect.name
+    if dialect == "mysql":
+        score = MatchAgainst((LLMVChatPair.prompt, LLMVChatPair.generation), terms)
+        query = db.session.query(LLMVChatPair, score.label("score")).filter(score > 0)
+    elif dialect == "sqlite":
+        # FTS5's bm25() is lower for better matches, so negate it.
+        matches = (
+            db.text(
+                f"SELECT rowid AS pair_id, -bm25({SQLITE_FTS_TABLE}) AS score "
+                f"FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH :terms"
+            )
+            .bindparams(terms=_fts5_query(terms))
+            .columns(column("pair_id"), column("score", Float))
+            .subquery("matches")
+        )
+        score = matches.c.score
+        query = db.session.query(LLMVChatPair, score.label("score")).join(
+            matches, matches.c.pair_id == LLMVChatPair.id
+        )
+    else:
+        log.warning(f'No full-text index for "{dialect}", falling back to substring search')
+        score = literal(1.0, Float)
+        pattern = f"%{terms}%"
+        query = db.session.query(LLMVChatPair, score.label("score")).filter(
+            or_(
+                and_(
+                    ~_is_compressed(LLMVChatPair.prompt), LLMVChatPair.prompt.ilike(pattern)
+                ),
+                and_(
+                    ~_is_compressed(LLMVChatPair.generation),
+                    LLMVChatPair.generation.ilike(pattern),
+                ),
+            )
+        )
+    # The index only holds compressed bytes for these, so any match on them is noise.
+    query = query.filter(
+        ~and_(_is_compressed(LLMVChatPair.prompt), _is_compressed(LLMVChatPair.generation))
+    )
+    return query, score
+
+
+def unsearchable_count(filters):
+    """Count the chat pairs whose prompt or generation is compressed, so can't be searched.
+
+    Arguments:
+        filters (dict, required): `LLMVGeneration` column filters, as for the search.
+    """
+    return (
+        db.session.query(func.count(LLMVChatPair.id))
+        .join(LLMVGeneration, LLMVChatPair.generation_id == LLMVGeneration.id)
+        .filter_by(**filters)
+        .filter(
+            or_(_is_compressed(LLMVChatPair.prompt), _is_compressed(LLMVChatPair.generation))
+        )
+        .scalar()
+    )
+
+
+def search_conversations(terms, filters, page, results_per_page=50):
+    """Search prompts and generations, ranked by relevance.
+
+    Arguments:
+        terms (str, required): The words to search for.
+        filters (dict, required): `LLMVGeneration` column filters, e.g. `challenge_id`,
+            `model_id`, `status` or `account_id`.
+        page (int, required): The 1-indexed page of results to return.
+        results_per_page (int, optional): Number of chat pairs per page. Defaults to 50.
+
+    Returns:
+        tuple (results, page_count): Rows of `(LLMVChatPair, score, LLMVGeneration,
+            challenge_name, model_name, team_name)` and the total number of pages.
+    """
+    Model = get_model()
+    query, score = _ranked_pairs(terms)
+    query = (
+        query.add_columns(
+            LLMVGeneration,
+            LlmChallenge.name.label("challenge_name"),
+            LlmModels.anon_name.label("model_name"),
+            Model.name.label("team_name"),
+        )
+        .join(LLMVGeneration, LLMVChatPair.generation_id == LLMVGeneration.id)
+        .filter_by(**filters)
+        .join(LlmChallenge, LlmChallenge.id == LLMVGeneration.challenge_id)
+        .join(LlmModels, LlmModels.id == LLMVGeneration.model_id)
+        .join(Model, Model.id == LLMVGeneration.account_id)
+    )
+    result_count = query.order_by(None).count()
+    page_count = int(result_count / results_per_page) + (
+        result_count % results_per_page > 0
+    )
+    page_start = results_per_page * (page - 1)
+    results = (
+        query.order_by(score.desc(), LLMVChatPair.date.desc())
+        .slice(page_start, page_start + results_per_page)
+        .all()
+    )
+    log.debug(f'Found {result_count} chat pairs matching "{terms}"')
+    return results, page_count
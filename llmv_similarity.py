@@ -0,0 +1,196 @@
+"""Near-duplicate detection for submitted generations with MinHash and LSH banding."""
+# Standard library imports.
+from collections import defaultdict
+from hashlib import blake2b
+from logging import getLogger
+import random
+import re
+from zlib import crc32
+
+# Third-party imports.
+from sqlalchemy import or_
+from sqlalchemy.orm import aliased
+
+# CTFd imports.
+from CTFd.models import db
+
+# LLM Verification Plugin module imports.
+from .llmv_models import (
+    LLMVChatPair,
+    LLMVFingerprint,
+    LLMVFingerprintBand,
+    LLMVGeneration,
+)
+
+log = getLogger(__name__)
+
+# Number of words in each shingle.
+SHINGLE_SIZE = 3
+# 16 bands of 4 rows put the LSH candidate threshold at a Jaccard similarity of about 0.5.
+BANDS = 16
+ROWS_PER_BAND = 4
+NUM_PERMUTATIONS = BANDS * ROWS_PER_BAND
+# Candidates must also have at least this estimated Jaccard similarity to be clustered.
+SIMILARITY_THRESHOLD = 0.7
+# Smallest prime larger than 2**32, used for the permutation hash family.
+_PRIME = 4294967311
+_rng = random.Random(0x11F)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME))
+    for _ in range(NUM_PERMUTATIONS)
+]
+
+
+def shingles(text):
+    """Split text into a set of hashed, normalized word shingles."""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {crc32(" ".join(words).encode())}
+    return {
+        crc32(" ".join(words[index : index + SHINGLE_SIZE]).encode())
+        for index in range(len(words) - SHINGLE_SIZE + 1)
+    }
+
+
+def minhash(text):
+    """Compute the MinHash signature of a text.
+
+    Returns:
+        list[int]: One minimum hash value per permutation.
+    """
+    hashed_shingles = shingles(text)
+    return [
+        min((a * shingle + b) % _PRIME for shingle in hashed_shingles)
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def band_buckets(signature):
+    """Hash each band of a MinHash signature into an LSH bucket key."""
+    buckets = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS_PER_BAND : (band + 1) * ROWS_PER_BAND]
+        digest = blake2b(",".join(map(str, rows)).encode(), digest_size=8)
+        buckets.append(digest.hexdigest())
+    return buckets
+
+
+def estimated_similarity(signature, other_signature):
+    """Estimate the Jaccard similarity of two texts from their MinHash signatures."""
+    matches = sum(1 for a, b in zip(signature, other_signature) if a == b)
+    return matches / NUM_PERMUTATIONS
+
+
+def index_generation(generation_id):
+    """Fingerprint a generation's conversation and add it to the similarity index.
+
+    The caller is responsible for committing the session.
+
+    Arguments:
+        generation_id (int, required): ID of the generation that was submitted.
+    """
+    if LLMVFingerprint.query.filter_by(generation_id=generation_id).first():
+        return
+    conversation = (
+        db.session.query(LLMVChatPair.prompt, LLMVChatPair.generation)
+        .filter_by(generation_id=generation_id)
+        .order_by(LLMVChatPair.date)
+        .all()
+    )
+    text = "\n".join(
+        f"{prompt or ''}\n{generation or ''}" for prompt, generation in conversation
+    )
+    signature = minhash(text)
+    db.session.add(
+        LLMVFingerprint(
+            generation_id=generation_id, signature=",".join(map(str, signature))
+        )
+    )
+    for band, bucket in enumerate(band_buckets(signature)):
+        db.session.add(
+            LLMVFingerprintBand(generation_id=generation_id, band=band, bucket=bucket)
+        )
+    log.debug(f"Indexed generation {generation_id} for near-duplicate detection")
+
+
+def pending_clusters(challenge_id=None, session=None, generation_ids=None):
+    """Group pending generations that are near-duplicates of each other.
+
+    Generations are only grouped with other generations of the same challenge.
+
+    Arguments:
+        challenge_id (int, optional): Only cluster this challenge's generations.
+        session (Session, optional): Session to read with. Defaults to CTFd's session.
+        generation_ids (list[int], optional): Only cluster these generations and their
+            near-duplicates (e.g. one page of the queue), instead of every pending generation.
+
+    Returns:
+        dict: Map of generation ID to the sorted IDs of every generation in its cluster.
+            Generations without near-duplicates aren't included.
+    """
+    session = session or db.session
+    other_band = aliased(LLMVFingerprintBand)
+    other_generation = aliased(LLMVGeneration)
+    candidates = (
+        session.query(LLMVFingerprintBand.generation_id, other_band.generation_id)
+        .join(
+            other_band,
+            (other_band.band == LLMVFingerprintBand.band)
+            & (other_band.bucket == LLMVFingerprintBand.bucket)
+            & (other_band.generation_id > LLMVFingerprintBand.generation_id),
+        )
+        .join(LLMVGeneration, LLMVGeneration.id == LLMVFingerprintBand.generation_id)
+        .join(other_generation, other_generation.id == other_band.generation_id)
+        .filter(
+            LLMVGeneration.status == "pending",
+            other_generation.status == "pending",
+            LLMVGeneration.challenge_id == other_generation.challenge_id,
+        )
+    )
+    if challenge_id is not None:
+        candidates = candidates.filter(LLMVGeneration.challenge_id == challenge_id)
+    if generation_ids is not None:
+        if not generation_ids:
+            return {}
+        candidates = candidates.filter(
+            or_(
+                LLMVFingerprintBand.generation_id.in_(generation_ids),
+                other_band.generation_id.in_(generation_ids),
+            )
+        )
+    candidates = set(candidates.all())
+    if not candidates:
+        return {}
+
+    generation_ids = {generation_id for pair in candidates for generation_id in pair}
+    signatures = {
+        generation_id: [int(value) for value in signature.split(",")]
+        for generation_id, signature in session.query(
+            LLMVFingerprint.generation_id, LLMVFingerprint.signature
+        ).filter(LLMVFingerprint.generation_id.in_(generation_ids))
+    }
+
+    # Union-find over the candidate pairs that are similar enough.
+    parents = {}
+
+    def find(generation_id):
+        parents.setdefault(generation_id, generation_id)
+        while parents[generation_id] != generation_id:
+            parents[generation_id] = parents[parents[generation_id]]
+            generation_id = parents[generation_id]
+        return generation_id
+
+    for generation_id, other_id in candidates:
+        similarity = estimated_similarity(signatures[generation_id], signatures[other_id])
+        if similarity >= SIMILARITY_THRESHOLD:
+            parents[find(other_id)] = find(generation_id)
+
+    members = defaultdict(list)
+    for generation_id in parents:
+        members[find(generation_id)].append(generation_id)
+    return {
+        generation_id: sorted(cluster)
+        for cluster in members.values()
+        if len(cluster) > 1
+        for generation_id in cluster
+    }
@@ -0,0 +1,324 @@
+"""Optional write-behind buffering of in-progress conversation turns in Redis.
+
+With the `write_behind` setting on (and CTFd configured with Redis), new turns of unsubmitted
+conversations are appended to a per-generation Redis list instead of being inserted into
+`llmv_chat_pair` one commit at a time. Buffered turns are flushed in batched inserts once
+they're `write_behind_flush_interval` seconds old, and always before a generation is
+submitted or a WebSocket chat session ends. `load_conversation` merges them with the stored
+turns, so readers don't see the difference.
+"""
+# Standard library imports.
+import datetime
+from json import dumps as json_dumps, loads as json_loads
+from logging import getLogger
+import threading
+import time
+from uuid import uuid4
+
+# CTFd imports.
+from CTFd.cache import cache
+from CTFd.models import db
+
+# LLM Verification Plugin module imports.
+from .config_manager import get_settings
+from .llmv_analytics import record_usage_totals
+from .llmv_models import LLMVChatPair, LLMVGeneration
+
+log = getLogger(__name__)
+
+# Sorted set of generation IDs with buffered turns, scored by when their oldest turn was buffered.
+DIRTY_KEY = "llmv_write_behind_dirty"
+
+# How long (in seconds) a flush may hold a generation's turns before another flush may take them.
+FLUSH_CLAIM_TIMEOUT = 60
+
+# Deletes a flush claim only if it's still the caller's, not one taken after it expired.
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+_last_flush = 0.0
+_flush_lock = threading.Lock()
+
+
+def _turns_key(generation_id):
+    return f"llmv_write_behind_turns_{generation_id}"
+
+
+def _uuid_key(turn_uuid):
+    return f"llmv_write_behind_uuid_{turn_uuid}"
+
+
+def _pending_key(turn_uuid):
+    return f"llmv_write_behind_pending_{turn_uuid}"
+
+
+def _claim_key(generation_id):
+    return f"llmv_write_behind_flushing_{generation_id}"
+
+
+def _expiry():
+    # Keep buffered state well past the point where it should have been flushed, in case
+    # flushing falls behind.
+    return max(get_settings().write_behind_flush_interval * 100, 3600)
+
+
+def redis_client():
+    """Get the Redis client behind CTFd's cache, or `None` if CTFd isn't using Redis."""
+    backend = getattr(cache, "cache", None)
+    return getattr(backend, "_write_client", None) or getattr(backend, "_client", None)
+
+
+def write_behind_enabled():
+    """Check whether new turns should be buffered in Redis."""
+    if not get_settings().write_behind:
+        return False
+    if redis_client() is None:
+        log.warning("Write-behind needs CTFd to use Redis; writing turns directly")
+        return False
+    return True
+
+
+def buffer_turn(generation, turn_uuid, prompt, completion, window):
+    """Buffer a new turn of an (already stored) generation.
+
+    Arguments:
+        generation (LLMVGeneration): The conversation the turn belongs to.
+        turn_uuid (str): The turn's idempotency UUID.
+        prompt (str): The user's prompt.
+        completion (Completion): The router's response.
+        window (ContextWindow): The history that was sent with the prompt.
+
+    Returns:
+        LLMVChatPair: A detached chat pair for the buffered turn.
+    """
+    now = datetime.datetime.utcnow()
+    turn = {
+        "uuid": turn_uuid,
+        "prompt": prompt,
+        "generation": completion.text,
+        "prompt_tokens": completion.prompt_tokens,
+        "generation_tokens": completion.generation_tokens,
+        "history_bytes": window.full_bytes,
+        "history_bytes_sent": window.sent_bytes,
+        "date": now.isoformat(),
+    }
+    expiry = _expiry()
+    pipeline = redis_client().pipeline()
+    pipeline.rpush(_turns_key(generation.id), json_dumps(turn))
+    pipeline.expire(_turns_key(generation.id), expiry)
+    pipeline.set(_uuid_key(turn_uuid), generation.id, ex=expiry)
+    pipeline.delete(_pending_key(turn_uuid))
+    pipeline.zadd(DIRTY_KEY, {str(generation.id): time.time()}, nx=True)
+    pipeline.execute()
+    maybe_flush()
+    return _chat_pair(generation.id, turn)
+
+
+def begin_buffered_turn(generation, turn_uuid):
+    """Remember which generation a turn is for before calling the router.
+
+    This stands in for the `LLMVPendingTurn` that's committed without write-behind, so a
+    client retrying a lost turn continues the same conversation (see `pending_generation_id`).
+    """
+    redis_client().set(_pending_key(turn_uuid), generation.id, ex=_expiry())
+
+
+def buffered_turn_generation_id(turn_uuid):
+    """Get the generation of a turn that was begun but never buffered, if there is one."""
+    client = redis_client()
+    if client is None:
+        return None
+    generation_id = client.get(_pending_key(turn_uuid))
+    return int(generation_id) if generation_id is not None else None
+
+
+def _chat_pair(generation_id, turn):
+    return LLMVChatPair(
+        generation_id=generation_id,
+        uuid=turn["uuid"],
+        prompt=turn["prompt"],
+        generation=turn["generation"],
+        prompt_tokens=turn["prompt_tokens"],
+        generation_tokens=turn["generation_tokens"],
+        date=datetime.datetime.fromisoformat(turn["date"]),
+    )
+
+
+def _buffered(generation_id):
+    client = redis_client()
+    if client is None:
+        return []
+    return [json_loads(turn) for turn in client.lrange(_turns_key(generation_id), 0, -1)]
+
+
+def buffered_pairs(generation_id):
+    """Get a generation's buffered turns as detached chat pairs, oldest first."""
+    return [_chat_pair(generation_id, turn) for turn in _buffered(generation_id)]
+
+
+def buffered_pair(turn_uuid):
+    """Get the buffered turn with an idempotency UUID as a detached chat pair, if there is one."""
+    client = redis_client()
+    if client is None:
+        return None
+    generation_id = client.get(_uuid_key(turn_uuid))
+    if generation_id is None:
+        return None
+    for pair in buffered_pairs(int(generation_id)):
+        if pair.uuid == turn_uuid:
+            return pair
+    return None
+
+
+def buffered_generation_ids():
+    """Get the IDs of the generations that have buffered turns."""
+    client = redis_client()
+    if client is None:
+        return []
+    return [int(generation_id) for generation_id in client.zrange(DIRTY_KEY, 0, -1)]
+
+
+def buffered_generation_count():
+    """Get the number of generations with turns waiting to be flushed."""
+    client = redis_client()
+    return client.zcard(DIRTY_KEY) if client is not None else 0
+
+
+def has_buffered_turns(generation_id):
+    client = redis_client()
+    return client is not None and client.zscore(DIRTY_KEY, str(generation_id)) is not None
+
+
+def flush_generations(generation_ids):
+    """Insert the buffered turns of some generations into `llmv_chat_pair` in one commit.
+
+    Each generation is claimed (with `SET NX`) before its turns are read, and generations that
+    another flush has claimed are skipped, so concurrent flushes never insert or drop the same
+    turns. Turns are only removed from Redis after the commit, and turns whose UUID is already
+    stored are skipped, so a flush that's interrupted can simply be repeated.
+
+    Returns:
+        int: The number of turns inserted.
+    """
+    client = redis_client()
+    if client is None or not generation_ids:
+        return 0
+    token = uuid4().hex
+    claimed = [
+        generation_id
+        for generation_id in generation_ids
+        if client.set(_claim_key(generation_id), token, nx=True, ex=FLUSH_CLAIM_TIMEOUT)
+    ]
+    try:
+        return _flush_claimed(client, claimed)
+    finally:
+        for generation_id in claimed:
+            client.eval(_RELEASE_SCRIPT, 1, _claim_key(generation_id), token)
+
+
+def _flush_claimed(client, generation_ids):
+    if not generation_ids:
+        return 0
+    buffered = {generation_id: _buffered(generation_id) for generation_id in generation_ids}
+    uuids = [turn["uuid"] for turns in buffered.values() for turn in turns]
+    if not uuids:
+        client.zrem(DIRTY_KEY, *[str(generation_id) for generation_id in generation_ids])
+        return 0
+    stored = {
+        turn_uuid
+        for (turn_uuid,) in db.session.query(LLMVChatPair.uuid).filter(
+            LLMVChatPair.uuid.in_(uuids)
+        )
+    }
+    generations = {
+        generation.id: generation
+        for generation in LLMVGeneration.query.filter(
+            LLMVGeneration.id.in_(list(buffered))
+        )
+    }
+    inserted = 0
+    for generation_id, turns in buffered.items():
+        generation = generations.get(generation_id)
+        new_turns = [turn for turn in turns if turn["uuid"] not in stored]
+        if generation is None or not new_turns:
+            continue
+        db.session.add_all(_chat_pair(generation_id, turn) for turn in new_turns)
+        record_usage_totals(
+            generation.account_id,
+            generation.challenge_id,
+            requests=len(new_turns),
+            prompt_tokens=sum(turn["prompt_tokens"] for turn in new_turns),
+            generation_tokens=sum(turn["generation_tokens"] for turn in new_turns),
+            history_bytes=sum(turn["history_bytes"] for turn in new_turns),
+            history_bytes_sent=sum(turn["history_bytes_sent"] for turn in new_turns),
+        )
+        inserted += len(new_turns)
+    db.session.commit()
+
+    pipeline = client.pipeline()
+    for generation_id, turns in buffered.items():
+        # Only drop the turns that were flushed; more may have been buffered meanwhile.
+        pipeline.ltrim(_turns_key(generation_id), len(turns), -1)
+        for turn in turns:
+            pipeline.delete(_uuid_key(turn["uuid"]))
+    pipeline.execute()
+    for generation_id in buffered:
+        if not client.llen(_turns_key(generation_id)):
+            client.zrem(DIRTY_KEY, str(generation_id))
+    log.debug(f"Flushed {inserted} buffered turns of {len(buffered)} generations")
+    return inserted
+
+
+def flush_generation(generation_id):
+    """Flush one generation's buffered turns, e.g. before it's submitted."""
+    if not has_buffered_turns(generation_id):
+        return 0
+    return flush_generations([generation_id])
+
+
+def flush_due(batch_size=None, max_age=None):
+    """Flush the generations whose oldest buffered turn is older than the durability bound.
+
+    Arguments:
+        batch_size (int, optional): Generations flushed per commit. Defaults to the
+            `write_behind_batch_size` setting.
+        max_age (float, optional): Age in seconds after which turns are flushed. Defaults to
+            the `write_behind_flush_interval` setting.
+
+    Returns:
+        int: The number of turns inserted.
+    """
+    client = redis_client()
+    if client is None:
+        return 0
+    settings = get_settings()
+    batch_size = batch_size or settings.write_behind_batch_size
+    max_age = settings.write_behind_flush_interval if max_age is None else max_age
+    due = [
+        int(generation_id)
+        for generation_id in client.zrangebyscore(DIRTY_KEY, "-inf", time.time() - max_age)
+    ]
+    inserted = 0
+    for start in range(0, len(due), batch_size):
+        inserted += flush_generations(due[start : start + batch_size])
+    return inserted
+
+
+def maybe_flush():
+    """Flush due turns from the request path, at most once per flush interval per worker."""
+    global _last_flush
+    interval = get_settings().write_behind_flush_interval
+    with _flush_lock:
+        if time.monotonic() - _last_flush < interval:
+            return
+        _last_flush = time.monotonic()
+    try:
+        flush_due()
+    except Exception as error:
+        # The turns stay buffered for the next flush.
+        db.session.rollback()
+        log.error(f"Failed to flush buffered turns: {error}")
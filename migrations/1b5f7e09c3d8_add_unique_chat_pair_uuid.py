@@ -0,0 +1,33 @@
+"""Add unique constraint for LLMVChatPair idempotency UUIDs
+
+Revision ID: 1b5f7e09c3d8
+Revises: f08d2c6e91a5
+Create Date: 2026-10-19 15:08:44.612093
+
+"""
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "1b5f7e09c3d8"
+down_revision = "f08d2c6e91a5"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(op=None):
+    bind = op.get_bind()
+    url = str(bind.engine.url)
+    # MySQL can't index a TEXT column without a prefix length, so match the model's type.
+    if not url.startswith("sqlite"):
+        op.alter_column(
+            "llmv_chat_pair",
+            "uuid",
+            type_=sa.String(80),
+            existing_type=sa.Text(),
+            existing_nullable=False,
+        )
+    op.create_index("llmv_chat_pair_uuid", "llmv_chat_pair", ["uuid"], unique=True)
+
+
+def downgrade(op=None):
+    op.drop_index("llmv_chat_pair_uuid", "llmv_chat_pair")
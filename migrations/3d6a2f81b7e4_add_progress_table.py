@@ -0,0 +1,115 @@
+"""Add per-user challenge progress tables
+
+Revision ID: 3d6a2f81b7e4
+Revises: 1b5f7e09c3d8
+Create Date: 2026-10-19 16:31:52.044178
+
+"""
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "3d6a2f81b7e4"
+down_revision = "1b5f7e09c3d8"
+branch_labels = None
+depends_on = None
+
+SUBMITTED_STATUSES = ("pending", "correct", "awarded", "incorrect")
+
+
+def upgrade(op=None):
+    progress = op.create_table(
+        "llmv_progress",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("challenge_id", sa.Integer(), nullable=True),
+        sa.Column("pending", sa.Integer(), nullable=False),
+        sa.Column("correct", sa.Integer(), nullable=False),
+        sa.Column("awarded", sa.Integer(), nullable=False),
+        sa.Column("incorrect", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["challenge_id"], ["challenges.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("user_id", "challenge_id"),
+    )
+    progress_model = op.create_table(
+        "llmv_progress_model",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("progress_id", sa.Integer(), nullable=True),
+        sa.Column("model_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["progress_id"], ["llmv_progress.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["model_id"], ["llm_models.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("progress_id", "model_id"),
+    )
+    op.create_index(
+        "llmv_generation_user_challenge", "llmv_generation", ["user_id", "challenge_id"]
+    )
+
+    # Backfill progress from the generations that have already been submitted.
+    generation = sa.table(
+        "llmv_generation",
+        sa.column("user_id"),
+        sa.column("challenge_id"),
+        sa.column("model_id"),
+        sa.column("status"),
+    )
+    bind = op.get_bind()
+    rows = bind.execute(
+        sa.select(
+            generation.c.user_id,
+            generation.c.challenge_id,
+            generation.c.status,
+            sa.func.count(),
+        )
+        .where(generation.c.status.in_(SUBMITTED_STATUSES))
+        .group_by(generation.c.user_id, generation.c.challenge_id, generation.c.status)
+    )
+    backfill = {}
+    for user_id, challenge_id, status, count in rows:
+        entry = backfill.setdefault(
+            (user_id, challenge_id),
+            {
+                "user_id": user_id,
+                "challenge_id": challenge_id,
+                **{submitted_status: 0 for submitted_status in SUBMITTED_STATUSES},
+            },
+        )
+        entry[status] += count
+    if not backfill:
+        return
+    op.bulk_insert(progress, list(backfill.values()))
+
+    # Then the models each user has submitted, now that the progress rows have IDs.
+    progress_rows = sa.table(
+        "llmv_progress",
+        sa.column("id"),
+        sa.column("user_id"),
+        sa.column("challenge_id"),
+    )
+    submitted = bind.execute(
+        sa.select(progress_rows.c.id, generation.c.model_id)
+        .select_from(
+            progress_rows.join(
+                generation,
+                sa.and_(
+                    generation.c.user_id == progress_rows.c.user_id,
+                    generation.c.challenge_id == progress_rows.c.challenge_id,
+                ),
+            )
+        )
+        .where(generation.c.status.in_(SUBMITTED_STATUSES))
+        .distinct()
+    )
+    op.bulk_insert(
+        progress_model,
+        [
+            {"progress_id": progress_id, "model_id": model_id}
+            for progress_id, model_id in submitted
+        ],
+    )
+
+
+def downgrade(op=None):
+    op.drop_index("llmv_generation_user_challenge", "llmv_generation")
+    op.drop_table("llmv_progress_model")
+    op.drop_table("llmv_progress")
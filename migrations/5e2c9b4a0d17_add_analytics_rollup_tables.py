@@ -0,0 +1,56 @@
+"""Add analytics rollup tables
+
+Revision ID: 5e2c9b4a0d17
+Revises: 3d6a2f81b7e4
+Create Date: 2026-10-19 18:12:06.395521
+
+"""
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "5e2c9b4a0d17"
+down_revision = "3d6a2f81b7e4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(op=None):
+    op.add_column(
+        "llmv_generation", sa.Column("submitted_date", sa.DateTime(), nullable=True)
+    )
+    op.create_table(
+        "llmv_rollup_model",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("challenge_id", sa.Integer(), nullable=True),
+        sa.Column("model_id", sa.Integer(), nullable=True),
+        sa.Column("generations", sa.Integer(), nullable=False),
+        sa.Column("submissions", sa.Integer(), nullable=False),
+        sa.Column("pending", sa.Integer(), nullable=False),
+        sa.Column("correct", sa.Integer(), nullable=False),
+        sa.Column("awarded", sa.Integer(), nullable=False),
+        sa.Column("incorrect", sa.Integer(), nullable=False),
+        sa.Column("correct_turns", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["challenge_id"], ["challenges.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["model_id"], ["llm_models.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("challenge_id", "model_id"),
+    )
+    op.create_table(
+        "llmv_rollup_hourly",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("hour", sa.DateTime(), nullable=False),
+        sa.Column("challenge_id", sa.Integer(), nullable=True),
+        sa.Column("submissions", sa.Integer(), nullable=False),
+        sa.Column("pending", sa.Integer(), nullable=False),
+        sa.Column("graded", sa.Integer(), nullable=False),
+        sa.Column("correct", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["challenge_id"], ["challenges.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("hour", "challenge_id"),
+    )
+
+
+def downgrade(op=None):
+    op.drop_table("llmv_rollup_hourly")
+    op.drop_table("llmv_rollup_model")
+    op.drop_column("llmv_generation", "submitted_date")
@@ -0,0 +1,52 @@
+"""Add token accounting and budgets
+
+Revision ID: 7a4e1c58f2b9
+Revises: 5e2c9b4a0d17
+Create Date: 2026-10-19 19:40:27.881350
+
+"""
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "7a4e1c58f2b9"
+down_revision = "5e2c9b4a0d17"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(op=None):
+    op.add_column(
+        "llmv_chat_pair",
+        sa.Column("prompt_tokens", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.add_column(
+        "llmv_chat_pair",
+        sa.Column("generation_tokens", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.add_column(
+        "llm_challenge",
+        sa.Column("token_budget", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.create_table(
+        "llmv_rollup_usage",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("account_id", sa.Integer(), nullable=True),
+        sa.Column("challenge_id", sa.Integer(), nullable=True),
+        sa.Column("requests", sa.Integer(), nullable=False),
+        sa.Column("prompt_tokens", sa.BigInteger(), nullable=False),
+        sa.Column("generation_tokens", sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(["challenge_id"], ["challenges.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("account_id", "challenge_id"),
+    )
+    op.create_index(
+        "ix_llmv_rollup_usage_account_id", "llmv_rollup_usage", ["account_id"]
+    )
+
+
+def downgrade(op=None):
+    op.drop_index("ix_llmv_rollup_usage_account_id", "llmv_rollup_usage")
+    op.drop_table("llmv_rollup_usage")
+    op.drop_column("llm_challenge", "token_budget")
+    op.drop_column("llmv_chat_pair", "generation_tokens")
+    op.drop_column("llmv_chat_pair", "prompt_tokens")
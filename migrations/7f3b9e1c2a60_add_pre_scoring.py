@@ -0,0 +1,30 @@
+"""Add submission pre-scores and challenge scoring rules
+
+Revision ID: 7f3b9e1c2a60
+Revises: d5a06e2b8f41
+Create Date: 2026-10-19 23:41:17.204518
+
+"""
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "7f3b9e1c2a60"
+down_revision = "d5a06e2b8f41"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(op=None):
+    op.add_column("llmv_generation", sa.Column("score", sa.Float(), nullable=True))
+    op.add_column("llmv_generation", sa.Column("score_details", sa.Text(), nullable=True))
+    op.create_index(
+        "llmv_generation_status_score", "llmv_generation", ["status", "score"]
+    )
+    op.add_column("llm_challenge", sa.Column("score_rules", sa.Text(), nullable=True))
+
+
+def downgrade(op=None):
+    op.drop_column("llm_challenge", "score_rules")
+    op.drop_index("llmv_generation_status_score", "llmv_generation")
+    op.drop_column("llmv_generation", "score_details")
+    op.drop_column("llmv_generation", "score")
@@ -0,0 +1,37 @@
+"""Add the date generations were first graded
+
+Revision ID: 8d1f5a3c7e26
+Revises: 7f3b9e1c2a60
+Create Date: 2026-10-20 10:03:27.519362
+
+"""
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "8d1f5a3c7e26"
+down_revision = "7f3b9e1c2a60"
+branch_labels = None
+depends_on = None
+
+GRADED_STATUSES = ("correct", "awarded", "incorrect")
+
+
+def upgrade(op=None):
+    op.add_column("llmv_generation", sa.Column("graded_date", sa.DateTime(), nullable=True))
+
+    # Grading times weren't stored before, so use the submission times as the closest guess.
+    generation = sa.table(
+        "llmv_generation",
+        sa.column("status"),
+        sa.column("submitted_date"),
+        sa.column("graded_date"),
+    )
+    op.get_bind().execute(
+        generation.update()
+        .where(generation.c.status.in_(GRADED_STATUSES))
+        .values(graded_date=generation.c.submitted_date)
+    )
+
+
+def downgrade(op=None):
+    op.drop_column("llmv_generation", "graded_date")
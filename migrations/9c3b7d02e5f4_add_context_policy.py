@@ -0,0 +1,42 @@
+"""Add challenge context policies
+
+Revision ID: 9c3b7d02e5f4
+Revises: 7a4e1c58f2b9
+Create Date: 2026-10-19 20:12:44.613208
+
+"""
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "9c3b7d02e5f4"
+down_revision = "7a4e1c58f2b9"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(op=None):
+    op.add_column(
+        "llm_challenge",
+        sa.Column("context_policy", sa.String(32), nullable=False, server_default="full"),
+    )
+    op.add_column(
+        "llm_challenge",
+        sa.Column("context_limit", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.add_column(
+        "llmv_rollup_usage",
+        sa.Column("history_bytes", sa.BigInteger(), nullable=False, server_default="0"),
+    )
+    op.add_column(
+        "llmv_rollup_usage",
+        sa.Column(
+            "history_bytes_sent", sa.BigInteger(), nullable=False, server_default="0"
+        ),
+    )
+
+
+def downgrade(op=None):
+    op.drop_column("llmv_rollup_usage", "history_bytes_sent")
+    op.drop_column("llmv_rollup_usage", "history_bytes")
+    op.drop_column("llm_challenge", "context_limit")
+    op.drop_column("llm_challenge", "context_policy")
@@ -0,0 +1,61 @@
+"""Add full-text index for LLMVChatPair prompts and generations
+
+Revision ID: a3c91f4e27b0
+Revises: 796539001f95
+Create Date: 2026-10-19 10:02:41.118203
+
+"""
+# revision identifiers, used by Alembic.
+revision = "a3c91f4e27b0"
+down_revision = "796539001f95"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(op=None):
+    bind = op.get_bind()
+    url = str(bind.engine.url)
+    if url.startswith("mysql"):
+        op.create_index(
+            "llmv_chat_pair_fulltext",
+            "llmv_chat_pair",
+            ["prompt", "generation"],
+            mysql_prefix="FULLTEXT",
+        )
+    elif url.startswith("sqlite"):
+        # FTS5 table backed by `llmv_chat_pair` and kept in sync by triggers.
+        op.execute(
+            "CREATE VIRTUAL TABLE llmv_chat_pair_fts USING fts5("
+            "prompt, generation, content='llmv_chat_pair', content_rowid='id')"
+        )
+        op.execute(
+            "CREATE TRIGGER llmv_chat_pair_fts_insert AFTER INSERT ON llmv_chat_pair BEGIN "
+            "INSERT INTO llmv_chat_pair_fts(rowid, prompt, generation) "
+            "VALUES (new.id, new.prompt, new.generation); END"
+        )
+        op.execute(
+            "CREATE TRIGGER llmv_chat_pair_fts_delete AFTER DELETE ON llmv_chat_pair BEGIN "
+            "INSERT INTO llmv_chat_pair_fts(llmv_chat_pair_fts, rowid, prompt, generation) "
+            "VALUES ('delete', old.id, old.prompt, old.generation); END"
+        )
+        op.execute(
+            "CREATE TRIGGER llmv_chat_pair_fts_update AFTER UPDATE ON llmv_chat_pair BEGIN "
+            "INSERT INTO llmv_chat_pair_fts(llmv_chat_pair_fts, rowid, prompt, generation) "
+            "VALUES ('delete', old.id, old.prompt, old.generation); "
+            "INSERT INTO llmv_chat_pair_fts(rowid, prompt, generation) "
+            "VALUES (new.id, new.prompt, new.generation); END"
+        )
+        # Index the conversations that already exist.
+        op.execute("INSERT INTO llmv_chat_pair_fts(llmv_chat_pair_fts) VALUES ('rebuild')")
+
+
+def downgrade(op=None):
+    bind = op.get_bind()
+    url = str(bind.engine.url)
+    if url.startswith("mysql"):
+        op.drop_index("llmv_chat_pair_fulltext", "llmv_chat_pair")
+    elif url.startswith("sqlite"):
+        op.execute("DROP TRIGGER IF EXISTS llmv_chat_pair_fts_insert")
+        op.execute("DROP TRIGGER IF EXISTS llmv_chat_pair_fts_delete")
+        op.execute("DROP TRIGGER IF EXISTS llmv_chat_pair_fts_update")
+        op.execute("DROP TABLE IF EXISTS llmv_chat_pair_fts")
@@ -0,0 +1,41 @@
+"""Add pending turn table
+
+Revision ID: b2d84f6a1c37
+Revises: 9c3b7d02e5f4
+Create Date: 2026-10-19 21:05:18.402716
+
+"""
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "b2d84f6a1c37"
+down_revision = "9c3b7d02e5f4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(op=None):
+    op.create_table(
+        "llmv_pending_turn",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("uuid", sa.String(80), nullable=True),
+        sa.Column("generation_id", sa.Integer(), nullable=True),
+        sa.Column("prompt", sa.Text(), nullable=True),
+        sa.Column("date", sa.DateTime(), nullable=True),
+        sa.Column("attempts", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["generation_id"], ["llmv_generation.id"], ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("uuid"),
+    )
+    op.create_index(
+        "ix_llmv_pending_turn_generation_id", "llmv_pending_turn", ["generation_id"]
+    )
+    op.create_index("ix_llmv_pending_turn_date", "llmv_pending_turn", ["date"])
+
+
+def downgrade(op=None):
+    op.drop_index("ix_llmv_pending_turn_date", "llmv_pending_turn")
+    op.drop_index("ix_llmv_pending_turn_generation_id", "llmv_pending_turn")
+    op.drop_table("llmv_pending_turn")
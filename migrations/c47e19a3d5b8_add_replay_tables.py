@@ -0,0 +1,59 @@
+"""Add replay run and result tables
+
+Revision ID: c47e19a3d5b8
+Revises: b2d84f6a1c37
+Create Date: 2026-10-19 21:48:52.117093
+
+"""
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "c47e19a3d5b8"
+down_revision = "b2d84f6a1c37"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(op=None):
+    op.create_table(
+        "llmv_replay_run",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(128), nullable=True),
+        sa.Column("generation_ids", sa.Text(), nullable=True),
+        sa.Column("models", sa.Text(), nullable=True),
+        sa.Column("status", sa.String(32), nullable=True),
+        sa.Column("elapsed", sa.Float(), nullable=True),
+        sa.Column("date", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "llmv_replay_result",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("run_id", sa.Integer(), nullable=True),
+        sa.Column("generation_id", sa.Integer(), nullable=True),
+        sa.Column("model", sa.String(80), nullable=True),
+        sa.Column("status", sa.String(32), nullable=True),
+        sa.Column("turns", sa.Text(), nullable=True),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("prompt_tokens", sa.Integer(), nullable=True),
+        sa.Column("generation_tokens", sa.Integer(), nullable=True),
+        sa.Column("duration", sa.Float(), nullable=True),
+        sa.Column("date", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["run_id"], ["llmv_replay_run.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(
+            ["generation_id"], ["llmv_generation.id"], ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("run_id", "generation_id", "model"),
+    )
+    op.create_index("ix_llmv_replay_result_run_id", "llmv_replay_result", ["run_id"])
+    op.create_index(
+        "ix_llmv_replay_result_generation_id", "llmv_replay_result", ["generation_id"]
+    )
+
+
+def downgrade(op=None):
+    op.drop_index("ix_llmv_replay_result_generation_id", "llmv_replay_result")
+    op.drop_index("ix_llmv_replay_result_run_id", "llmv_replay_result")
+    op.drop_table("llmv_replay_result")
+    op.drop_table("llmv_replay_run")
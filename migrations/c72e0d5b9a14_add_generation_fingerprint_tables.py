@@ -0,0 +1,46 @@
+"""Add generation fingerprint tables for near-duplicate detection
+
+Revision ID: c72e0d5b9a14
+Revises: a3c91f4e27b0
+Create Date: 2026-10-19 11:24:09.530871
+
+"""
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "c72e0d5b9a14"
+down_revision = "a3c91f4e27b0"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(op=None):
+    op.create_table(
+        "llmv_fingerprint",
+        sa.Column("generation_id", sa.Integer(), nullable=False),
+        sa.Column("signature", sa.Text(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["generation_id"], ["llmv_generation.id"], ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("generation_id"),
+    )
+    op.create_table(
+        "llmv_fingerprint_band",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("generation_id", sa.Integer(), nullable=False),
+        sa.Column("band", sa.Integer(), nullable=False),
+        sa.Column("bucket", sa.String(16), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["generation_id"], ["llmv_generation.id"], ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "llmv_fingerprint_band_bucket", "llmv_fingerprint_band", ["band", "bucket"]
+    )
+
+
+def downgrade(op=None):
+    op.drop_index("llmv_fingerprint_band_bucket", "llmv_fingerprint_band")
+    op.drop_table("llmv_fingerprint_band")
+    op.drop_table("llmv_fingerprint")
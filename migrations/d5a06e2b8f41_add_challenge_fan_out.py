@@ -0,0 +1,25 @@
+"""Add challenge fan-out setting
+
+Revision ID: d5a06e2b8f41
+Revises: c47e19a3d5b8
+Create Date: 2026-10-19 22:26:03.551870
+
+"""
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "d5a06e2b8f41"
+down_revision = "c47e19a3d5b8"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(op=None):
+    op.add_column(
+        "llm_challenge",
+        sa.Column("fan_out", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade(op=None):
+    op.drop_column("llm_challenge", "fan_out")
@@ -0,0 +1,32 @@
+"""Add chat archive table for graded conversations
+
+Revision ID: e41b8a7d3f62
+Revises: c72e0d5b9a14
+Create Date: 2026-10-19 12:47:30.204517
+
+"""
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "e41b8a7d3f62"
+down_revision = "c72e0d5b9a14"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(op=None):
+    op.create_table(
+        "llmv_chat_archive",
+        sa.Column("generation_id", sa.Integer(), nullable=False),
+        sa.Column("pair_count", sa.Integer(), nullable=False),
+        sa.Column("pairs", sa.LargeBinary(length=(2**32) - 1), nullable=False),
+        sa.Column("date", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["generation_id"], ["llmv_generation.id"], ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("generation_id"),
+    )
+
+
+def downgrade(op=None):
+    op.drop_table("llmv_chat_archive")
@@ -0,0 +1,27 @@
+"""Backfill compression of large LLMV text columns
+
+Revision ID: f08d2c6e91a5
+Revises: e41b8a7d3f62
+Create Date: 2026-10-19 13:55:12.781940
+
+"""
+from CTFd.plugins.llm_verification.llmv_compression import (
+    backfill_compression,
+    compression_enabled,
+)
+
+# revision identifiers, used by Alembic.
+revision = "f08d2c6e91a5"
+down_revision = "e41b8a7d3f62"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(op=None):
+    # Compression is opt-in; `flask llmv compress` backfills if it's turned on later.
+    if compression_enabled():
+        backfill_compression(op.get_bind())
+
+
+def downgrade(op=None):
+    pass
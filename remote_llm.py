@@ -1,17 +1,86 @@
 """RESTful API calls to remote LLMs."""
 # Standard library imports.
-import os
 from ast import List
+from dataclasses import dataclass
 from logging import getLogger
+from math import ceil
+import threading
 from typing import Dict
 
 
 # Third-party imports.
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import HTTPError
 
+# LLM Verification Plugin module imports.
+from .config_manager import get_settings
+from .llmv_scheduler import router_stats
+
 log = getLogger(__name__)
 
+# Rough number of characters per token, used when the router doesn't report token usage.
+CHARS_PER_TOKEN = 4
+
+
+@dataclass
+class Completion:
+    """Text generated by the router and the number of tokens it cost."""
+
+    text: str
+    prompt_tokens: int
+    generation_tokens: int
+
+    @property
+    def tokens(self):
+        return self.prompt_tokens + self.generation_tokens
+
+
+class RouterUnavailable(HTTPError):
+    """The router couldn't be reached or didn't answer in time.
+
+    It may still have generated (and charged for) the completion, which it returns again for
+    the same idempotency UUID.
+    """
+
+
+_session_lock = threading.Lock()
+_sessions = {}
+
+
+def router_session(settings):
+    """Get a pooled HTTP session to the router, sized by the `router_pool_size` setting."""
+    with _session_lock:
+        session = _sessions.get(settings.router_pool_size)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=settings.router_pool_size,
+                pool_maxsize=settings.router_pool_size,
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[settings.router_pool_size] = session
+        return session
+
+
+def router_endpoint(settings, path):
+    """Get the router URL and auth headers for an endpoint.
+
+    Raises:
+        ValueError: If the router URL or token isn't set.
+    """
+    if settings.router_url is None:
+        raise ValueError("LLM Verification Router URL is not set")
+    if settings.router_token is None:
+        raise ValueError("LLM Verification Router token is not set")
+    return settings.router_url + path, {"Authorization": f"Bearer {settings.router_token}"}
+
+
+def estimate_tokens(*texts):
+    """Estimate the number of tokens in some text from its length."""
+    return ceil(sum(len(text or "") for text in texts) / CHARS_PER_TOKEN)
+
 
 def generate_text(idempotency_uuid, preprompt, prompt, model, history=None):
     if history is None:
@@ -24,73 +93,80 @@ def generate_text(idempotency_uuid, preprompt, prompt, model, history=None):
 
     Raises:
         ValueError: If the Vanilla Neox API key is not set.
+        RouterUnavailable: If the router can't be reached or times out.
         HTTPError: If the EleutherAI API returns a non-200 HTTP status code.
 
     Returns:
-        str: Text generated by the prompt.
+        Completion: Text generated by the prompt, with the router's token usage (or an
+            estimate from the text's length if the router doesn't report it).
     """
-    url = os.environ.get("LLMV_ROUTER_URL")
-    if url is None:
-        raise ValueError("LLM Verification Router URL is not set")
-    route = url + "/chat/generate"
-    token = os.environ.get("LLMV_ROUTER_TOKEN")
-    if token is None:
-        raise ValueError("LLM Verification Router token is not set")
+    settings = get_settings()
+    route, headers = router_endpoint(settings, "/chat/generate")
 
     log.info(
         f'Received text generation request for prompt "{prompt}" for model {model}'
     )
 
-    try:
-        raw_response = requests.post(
-            url=route,
-            headers={"Authorization": f"Bearer {token}"},
-            json={
-                "uuid": idempotency_uuid,
-                "prompt": prompt,
-                "system": preprompt,
-                "model": model,
-                "history": history,
-            },
-        )
-    except (requests.Timeout, requests.ConnectionError) as error:
-        log.debug(error)
-        # try again, with idempotency key
-        pass
-    except requests.ConnectionError:
-        pass
-
-    if raw_response.status_code == 200:
-        json_response = raw_response.json()
-        if json_response.get("error") is not None:
-            log.error(f"Error generating: {json_response['error']}")
-            raise HTTPError("Model Error")
-
-        return json_response["generation"]
-    elif 400 <= raw_response.status_code <= 599:
-        # ... raise an error.
-        raise HTTPError(
-            f"LLM Router API returned error status code {raw_response.status_code}: "
-            f"Response: {raw_response.json()}"
-        )
-    # ... Otherwise, if it's an unrecognized HTTP status code, then...
-    else:
-        raise HTTPError(
-            f"LLM Router API returned unrecognized status code {raw_response.status_code}: "
-            f"Response: {raw_response.json()}"
-        )
+    # Track latency, errors and in-flight calls per model for load-aware model assignment.
+    with router_stats.track(model):
+        try:
+            raw_response = router_session(settings).post(
+                url=route,
+                headers=headers,
+                json={
+                    "uuid": idempotency_uuid,
+                    "prompt": prompt,
+                    "system": preprompt,
+                    "model": model,
+                    "history": history,
+                },
+                timeout=(settings.router_connect_timeout, settings.router_timeout),
+            )
+        except (requests.Timeout, requests.ConnectionError) as error:
+            log.error(f"Could not reach the LLM Router: {error}")
+            # The client can retry with the same idempotency key.
+            raise RouterUnavailable("LLM Router unavailable") from error
+
+        if raw_response.status_code == 200:
+            json_response = raw_response.json()
+            if json_response.get("error") is not None:
+                log.error(f"Error generating: {json_response['error']}")
+                raise HTTPError("Model Error")
+
+            usage = json_response.get("usage") or {}
+            history_texts = [
+                text for turn in history for text in (turn["prompt"], turn["generation"])
+            ]
+            return Completion(
+                text=json_response["generation"],
+                prompt_tokens=usage.get("prompt_tokens")
+                or estimate_tokens(preprompt, prompt, *history_texts),
+                generation_tokens=usage.get("completion_tokens")
+                or estimate_tokens(json_response["generation"]),
+            )
+        elif 400 <= raw_response.status_code <= 599:
+            # ... raise an error.
+            raise HTTPError(
+                f"LLM Router API returned error status code {raw_response.status_code}: "
+                f"Response: {raw_response.json()}"
+            )
+        # ... Otherwise, if it's an unrecognized HTTP status code, then...
+        else:
+            raise HTTPError(
+                f"LLM Router API returned unrecognized status code {raw_response.status_code}: "
+                f"Response: {raw_response.json()}"
+            )
 
 
 def get_models():
-    url = os.environ.get("LLMV_ROUTER_URL")
-    if url is None:
-        raise ValueError("LLM Verification Router URL is not set")
-    route = url + "/chat/models"
-    token = os.environ.get("LLMV_ROUTER_TOKEN")
-    if token is None:
-        raise ValueError("LLM Verification Router token is not set")
+    settings = get_settings()
+    route, headers = router_endpoint(settings, "/chat/models")
     log.info(f"Getting models from {route}")
-    raw_response = requests.get(url=route, headers={"Authorization": f"Bearer {token}"})
+    raw_response = router_session(settings).get(
+        url=route,
+        headers=headers,
+        timeout=(settings.router_connect_timeout, settings.router_timeout),
+    )
 
     if raw_response.status_code == 200:
         json_response = raw_response.json()
@@ -0,0 +1,159 @@
+"""Check every budgeted route's SQL statements and ORM rows against its query budget.
+
+These tests use CTFd's own test helpers, so run them from the root of a CTFd checkout with the
+plugin installed as `CTFd/plugins/llm_verification`:
+
+    python -m pytest CTFd/plugins/llm_verification/tests
+
+The LLM Router is stubbed with a canned completion, so `/generate` stores real turns.
+"""
+# Standard library imports.
+import datetime
+from itertools import cycle
+from uuid import uuid4
+
+# Third-party imports.
+import pytest
+
+# CTFd imports.
+from CTFd.models import Users, db
+from tests.helpers import create_ctfd, destroy_ctfd, gen_user
+
+# LLM Verification Plugin module imports.
+from CTFd.plugins.llm_verification.llmv_models import (
+    LLMVChatPair,
+    LLMVGeneration,
+    LlmChallenge,
+    LlmModels,
+)
+from CTFd.plugins.llm_verification.llmv_query_budget import check_route_budgets
+from CTFd.plugins.llm_verification.remote_llm import Completion
+
+# Statuses given to the seeded generations, in turn.
+STATUSES = ("unsubmitted", "pending", "pending", "correct", "incorrect")
+# Routes whose status doesn't matter here, e.g. readiness without a router.
+IGNORED_STATUS_VIEWS = {"ready"}
+
+
+@pytest.fixture
+def app():
+    app = create_ctfd(enable_plugins=True)
+    yield app
+    destroy_ctfd(app)
+
+
+@pytest.fixture
+def router(monkeypatch):
+    """Stub the LLM Router, recording the idempotency UUID of every call."""
+    calls = []
+
+    def generate_text(idempotency_uuid, preprompt, prompt, model, history=None):
+        calls.append(idempotency_uuid)
+        return Completion(
+            text="I can't tell you the secret.", prompt_tokens=12, generation_tokens=7
+        )
+
+    monkeypatch.setattr(
+        "CTFd.plugins.llm_verification.llmv_routes.generate_text", generate_text
+    )
+    return calls
+
+
+def seed(users=5, turns=3):
+    """Add an LLM challenge, three models, and generations with turns for some players.
+
+    The players only have generations for two of the models, so they can still start a
+    conversation with the third.
+
+    Returns:
+        tuple (Users, int, int): The last player, the challenge's ID and the last
+            generation's ID.
+    """
+    models = [
+        LlmModels(model="mock-a", anon_name="Anu"),
+        LlmModels(model="mock-b", anon_name="Enki"),
+        LlmModels(model="mock-c", anon_name="Nabu"),
+    ]
+    challenge = LlmChallenge(
+        name="Query budgets",
+        description="Get the model to say the secret.",
+        category="pre-prompt extraction",
+        value=100,
+        state="visible",
+        type="llm_verification",
+        preprompt="The secret is hunter2. ",
+    )
+    db.session.add_all(models + [challenge])
+    db.session.commit()
+
+    statuses = cycle(STATUSES)
+    now = datetime.datetime.utcnow()
+    player = generation = None
+    for index in range(users):
+        player = gen_user(db, name=f"player{index}", email=f"player{index}@examplectf.com")
+        for model in models[:2]:
+            status = next(statuses)
+            generation = LLMVGeneration(
+                user_id=player.id,
+                challenge_id=challenge.id,
+                model_id=model.id,
+                status=status,
+                submitted_date=None if status == "unsubmitted" else now,
+            )
+            db.session.add(generation)
+            db.session.flush()
+            db.session.add_all(
+                LLMVChatPair(
+                    generation_id=generation.id,
+                    uuid=str(uuid4()),
+                    prompt=f"What is the secret? Attempt {turn}",
+                    generation="I can't tell you the secret.",
+                )
+                for turn in range(turns)
+            )
+    db.session.commit()
+    return player, challenge.id, generation.id
+
+
+def check(app, **seed_args):
+    with app.app_context():
+        player, challenge_id, generation_id = seed(**seed_args)
+        admin = Users.query.filter_by(type="admin").first()
+        return check_route_budgets(
+            app, admin, player, challenge_id, generation_id=generation_id, generate=True
+        )
+
+
+def test_routes_within_query_budgets(app, router):
+    results = check(app, users=20)
+    assert results
+    # `/generate` reached the (stubbed) router, so it stored a turn.
+    assert len(router) == 1
+    failures = [
+        f"{result['view']}: {result['problem']}" for result in results if result["problem"]
+    ]
+    assert not failures, "\n".join(failures)
+    errors = [
+        f"{result['view']}: status {result['status']}"
+        for result in results
+        if result["status"] >= 400 and result["view"] not in IGNORED_STATUS_VIEWS
+    ]
+    assert not errors, "\n".join(errors)
+
+
+def test_statements_do_not_grow_with_data(router):
+    statements = []
+    for users in (2, 20):
+        app = create_ctfd(enable_plugins=True)
+        try:
+            results = check(app, users=users)
+        finally:
+            destroy_ctfd(app)
+        statements.append({result["view"]: result["statements"] for result in results})
+    small, large = statements
+    grown = [
+        f"{view}: {small[view]} -> {large[view]} statements"
+        for view in small
+        if large[view] > small[view]
+    ]
+    assert not grown, "\n".join(grown)
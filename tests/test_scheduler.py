@@ -0,0 +1,134 @@
+"""Unit tests for the model assignment strategies and router load tracking.
+
+`llmv_scheduler` has no CTFd or plugin imports, so it's loaded straight from its file and these
+tests run without CTFd. Outside a CTFd checkout, run them from this directory so pytest doesn't
+import the plugin package:
+
+    cd tests && python -m pytest test_scheduler.py
+"""
+# Standard library imports.
+import importlib.util
+from pathlib import Path
+import random
+
+# Third-party imports.
+import pytest
+
+_spec = importlib.util.spec_from_file_location(
+    "llmv_scheduler", Path(__file__).resolve().parent.parent / "llmv_scheduler.py"
+)
+scheduler = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(scheduler)
+
+ModelLoad = scheduler.ModelLoad
+
+MODELS = ["model-a", "model-b", "model-c"]
+
+
+class FirstChoice:
+    """Stand-in for `random` that always picks the first option."""
+
+    def __init__(self):
+        self.choices = []
+
+    def choice(self, options):
+        self.choices.append(list(options))
+        return options[0]
+
+
+class LastChoice(FirstChoice):
+    def choice(self, options):
+        self.choices.append(list(options))
+        return options[-1]
+
+
+def test_least_outstanding_picks_fewest_in_flight():
+    loads = {
+        "model-a": ModelLoad(in_flight=3),
+        "model-b": ModelLoad(in_flight=1),
+        "model-c": ModelLoad(in_flight=2),
+    }
+    strategy = scheduler.LeastOutstandingStrategy()
+    assert strategy.choose(MODELS, loads, rng=FirstChoice()) == "model-b"
+
+
+def test_least_outstanding_breaks_ties_with_rng():
+    # model-c hasn't been called yet, so it has nothing in flight either.
+    loads = {"model-a": ModelLoad(in_flight=0), "model-b": ModelLoad(in_flight=2)}
+    strategy = scheduler.LeastOutstandingStrategy()
+    first, last = FirstChoice(), LastChoice()
+    assert strategy.choose(MODELS, loads, rng=first) == "model-a"
+    assert strategy.choose(MODELS, loads, rng=last) == "model-c"
+    assert first.choices == [["model-a", "model-c"]]
+
+
+def test_weighted_favours_low_latency():
+    strategy = scheduler.WeightedStrategy()
+    fast = ModelLoad(latency=0.2, requests=10)
+    slow = ModelLoad(latency=2.0, requests=10)
+    assert strategy.weight(fast) > strategy.weight(slow)
+    picks = [
+        strategy.choose(["fast", "slow"], {"fast": fast, "slow": slow}, rng=random.Random(seed))
+        for seed in range(200)
+    ]
+    assert picks.count("fast") > picks.count("slow")
+
+
+def test_weighted_favours_low_error_rate():
+    strategy = scheduler.WeightedStrategy()
+    reliable = ModelLoad(latency=1.0, error_rate=0.0, requests=10)
+    failing = ModelLoad(latency=1.0, error_rate=0.8, requests=10)
+    assert strategy.weight(reliable) > strategy.weight(failing)
+    picks = [
+        strategy.choose(
+            ["reliable", "failing"],
+            {"reliable": reliable, "failing": failing},
+            rng=random.Random(seed),
+        )
+        for seed in range(200)
+    ]
+    assert picks.count("reliable") > picks.count("failing")
+
+
+@pytest.mark.parametrize("name", sorted(scheduler.ASSIGNMENT_STRATEGIES))
+def test_only_eligible_models_are_returned(name):
+    strategy = scheduler.get_strategy(name)
+    # The idlest, fastest model isn't eligible for this user.
+    loads = {
+        "model-a": ModelLoad(in_flight=5, latency=3.0, requests=10),
+        "model-b": ModelLoad(in_flight=4, latency=2.0, error_rate=0.5, requests=10),
+        "ineligible": ModelLoad(in_flight=0, latency=0.1, requests=10),
+    }
+    rng = random.Random(0)
+    for _ in range(100):
+        assert strategy.choose(["model-a", "model-b"], loads, rng=rng) in {
+            "model-a",
+            "model-b",
+        }
+
+
+def test_track_decrements_in_flight_when_the_call_raises():
+    stats = scheduler.RouterStats()
+    with pytest.raises(RuntimeError):
+        with stats.track("model-a"):
+            assert stats.snapshot()["model-a"].in_flight == 1
+            raise RuntimeError("router error")
+    load = stats.snapshot()["model-a"]
+    assert load.in_flight == 0
+    assert load.requests == 1
+    assert load.error_rate > 0
+
+
+def test_track_records_successful_calls():
+    stats = scheduler.RouterStats()
+    with stats.track("model-a"):
+        pass
+    load = stats.snapshot()["model-a"]
+    assert load.in_flight == 0
+    assert load.requests == 1
+    assert load.error_rate == 0
+
+
+def test_unknown_strategy_falls_back_to_default():
+    strategy = scheduler.get_strategy("no-such-strategy")
+    assert strategy.name == scheduler.DEFAULT_STRATEGY